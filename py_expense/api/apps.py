@@ -15,7 +15,14 @@
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        # Connect the signal receivers
+        from . import events, multiget, summary  # noqa: F401
+        from .search import install_search
+        post_migrate.connect(install_search, sender=self)
@@ -0,0 +1,191 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Archival of resolved expenses.
+
+Resolved expenses that have not been updated for a while are moved, with
+their ratios and participants, from ``Expense``/``ExpenseRatio``/
+``ExpenseParticipant`` to the ``Archived`` models, keeping their IDs, and
+added to the running totals in ``ArchiveSummary``. Share totals read the
+summaries instead of the archive, and exports read both tables.
+
+Expenses are moved in batches, each in its own transaction, so an archival
+that is interrupted leaves every expense either live or archived, and
+running it again carries on where it stopped.
+
+Archived expenses are read only and are not in the change feed or search,
+archival is not a deletion so no tombstones are recorded.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import chain
+from typing import Callable, Dict, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core import MONEY
+from .models import (ArchivedExpense, ArchivedExpenseParticipant, ArchivedExpenseRatio,
+                     ArchiveSummary, Expense, ExpenseParticipant, ExpenseRatio, equal_ratios,
+                     touch_shares)
+
+# Resolved expenses not updated for this many days are archived
+ARCHIVE_AFTER_DAYS = 90
+
+BATCH_SIZE = 1000
+
+_EXPENSE_FIELDS = ('id', 'created_at', 'updated_at', 'description', 'share_id',
+                   'total', 'paid_by_id', 'resolved', 'split')
+
+_QUANTUM = Decimal(1).scaleb(-MONEY['decimal_places'])
+
+
+def cutoff(days: int = ARCHIVE_AFTER_DAYS) -> datetime:
+    """The ``updated_at`` before which resolved expenses are archived."""
+    return timezone.now() - timedelta(days=days)
+
+
+def archivable(before: datetime):
+    """The expenses to archive, resolved and not updated since ``before``"""
+    return Expense.objects.filter(resolved=True, updated_at__lt=before)
+
+
+def _summarize(expenses: list, ratios: list,
+               participants: list) -> Dict[Tuple[int, int], list]:
+    # (share id, user id) -> [expenses, paid, owed]
+    totals = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    by_id = {}
+    for expense in expenses:
+        by_id[expense['id']] = expense
+        row = totals[expense['share_id'], expense['paid_by_id']]
+        row[0] += 1
+        row[1] += expense['total']
+    # Equal splits have participants instead of ratio rows
+    by_expense = defaultdict(list)
+    for expense_id, user_id in participants:
+        by_expense[expense_id].append(user_id)
+    equal = [(expense_id, user_id, top, bot) for expense_id, user_ids in by_expense.items()
+             for user_id, (top, bot) in equal_ratios(user_ids).items()]
+    for expense_id, user_id, top, bot in chain(ratios, equal):
+        expense = by_id[expense_id]
+        totals[expense['share_id'], user_id][2] += expense['total'] * top / bot
+    return totals
+
+
+def _add_to_summaries(totals: Dict[Tuple[int, int], list]):
+    # Create the missing summaries empty first, one created meanwhile by a
+    # concurrent archival is left as is instead of breaking (share, user)
+    # uniqueness, then add to every summary in place, in key order so
+    # concurrent archivals lock them in the same order.
+    ArchiveSummary.objects.bulk_create(
+        (ArchiveSummary(share_id=share_id, user_id=user_id) for share_id, user_id in totals),
+        ignore_conflicts=True)
+    for (share_id, user_id), (count, paid, owed) in sorted(totals.items()):
+        ArchiveSummary.objects.filter(share_id=share_id, user_id=user_id).update(
+            expenses=F('expenses') + count, paid=F('paid') + paid,
+            owed=F('owed') + owed.quantize(_QUANTUM))
+
+
+def archive_batch(before: datetime, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Archive one batch of expenses, the ones with the lowest IDs first.
+
+    :param before: Archive resolved expenses not updated since this time.
+    :param batch_size: The maximum number of expenses to archive.
+    :return: The number of expenses archived, 0 once there are none left.
+    """
+    with transaction.atomic():
+        expenses = list(archivable(before).select_for_update()
+                        .order_by('id').values(*_EXPENSE_FIELDS)[:batch_size])
+        if not expenses:
+            return 0
+        ids = [e['id'] for e in expenses]
+        ratios = list(ExpenseRatio.objects.filter(expense_id__in=ids).order_by('id')
+                      .values_list('expense_id', 'user_id', 'numerator', 'denominator'))
+        participants = list(ExpenseParticipant.objects.filter(expense_id__in=ids)
+                            .values_list('expense_id', 'user_id'))
+        now = timezone.now()
+        ArchivedExpense.objects.bulk_create(
+            ArchivedExpense(archived_at=now, **e) for e in expenses)
+        ArchivedExpenseRatio.objects.bulk_create(
+            ArchivedExpenseRatio(expense_id=expense_id, user_id=user_id,
+                                 numerator=top, denominator=bot)
+            for expense_id, user_id, top, bot in ratios)
+        ArchivedExpenseParticipant.objects.bulk_create(
+            ArchivedExpenseParticipant(expense_id=expense_id, user_id=user_id)
+            for expense_id, user_id in participants)
+        _add_to_summaries(_summarize(expenses, ratios, participants))
+        # Deleting through the ORM would send ``post_delete`` and record
+        # tombstones, archived expenses still exist so delete the rows directly.
+        ratio_rows = ExpenseRatio.objects.filter(expense_id__in=ids)
+        ratio_rows._raw_delete(ratio_rows.db)
+        participant_rows = ExpenseParticipant.objects.filter(expense_id__in=ids)
+        participant_rows._raw_delete(participant_rows.db)
+        expense_rows = Expense.objects.filter(id__in=ids)
+        expense_rows._raw_delete(expense_rows.db)
+        # Shares only list their live expenses
+        touch_shares({e['share_id'] for e in expenses})
+        return len(ids)
+
+
+def archive_expenses(before: Optional[datetime] = None, *, batch_size: int = BATCH_SIZE,
+                     max_batches: Optional[int] = None,
+                     on_batch: Callable[[int], None] = None) -> int:
+    """
+    Archive resolved expenses in batches.
+
+    :param before: Archive resolved expenses not updated since this time,
+                   defaults to ``ARCHIVE_AFTER_DAYS`` ago.
+    :param batch_size: The number of expenses archived per transaction.
+    :param max_batches: Stop after this many batches.
+    :param on_batch: Called with the running count after each batch.
+    :return: The number of expenses archived.
+    """
+    before = cutoff() if before is None else before
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(before, batch_size)
+        if not count:
+            break
+        archived += count
+        batches += 1
+        if on_batch is not None:
+            on_batch(archived)
+    return archived
+
+
+def archived_total():
+    """
+    An expression for the total of the archived expenses of a share, to
+    annotate a ``Share`` QuerySet with.
+    """
+    paid = (ArchiveSummary.objects.filter(share_id=OuterRef('pk'))
+            .values('share_id').annotate(paid=Sum('paid')).values('paid'))
+    return Coalesce(Subquery(paid), Value(0), output_field=DecimalField(**MONEY))
+
+
+def share_total():
+    """
+    An expression for the total of all the expenses of a share, archived or
+    not, to annotate a ``Share`` QuerySet with.
+    """
+    live = Coalesce(Sum('expense__total'), Value(0), output_field=DecimalField(**MONEY))
+    return live + archived_total()
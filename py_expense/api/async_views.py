@@ -0,0 +1,195 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Async versions of the views in ``api.views``, used when served over ASGI.
+
+Request parsing and responses happen on the event loop, lookups go through
+the async ORM interface, and serializer work is handed to ``sync_to_async``.
+"""
+
+from typing import AsyncIterator, Iterator
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+
+from api.changes import changes_since
+from api.events import share_channel
+from api.models import Share
+from api.readers import ShareReader
+from api.views import (CHANGES_SPEC, MAX_CHANGES, MERGE_SPEC, OBJECTS_SPEC, RESOLVE_SPEC,
+                       SEARCH_SPEC, SHARE_LIST_SPEC, SHARE_LOOKUP_SPEC, EXPORT_SPEC, BadRequest,
+                       create_share, event_stream_response, export_response, json_body,
+                       merge_result, objects_result, resolve_result, run_batch, search_result,
+                       share_lookup_error, share_queryset, summary_result, update_share)
+from core import FastJsonResponse, cache_stats, get_broker, method, sse_event, uri_params
+
+
+@method(allowed='GET')
+@uri_params(spec=SHARE_LIST_SPEC, method='GET')
+async def share_list(request, *, params):
+    """Async version of ``api.views.share_list``"""
+    shares, fields = share_queryset(params)
+    data = await sync_to_async(ShareReader(fields).serialize)(shares)
+    return FastJsonResponse(data)
+
+
+@csrf_exempt
+@method(allowed='POST')
+async def share_create(request):
+    """Async version of ``api.views.share_create``"""
+    try:
+        data = json_body(request)
+    except BadRequest as e:
+        return FastJsonResponse({'success': False, 'reason': str(e)}, status=400)
+    body, status = await sync_to_async(create_share)(data)
+    return FastJsonResponse(body, status=status)
+
+
+@csrf_exempt
+@method(allowed='POST')
+@uri_params(spec=SHARE_LOOKUP_SPEC, method='GET')
+async def share_update(request, *, params):
+    """Async version of ``api.views.share_update``"""
+    try:
+        data = json_body(request)
+    except BadRequest as e:
+        return FastJsonResponse({'success': False, 'reason': str(e)}, status=400)
+    share = await Share.objects.filter(**params).afirst() if params else None
+    body, status = await sync_to_async(update_share)(share, params, data)
+    return FastJsonResponse(body, status=status)
+
+
+async def share_event_stream(share_id: int) -> AsyncIterator[bytes]:
+    """Async version of ``api.views.share_event_stream``"""
+    subscription = get_broker().subscribe(share_channel(share_id), asynchronous=True)
+    async with subscription:
+        yield b': connected\n\n'
+        while True:
+            message = await subscription.get(settings.SSE_HEARTBEAT)
+            if message is None:
+                yield b': keepalive\n\n'
+            else:
+                yield sse_event(message['data'], message['event'])
+
+
+@method(allowed='GET')
+@uri_params(spec=SHARE_LOOKUP_SPEC, method='GET')
+async def share_events(request, *, params):
+    """
+    Async version of ``api.views.share_events``, waiting for events does not
+    block a thread.
+    """
+    share_id = None
+    if params:
+        share_id = await Share.objects.filter(**params).values_list('id', flat=True).afirst()
+    error = share_lookup_error(params, share_id is not None)
+    if error is not None:
+        body, status = error
+        return FastJsonResponse(body, status=status)
+    return event_stream_response(share_event_stream(share_id))
+
+
+@method(allowed='GET')
+@uri_params(spec=SHARE_LOOKUP_SPEC, method='GET')
+async def share_summary_view(request, *, params):
+    """Async version of ``api.views.share_summary_view``"""
+    body, status = await sync_to_async(summary_result)(params)
+    return FastJsonResponse(body, status=status)
+
+
+@method(allowed='GET')
+@uri_params(spec=CHANGES_SPEC, method='GET')
+async def changes(request, *, params):
+    """Async version of ``api.views.changes``"""
+    limit = min(params.get('limit', MAX_CHANGES), MAX_CHANGES)
+    data = await sync_to_async(changes_since)(params.get('cursor'), limit)
+    return FastJsonResponse(data)
+
+
+@method(allowed='GET')
+@uri_params(spec=SEARCH_SPEC, method='GET')
+async def search_view(request, *, params):
+    """Async version of ``api.views.search_view``"""
+    body, status = await sync_to_async(search_result)(params)
+    return FastJsonResponse(body, status=status)
+
+
+async def iterate_in_thread(iterator: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Iterate a sync iterator that uses the database one item at a time, in
+    the thread that runs sync code. A sync iterator would be read whole
+    into memory before an async response is sent.
+    """
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+@method(allowed='GET')
+@uri_params(spec=EXPORT_SPEC, method='GET')
+async def expense_export(request, *, params):
+    """Async version of ``api.views.expense_export``"""
+    return export_response(params, iterate_in_thread)
+
+
+@csrf_exempt
+@method(allowed='POST')
+@uri_params(spec=RESOLVE_SPEC, method='GET')
+async def expense_resolve(request, *, params):
+    """Async version of ``api.views.expense_resolve``"""
+    body, status = await sync_to_async(resolve_result)(params)
+    return FastJsonResponse(body, status=status)
+
+
+@csrf_exempt
+@method(allowed='POST')
+async def batch(request):
+    """Async version of ``api.views.batch``"""
+    try:
+        data = json_body(request)
+    except BadRequest as e:
+        return FastJsonResponse({'success': False, 'reason': str(e)}, status=400)
+    body, status = await sync_to_async(run_batch)(data)
+    return FastJsonResponse(body, status=status)
+
+
+@csrf_exempt
+@method(allowed='POST')
+@uri_params(spec=MERGE_SPEC, method='GET')
+async def user_merge(request, *, params):
+    """Async version of ``api.views.user_merge``"""
+    body, status = await sync_to_async(merge_result)(params, request.api_user)
+    return FastJsonResponse(body, status=status)
+
+
+@method(allowed='GET')
+@uri_params(spec=OBJECTS_SPEC, method='GET')
+async def objects(request, *, params):
+    """Async version of ``api.views.objects``"""
+    body, status = await sync_to_async(objects_result)(params)
+    return FastJsonResponse(body, status=status)
+
+
+@method(allowed='GET')
+async def status_caches(request):
+    """Async version of ``api.views.status_caches``"""
+    return FastJsonResponse(cache_stats())
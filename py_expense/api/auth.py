@@ -0,0 +1,109 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Token authentication for the API.
+
+Token -> user lookups go through an in process ``TTLCache``, so an
+authenticated request only hits the database on a cache miss. Revoking a
+token invalidates it in this process right away, and in other worker
+processes once their entry expires after ``TOKEN_CACHE_TTL`` seconds.
+"""
+
+from typing import Optional
+
+from django.conf import settings
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils.deprecation import MiddlewareMixin
+
+from core import FastJsonResponse, RateLimitMiddleware, TTLCache
+from .models import Token, User
+
+token_cache = TTLCache('tokens', settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+def authenticate(key: str) -> Optional[User]:
+    """
+    Find the user of a token.
+
+    :param key: The token key.
+    :return: The ``User``, or None if the token does not exist.
+    """
+
+    def load():
+        token = Token.objects.select_related('user').filter(pk=key).first()
+        return token and token.user
+
+    return token_cache.get_or_load(key, load)
+
+
+def request_user(request) -> Optional[User]:
+    """
+    Find the user of the token in a request's ``Authorization`` header. The
+    result is kept on the request, so the token is only looked up once per
+    request.
+
+    :param request: The request.
+    :return: The ``User``, or None if the token is missing or does not exist.
+    """
+    try:
+        return request._token_user
+    except AttributeError:
+        pass
+    scheme, _, key = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    key = key.strip()
+    request._token_user = authenticate(key) if scheme == 'Token' and key else None
+    return request._token_user
+
+
+@receiver(post_delete, sender=Token)
+def _invalidate_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+class TokenAuthenticationMiddleware(MiddlewareMixin):
+    """
+    Authenticate requests with an ``Authorization: Token <key>`` header.
+
+    The user is set as ``request.api_user``, requests without a valid token
+    get a 401 response.
+    """
+
+    def process_request(self, request):
+        user = request_user(request)
+        if user is None:
+            response = FastJsonResponse(
+                {'success': False, 'reason': 'Invalid or missing token.'}, status=401
+            )
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        request.api_user = user
+
+
+class TokenRateLimitMiddleware(RateLimitMiddleware):
+    """
+    Rate limit requests per user if they send a valid token, else per IP
+    address. Requests with a made up token share the limit of their address.
+    """
+
+    @staticmethod
+    def client_key(request) -> str:
+        user = request_user(request)
+        if user is not None:
+            return f'user:{user.pk}'
+        return RateLimitMiddleware.client_key(request)
@@ -0,0 +1,139 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Change feed for incremental client sync.
+
+Changes are every Share and Expense by ``updated_at`` and every Tombstone by
+``deleted_at``, ordered by (time, kind, id). A cursor is the position of the
+last change a client has seen in that order, so changes sharing the same
+time, e.g. from one bulk update, are never skipped or repeated across pages.
+
+Expense ratios are included in their expense, changing the ratios of an
+expense updates the expense. Shares include their expenses and total, so
+adding, moving or deleting an expense, or changing its total, updates its
+share, see ``api.models.touch_shares``.
+
+``updated_at`` is set before its transaction commits, so a change can
+become visible after changes with a later time were served. Only changes
+older than ``CHANGES_SAFETY_LAG`` seconds are served, and the cursor stays
+behind that point, so a transaction that commits within the lag is never
+skipped. Bulk operations that can take longer, ``import_expenses`` and
+``merge_users``, stamp their rows again right before they commit, others
+commit in short batches.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import Q
+
+from core.decorators import func_name
+from .models import Expense, Share, Tombstone
+from .readers import ExpenseReader, ShareReader
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+# The manager and time field of each kind of change, in change order
+_SOURCES = (
+    (Share.objects, 'updated_at'),
+    (Expense.objects, 'updated_at'),
+    (Tombstone.objects, 'deleted_at'),
+)
+
+
+class Cursor(NamedTuple):
+    """The position of a change in the feed."""
+    time: datetime
+    kind: int
+    id: int
+
+    def __str__(self):
+        return f'{(self.time - _EPOCH) // _MICROSECOND}.{self.kind}.{self.id}'
+
+
+@func_name('Cursor')
+def cursor(s: str) -> Cursor:
+    """
+    Parse a cursor returned by ``changes_since``
+
+    :param s: The cursor string.
+    :return: The parsed cursor.
+    :raises ValueError: If the string is not a cursor.
+    """
+    micros, kind, id_ = s.split('.')
+    if not all(x.isdigit() for x in (micros, kind, id_)) or int(kind) >= len(_SOURCES):
+        raise ValueError('Not a cursor.')
+    try:
+        time = _EPOCH + int(micros) * _MICROSECOND
+    except OverflowError as e:
+        raise ValueError(str(e))
+    return Cursor(time, int(kind), int(id_))
+
+
+def _after(position: Optional[Cursor], kind: int, field: str) -> Q:
+    """Filter for the changes of one kind after a cursor."""
+    if position is None:
+        return Q()
+    time, cursor_kind, id_ = position
+    q = Q(**{f'{field}__gt': time})
+    if kind > cursor_kind:
+        q |= Q(**{field: time})
+    elif kind == cursor_kind:
+        q |= Q(**{field: time, 'id__gt': id_})
+    return q
+
+
+def changes_since(position: Optional[Cursor], limit: int) -> Dict[str, Any]:
+    """
+    Get up to ``limit`` changes after a cursor, older than
+    ``CHANGES_SAFETY_LAG`` seconds.
+
+    :param position: The cursor, None to start from the beginning.
+    :param limit: The maximum number of changes.
+    :return: A dict of the changed shares, changed expenses, deleted objects,
+             the cursor of the last change and whether there are more changes.
+    """
+    before = datetime.now(timezone.utc) - timedelta(seconds=settings.CHANGES_SAFETY_LAG)
+    keys: List[Cursor] = []
+    for kind, (manager, field) in enumerate(_SOURCES):
+        rows = (manager.filter(_after(position, kind, field), **{f'{field}__lt': before})
+                .order_by(field, 'id').values_list(field, 'id')[:limit + 1])
+        keys.extend(Cursor(time, kind, id_) for time, id_ in rows)
+    keys.sort()
+    page = keys[:limit]
+    ids = [[] for _ in _SOURCES]
+    for key in page:
+        ids[key.kind].append(key.id)
+    share_ids, expense_ids, tombstone_ids = ids
+    last = page[-1] if page else position
+    return {
+        'shares': ShareReader().serialize(
+            Share.objects.filter(id__in=share_ids).order_by('updated_at', 'id')
+        ) if share_ids else [],
+        'expenses': ExpenseReader().serialize(
+            Expense.objects.filter(id__in=expense_ids).order_by('updated_at', 'id')
+        ) if expense_ids else [],
+        'deleted': [
+            {'type': kind, 'id': object_id} for kind, object_id in
+            Tombstone.objects.filter(id__in=tombstone_ids)
+            .order_by('deleted_at', 'id').values_list('kind', 'object_id')
+        ] if tombstone_ids else [],
+        'cursor': None if last is None else str(last),
+        'has_more': len(keys) > limit,
+    }
@@ -0,0 +1,133 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Deletion of shares with large expense histories.
+
+Deleting a ``Share`` through the ORM collects every expense and ratio of
+the share into memory to cascade to them. Instead, ``delete_share`` deletes
+the expenses in batches of IDs, each in its own transaction: the ratios and
+participants of a batch, then the expenses, found through their ``share``
+index. The archived expenses and summaries follow, and the share itself is
+deleted last, through the ORM, once nothing refers to it.
+
+Memory use is bounded by the batch size. A deletion that is interrupted
+leaves the share with fewer expenses, every deleted expense has its
+tombstone, and running it again carries on where it stopped.
+"""
+
+from typing import Callable, Optional
+
+from django.db import transaction
+
+from .models import (ArchivedExpense, ArchivedExpenseParticipant, ArchivedExpenseRatio,
+                     ArchiveSummary, Expense, ExpenseParticipant, ExpenseRatio, Share, Tombstone,
+                     touch_shares)
+from .multiget import invalidate
+from .summary import invalidate_summaries
+
+BATCH_SIZE = 1000
+
+
+def _raw_delete(queryset):
+    # Deleting through the ORM would collect the rows and send
+    # ``post_delete`` for each of them
+    queryset._raw_delete(queryset.db)
+
+
+def delete_batch(share_id: int, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Delete one batch of the expenses of a share, with their ratios, the
+    ones with the lowest IDs first.
+
+    :param share_id: ID of the share.
+    :param batch_size: The maximum number of expenses to delete.
+    :return: The number of expenses deleted, 0 once there are none left.
+    """
+    with transaction.atomic():
+        rows = list(Expense.objects.filter(share_id=share_id).select_for_update()
+                    .order_by('id').values_list('id', 'paid_by_id')[:batch_size])
+        if not rows:
+            return 0
+        ids = [pk for pk, _ in rows]
+        ratios = ExpenseRatio.objects.filter(expense_id__in=ids)
+        participants = ExpenseParticipant.objects.filter(expense_id__in=ids)
+        users = {paid_by for _, paid_by in rows}
+        users.update(ratios.values_list('user_id', flat=True)
+                     .union(participants.values_list('user_id', flat=True)))
+        _raw_delete(ratios)
+        _raw_delete(participants)
+        _raw_delete(Expense.objects.filter(id__in=ids))
+        Tombstone.objects.bulk_create(Tombstone(kind='expense', object_id=pk) for pk in ids)
+        # Until the share is deleted it lists fewer expenses
+        touch_shares((share_id,))
+        # Users list the expenses they paid and their ratios
+        invalidate('expenses', ids)
+        invalidate('users', users)
+        invalidate_summaries((share_id,))
+        return len(ids)
+
+
+def delete_archived_batch(share_id: int, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Delete one batch of the archived expenses of a share, with their ratios.
+    Archived expenses are not in the change feed, so no tombstones are
+    recorded.
+
+    :return: The number of archived expenses deleted, 0 once there are none left.
+    """
+    with transaction.atomic():
+        ids = list(ArchivedExpense.objects.filter(share_id=share_id).select_for_update()
+                   .order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        _raw_delete(ArchivedExpenseRatio.objects.filter(expense_id__in=ids))
+        _raw_delete(ArchivedExpenseParticipant.objects.filter(expense_id__in=ids))
+        _raw_delete(ArchivedExpense.objects.filter(id__in=ids))
+        return len(ids)
+
+
+def delete_share(share_id: int, *, batch_size: int = BATCH_SIZE,
+                 max_batches: Optional[int] = None,
+                 on_batch: Callable[[int], None] = None) -> int:
+    """
+    Delete a share and its expenses, archived or not, in batches.
+
+    :param share_id: ID of the share.
+    :param batch_size: The number of expenses deleted per transaction.
+    :param max_batches: Stop after this many batches, the share is only
+                        deleted if every batch ran.
+    :param on_batch: Called with the running count after each batch.
+    :return: The number of expenses deleted.
+    """
+    deleted = batches = 0
+    for delete in (delete_batch, delete_archived_batch):
+        while True:
+            if max_batches is not None and batches >= max_batches:
+                return deleted
+            count = delete(share_id, batch_size)
+            if not count:
+                break
+            deleted += count
+            batches += 1
+            if on_batch is not None:
+                on_batch(deleted)
+    with transaction.atomic():
+        _raw_delete(ArchiveSummary.objects.filter(share_id=share_id))
+        # Expenses added since the last batch are collected with the share
+        for share in Share.objects.filter(pk=share_id).select_for_update():
+            share.delete()
+    return deleted
@@ -0,0 +1,114 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Live share activity, published to the ``share.<id>`` channel of the broker.
+
+Each message is ``{'event': 'expense.<created|updated|resolved>', 'data': expense}``
+where ``expense`` is the same as an expense in the change feed. Messages are
+published once the write commits, and only built if something subscribes.
+
+An expense too large for the broker is published as only its ``id`` and
+``share``, for subscribers to fetch. Publishing happens after the write
+committed, so failures are logged instead of failing the request.
+"""
+
+import logging
+from collections import defaultdict
+from functools import partial, wraps
+from typing import List
+
+from django.db import transaction
+from django.dispatch import receiver
+
+from core import MessageTooLarge, get_broker
+from .models import Expense
+from .readers import ExpenseReader
+from .signals import expense_changed, expenses_changed
+
+
+logger = logging.getLogger(__name__)
+
+
+def share_channel(share_id: int) -> str:
+    """:return: The broker channel of a share's activity."""
+    return f'share.{share_id}'
+
+
+def publish_expense(event: str, share_id: int, expense_id: int):
+    """
+    Publish an expense event to its share's channel.
+
+    :param event: created, updated or resolved.
+    :param share_id: The ID of the share of the expense.
+    :param expense_id: The ID of the expense.
+    """
+    broker = get_broker()
+    channel = share_channel(share_id)
+    if not broker.has_subscribers(channel):
+        return
+    rows = ExpenseReader().serialize(Expense.objects.filter(pk=expense_id))
+    if rows:
+        _publish(broker, channel, event, rows[0])
+
+
+def publish_expenses(event: str, share_id: int, expense_ids: List[int]):
+    """
+    Publish an event for each of several expenses of a share, reading them
+    with one query.
+    """
+    broker = get_broker()
+    channel = share_channel(share_id)
+    if not broker.has_subscribers(channel):
+        return
+    for row in ExpenseReader().serialize(Expense.objects.filter(pk__in=expense_ids)
+                                         .order_by('id')):
+        _publish(broker, channel, event, row)
+
+
+def _publish(broker, channel: str, event: str, expense: dict):
+    event = f'expense.{event}'
+    try:
+        broker.publish(channel, {'event': event, 'data': expense})
+    except MessageTooLarge:
+        broker.publish(channel, {'event': event,
+                                 'data': {'id': expense['id'], 'share': expense['share']}})
+
+
+def _logged(publish):
+    # Runs once the write committed, a failure must not fail the request
+    @wraps(publish)
+    def wrapper(event, share_id, *args):
+        try:
+            publish(event, share_id, *args)
+        except Exception:
+            logger.exception('Could not publish expense.%s to share %s', event, share_id)
+    return wrapper
+
+
+@receiver(expense_changed)
+def _on_expense_changed(sender, instance, event, **kwargs):
+    share_id, expense_id = instance.share_id, instance.pk
+    transaction.on_commit(lambda: _logged(publish_expense)(event, share_id, expense_id))
+
+
+@receiver(expenses_changed)
+def _on_expenses_changed(sender, expenses, event, **kwargs):
+    by_share = defaultdict(list)
+    for expense_id, share_id in expenses:
+        by_share[share_id].append(expense_id)
+    for share_id, ids in by_share.items():
+        transaction.on_commit(partial(_logged(publish_expenses), event, share_id, ids))
@@ -0,0 +1,179 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Streaming export of expenses with their ratios.
+
+Expenses are read with a server side cursor, ``iterator(chunk_size)``, and
+the ratios and participants of each chunk with one query, then each chunk is
+encoded and yielded before the next one is read, so memory use does not grow
+with the number of rows.
+
+NDJSON lines are the same as expenses in the API. CSV has one row per
+expense, ``paid_for`` is encoded as ``user:numerator/denominator`` items
+separated by ``;`` and totals are exact decimals.
+
+Archived expenses, see ``api.archive``, are exported before live ones when
+an archive QuerySet is given.
+"""
+
+from collections import defaultdict
+from csv import writer
+from io import StringIO
+from itertools import chain, islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.db.models import Q, QuerySet
+
+from core import compile_lookups, dumps
+from .models import (ArchivedExpense, ArchivedExpenseParticipant, ArchivedExpenseRatio,
+                     Expense, ExpenseParticipant, ExpenseRatio, participates)
+from .readers import _split_rows, _timestamp
+from .search import scope
+
+CHUNK_SIZE = 2000
+
+COLUMNS = ('id', 'share', 'created_at', 'updated_at', 'description', 'total',
+           'paid_by', 'resolved', 'paid_for')
+
+_SELECT = ('id', 'share_id', 'created_at', 'updated_at', 'description', 'total',
+           'paid_by_id', 'resolved')
+
+# expense model -> its ratio and participant models
+_RATIOS = {
+    Expense: (ExpenseRatio, ExpenseParticipant),
+    ArchivedExpense: (ArchivedExpenseRatio, ArchivedExpenseParticipant),
+}
+
+# (expense row in ``_SELECT`` order, [(user id, numerator, denominator)])
+Batch = List[Tuple[tuple, List[Tuple[int, int, int]]]]
+
+
+def batches(queryset: QuerySet, chunk_size: int = CHUNK_SIZE) -> Iterator[Batch]:
+    """
+    Read the expenses of a QuerySet with their ratios, ordered by ID.
+
+    :param queryset: The expenses, live or archived.
+    :param chunk_size: The number of expenses per batch.
+    :return: An iterator of batches.
+    """
+    ratio_model, participant_model = _RATIOS[queryset.model]
+    rows = queryset.order_by('id').values_list(*_SELECT).iterator(chunk_size=chunk_size)
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            return
+        ids = [row[0] for row in batch]
+        ratios = defaultdict(list)
+        # Equal splits have a row per participant instead of ratio rows
+        for expense_id, *ratio in _split_rows(ratio_model.objects.filter(expense_id__in=ids),
+                                              participant_model.objects.filter(expense_id__in=ids)):
+            ratios[expense_id].append(ratio)
+        yield [(row, ratios[row[0]]) for row in batch]
+
+
+def csv_chunks(source: Iterator[Batch]) -> Iterator[bytes]:
+    """Encode batches as CSV, with a header."""
+    buffer = StringIO()
+    csv = writer(buffer)
+    csv.writerow(COLUMNS)
+    for batch in source:
+        for row, ratios in batch:
+            id_, share, created, updated, description, total, paid_by, resolved = row
+            csv.writerow((
+                id_, share, _timestamp(created), _timestamp(updated), description, total,
+                paid_by, int(resolved),
+                ';'.join(f'{user}:{top}/{bot}' for user, top, bot in ratios),
+            ))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Nothing to export, only the header is left
+        yield buffer.getvalue().encode()
+
+
+def _ndjson_line(row: tuple, ratios: List[Tuple[int, int, int]]) -> bytes:
+    id_, share, created, updated, description, total, paid_by, resolved = row
+    return dumps({
+        'id': id_, 'created_at': _timestamp(created), 'updated_at': _timestamp(updated),
+        'description': description, 'share': share, 'total': float(total),
+        'paid_by': paid_by, 'paid_for': {user: f'{top}/{bot}' for user, top, bot in ratios},
+        'resolved': resolved,
+    }) + b'\n'
+
+
+def ndjson_chunks(source: Iterator[Batch]) -> Iterator[bytes]:
+    """Encode batches as newline delimited JSON."""
+    for batch in source:
+        yield b''.join(_ndjson_line(row, ratios) for row, ratios in batch)
+
+
+# format -> (content type, encoder)
+FORMATS: Dict[str, Tuple[str, Callable[[Iterator[Batch]], Iterator[bytes]]]] = {
+    'csv': ('text/csv', csv_chunks),
+    'ndjson': ('application/x-ndjson', ndjson_chunks),
+}
+
+
+def _archived_scope(share_id: Optional[int], user_id: Optional[int]) -> QuerySet:
+    """Same as ``scope('expense', ...)`` for archived expenses."""
+    queryset = ArchivedExpense.objects.all()
+    if share_id is not None:
+        queryset = queryset.filter(share_id=share_id)
+    if user_id is not None:
+        paid_for = ArchivedExpenseRatio.objects.filter(user_id=user_id).values('expense_id')
+        queryset = queryset.filter(Q(paid_by_id=user_id) | Q(id__in=paid_for)
+                                   | participates([user_id], archived=True))
+    return queryset
+
+
+def export_queryset(params: Dict[str, Any], archived: bool = False) -> QuerySet:
+    """
+    Build the expenses to export from parsed parameters: ``share`` and/or
+    ``user`` IDs, and ``created_at``/``updated_at`` comparisons.
+
+    :param params: The parsed parameters.
+    :param archived: Build a QuerySet of archived expenses instead.
+    """
+    params = params.copy()
+    share_id, user_id = params.pop('share', None), params.pop('user', None)
+    if archived:
+        queryset = _archived_scope(share_id, user_id)
+    else:
+        queryset = scope('expense', share_id, user_id)
+    params.pop('format', None)
+    if params:
+        queryset = queryset.filter(**compile_lookups(params))
+    return queryset
+
+
+def export(queryset: QuerySet, fmt: str, chunk_size: int = CHUNK_SIZE,
+           archived: Optional[QuerySet] = None) -> Iterator[bytes]:
+    """
+    Stream the expenses of a QuerySet.
+
+    :param queryset: The expenses.
+    :param fmt: One of ``FORMATS``
+    :param chunk_size: The number of expenses read and encoded at a time.
+    :param archived: Archived expenses to stream first.
+    :return: An iterator of encoded chunks.
+    """
+    _, encode = FORMATS[fmt]
+    source = batches(queryset, chunk_size)
+    if archived is not None:
+        source = chain(batches(archived, chunk_size), source)
+    return encode(source)
@@ -0,0 +1,358 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Bulk import of expenses from CSV.
+
+Rows are validated in one streaming pass and written in batches, so memory
+use does not grow with the size of the file. Shares and users are looked up
+by name (or ID) in maps loaded once up front.
+
+The CSV header must have ``share``, ``description``, ``total``, ``paid_by``
+and ``paid_for`` columns, and may have ``created_at`` (unix epoch) and
+``resolved`` (true/false/1/0) columns. ``paid_for`` is ``user:ratio`` items
+separated by ``;``, e.g. ``alice:1/2;bob:1/2``. Other columns are ignored,
+so a CSV from ``export_expenses`` can be imported with ``key='id'``.
+
+Rows follow the same rules as the API: the payer and every user paid for
+must be in the share, and ratios must add up to 1. Like with the API, an
+expense whose ratios are all 1/N is split equally, with participant rows
+instead of ratio rows.
+"""
+
+from collections import defaultdict
+from csv import DictReader, writer
+from dataclasses import dataclass, field
+from io import StringIO
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.utils import timezone
+
+from core import boolean, epoch
+from .models import (EQUAL, RATIO, Expense, ExpenseParticipant, ExpenseRatio, Share, User,
+                     is_equal_split, touch_shares)
+from .validators import parse_ratio, ratios_sum_to_one
+
+REQUIRED_COLUMNS = ('share', 'description', 'total', 'paid_by', 'paid_for')
+
+BATCH_SIZE = 5000
+
+# (expense field values, [(user id, numerator, denominator)])
+Row = Tuple[Dict, List[Tuple[int, int, int]]]
+
+
+def _split_rows(batch: List[Row]) -> Tuple[List[tuple], List[tuple]]:
+    """
+    :return: (index in the batch, user ID, numerator, denominator) ratio rows
+             and (index in the batch, user ID) participant rows of a batch.
+    """
+    ratio_rows, participant_rows = [], []
+    for i, (fields, ratios) in enumerate(batch):
+        if fields.get('split', RATIO) == EQUAL:
+            participant_rows.extend((i, user_id) for user_id, _, _ in ratios)
+        else:
+            ratio_rows.extend((i, *ratio) for ratio in ratios)
+    return ratio_rows, participant_rows
+
+
+class RowError(ValueError):
+    """
+    Error raised when a CSV row cannot be imported.
+    """
+    pass
+
+
+class Resolver:
+    """
+    In memory maps of share and user keys to IDs, and of share memberships.
+
+    Names need not be unique. A user name is resolved among the members of
+    the share, a name shared by more than one candidate is an error, to
+    import those rows look shares and users up by ``id`` instead.
+
+    :param key: Look shares and users up by ``name`` or ``id``
+    """
+
+    def __init__(self, key: str = 'name'):
+        self.shares: Dict[str, List[int]] = _ids_by_key(Share, key)
+        self.users: Dict[str, List[int]] = _ids_by_key(User, key)
+        self.members: Set[Tuple[int, int]] = set(
+            Share.users.through.objects.values_list('share_id', 'user_id')
+        )
+
+    def share(self, key: str) -> int:
+        ids = self.shares.get(key)
+        if not ids:
+            raise RowError(f'Share {key!r} not found.')
+        if len(ids) > 1:
+            raise RowError(f'Share {key!r} is ambiguous, {len(ids)} shares have that name, '
+                           f'import by ID.')
+        return ids[0]
+
+    def member(self, share_id: int, key: str) -> int:
+        ids = self.users.get(key)
+        if not ids:
+            raise RowError(f'User {key!r} not found.')
+        ids = [pk for pk in ids if (share_id, pk) in self.members]
+        if not ids:
+            raise RowError(f'User {key!r} is not in the share.')
+        if len(ids) > 1:
+            raise RowError(f'User {key!r} is ambiguous, {len(ids)} members of the share have '
+                           f'that name, import by ID.')
+        return ids[0]
+
+
+def _ids_by_key(model, key: str) -> Dict[str, List[int]]:
+    ids = defaultdict(list)
+    for pk, k in model.objects.order_by('id').values_list('id', key):
+        ids[str(k)].append(pk)
+    return dict(ids)
+
+
+_description = Expense._meta.get_field('description')
+_total = Expense._meta.get_field('total')
+
+
+def _clean(model_field, value):
+    try:
+        return model_field.clean(value, None)
+    except ValidationError as e:
+        raise RowError(f"{model_field.name}: {' '.join(e.messages)}")
+
+
+def parse_row(row: Dict[str, str], resolver: Resolver) -> Row:
+    """
+    Validate a CSV row.
+
+    :param row: The row, as read by ``csv.DictReader``
+    :param resolver: Maps share and user keys to IDs.
+    :return: The expense fields and its ratios.
+    :raises RowError: If the row is not valid.
+    """
+    # ``DictReader`` fills the columns missing from a short row with None
+    missing = [column for column in REQUIRED_COLUMNS if row.get(column) is None]
+    if missing:
+        raise RowError(f"Missing fields: {', '.join(missing)}")
+    share_id = resolver.share(row['share'])
+    fields = {
+        'share_id': share_id,
+        'description': _clean(_description, row['description']),
+        'total': _clean(_total, row['total']),
+        'paid_by_id': resolver.member(share_id, row['paid_by']),
+    }
+    if row.get('created_at'):
+        try:
+            fields['created_at'] = epoch(row['created_at'])
+        except ValueError:
+            raise RowError('created_at must be a unix epoch.')
+    try:
+        fields['resolved'] = boolean(row['resolved']) if row.get('resolved') else False
+    except ValueError:
+        raise RowError('resolved must be true or false.')
+    ratios = []
+    seen = set()
+    for item in filter(None, row['paid_for'].split(';')):
+        user, sep, ratio = item.rpartition(':')
+        if not sep:
+            raise RowError("paid_for items must be 'user:numerator/denominator'")
+        user_id = resolver.member(share_id, user)
+        if user_id in seen:
+            raise RowError(f'User {user!r} is paid for twice.')
+        seen.add(user_id)
+        try:
+            ratios.append((user_id, *parse_ratio(ratio)))
+        except ValueError as e:
+            raise RowError(str(e))
+    if not ratios:
+        raise RowError('paid_for cannot be empty.')
+    if not ratios_sum_to_one((top, bot) for _, top, bot in ratios):
+        raise RowError('Ratio sum must be 1.')
+    if is_equal_split((top, bot) for _, top, bot in ratios):
+        fields['split'] = EQUAL
+    return fields, ratios
+
+
+class BulkCreateWriter:
+    """
+    Write batches with ``bulk_create``, which needs a database that returns
+    the IDs of bulk inserted rows, e.g. SQLite 3.35+ or PostgreSQL.
+    """
+
+    def write(self, batch: List[Row]):
+        expenses = Expense.objects.bulk_create(Expense(**fields) for fields, _ in batch)
+        ratio_rows, participant_rows = _split_rows(batch)
+        ExpenseRatio.objects.bulk_create(
+            ExpenseRatio(expense_id=expenses[i].id, user_id=user_id, numerator=top,
+                         denominator=bot)
+            for i, user_id, top, bot in ratio_rows
+        )
+        ExpenseParticipant.objects.bulk_create(
+            ExpenseParticipant(expense_id=expenses[i].id, user_id=user_id)
+            for i, user_id in participant_rows
+        )
+
+    def finish(self):
+        pass
+
+
+class PostgresCopyWriter:
+    """
+    Write batches with PostgreSQL ``COPY`` into temporary staging tables, then
+    move every row into the real tables with one ``INSERT`` each when done.
+
+    Expense IDs are taken from the ID sequence up front so ratios and
+    participants can refer to them. Must be used inside a transaction, the
+    staging tables are dropped on commit.
+    """
+    expense_columns = ('id', 'created_at', 'updated_at', 'description', 'share_id', 'total',
+                       'paid_by_id', 'resolved', 'split')
+    ratio_columns = ('expense_id', 'user_id', 'numerator', 'denominator')
+    participant_columns = ('expense_id', 'user_id')
+
+    def __init__(self):
+        self.expense_table = Expense._meta.db_table
+        self.ratio_table = ExpenseRatio._meta.db_table
+        self.participant_table = ExpenseParticipant._meta.db_table
+        with connection.cursor() as cursor:
+            for table in (self.expense_table, self.ratio_table, self.participant_table):
+                cursor.execute(f'CREATE TEMPORARY TABLE staging_{table} '
+                               f'(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP')
+
+    def _copy(self, cursor, table: str, columns: Iterable[str], rows: Iterable[tuple]):
+        buffer = StringIO()
+        writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY staging_{table} ({', '.join(columns)}) "
+                           f'FROM STDIN WITH (FORMAT csv)', buffer)
+
+    def write(self, batch: List[Row]):
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT nextval(pg_get_serial_sequence('{self.expense_table}', "
+                           f"'id')) FROM generate_series(1, %s)", [len(batch)])
+            ids = [pk for pk, in cursor.fetchall()]
+            self._copy(cursor, self.expense_table, self.expense_columns, (
+                (pk, fields.get('created_at', now), now, fields['description'],
+                 fields['share_id'], fields['total'], fields['paid_by_id'], fields['resolved'],
+                 fields.get('split', RATIO))
+                for pk, (fields, _) in zip(ids, batch)
+            ))
+            ratio_rows, participant_rows = _split_rows(batch)
+            self._copy(cursor, self.ratio_table, self.ratio_columns, (
+                (ids[i], *ratio) for i, *ratio in ratio_rows
+            ))
+            self._copy(cursor, self.participant_table, self.participant_columns, (
+                (ids[i], user_id) for i, user_id in participant_rows
+            ))
+
+    def finish(self):
+        with connection.cursor() as cursor:
+            for table, columns in ((self.expense_table, self.expense_columns),
+                                   (self.ratio_table, self.ratio_columns),
+                                   (self.participant_table, self.participant_columns)):
+                columns = ', '.join(columns)
+                cursor.execute(f'INSERT INTO {table} ({columns}) '
+                               f'SELECT {columns} FROM staging_{table}')
+
+
+def get_writer():
+    """:return: The fastest writer for the database."""
+    if connection.vendor == 'postgresql':
+        return PostgresCopyWriter()
+    return BulkCreateWriter()
+
+
+@dataclass
+class ImportStats:
+    """Progress of an import, ``errors`` are (line number, reason)"""
+    rows: int = 0
+    imported: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+    started: float = field(default_factory=perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the import started."""
+        return perf_counter() - self.started
+
+    @property
+    def rate(self) -> float:
+        """Rows per second."""
+        return self.rows / max(self.elapsed, 1e-9)
+
+
+def import_expenses(lines: Iterable[str], *, key: str = 'name', writer=None,
+                    batch_size: int = BATCH_SIZE, max_errors: Optional[int] = None,
+                    on_batch: Callable[[ImportStats], None] = None) -> ImportStats:
+    """
+    Import expenses from CSV, run it in a transaction to import all or nothing.
+
+    :param lines: The lines of the CSV, e.g. an open file.
+    :param key: Look shares and users up by ``name`` or ``id``
+    :param writer: Writes batches of valid rows, defaults to ``get_writer()``
+    :param batch_size: The number of rows written at a time.
+    :param max_errors: Stop once there are more errors than this.
+    :param on_batch: Called with the stats after each batch, for progress.
+    :return: The stats, with the line number and reason of each invalid row.
+    :raises RowError: If the header is missing required columns.
+    """
+    reader = DictReader(lines)
+    missing = set(REQUIRED_COLUMNS) - set(reader.fieldnames or ())
+    if missing:
+        raise RowError(f"Missing columns: {', '.join(sorted(missing))}")
+    resolver = Resolver(key)
+    writer = get_writer() if writer is None else writer
+    stats = ImportStats()
+    batch = []
+    share_ids = set()
+    started = timezone.now()
+
+    def flush():
+        if batch:
+            writer.write(batch)
+            share_ids.update(fields['share_id'] for fields, _ in batch)
+            stats.imported += len(batch)
+            batch.clear()
+        if on_batch is not None:
+            on_batch(stats)
+
+    for row in reader:
+        stats.rows += 1
+        try:
+            batch.append(parse_row(row, resolver))
+        except RowError as e:
+            stats.errors.append((reader.line_num, str(e)))
+            if max_errors is not None and len(stats.errors) > max_errors:
+                break
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    writer.finish()
+    _restamp(share_ids, started)
+    return stats
+
+
+def _restamp(share_ids: Set[int], started):
+    # The change feed only waits ``CHANGES_SAFETY_LAG`` for a transaction to
+    # commit, an import can take longer, so its rows are stamped again at
+    # the end. Writers don't send signals, shares list their expenses.
+    if share_ids:
+        Expense.objects.filter(share_id__in=share_ids, updated_at__gte=started).update(
+            updated_at=timezone.now())
+        touch_shares(share_ids)
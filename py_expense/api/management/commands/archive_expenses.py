@@ -0,0 +1,55 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Move old resolved expenses to the archive."""
+
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from api.archive import ARCHIVE_AFTER_DAYS, BATCH_SIZE, archivable, archive_expenses, cutoff
+from core import natural_number, pos_int
+
+
+class Command(BaseCommand):
+    help = ('Archive resolved expenses that have not been updated for --days days, '
+            'see api.archive. Every batch is committed, run it again to resume.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=natural_number, default=ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=pos_int, default=BATCH_SIZE,
+                            help='Number of expenses archived per transaction')
+        parser.add_argument('--max-batches', type=pos_int,
+                            help='Stop after this many batches')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the expenses that would be archived')
+
+    def handle(self, *args, days, batch_size, max_batches, dry_run, **options):
+        before = cutoff(days)
+        if dry_run:
+            self.stdout.write(f'Would archive {archivable(before).count()} expenses.')
+            return
+        started = perf_counter()
+
+        def progress(archived):
+            self.stderr.write(f'{archived} archived, '
+                              f'{archived / max(perf_counter() - started, 1e-9):.0f} rows/s')
+
+        archived = archive_expenses(before, batch_size=batch_size, max_batches=max_batches,
+                                    on_batch=progress)
+        left = archivable(before).count()
+        self.stdout.write(f'Archived {archived} expenses in {perf_counter() - started:.1f} s, '
+                          f'{left} left.')
@@ -0,0 +1,61 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Delete shares with their expenses in batches."""
+
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from api.deletion import BATCH_SIZE, delete_share
+from api.models import ArchivedExpense, Expense, Share
+from core import natural_number, pos_int
+
+
+class Command(BaseCommand):
+    help = ('Delete shares and their expenses in batches, see api.deletion. '
+            'Every batch is committed, run it again to resume.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('shares', type=natural_number, nargs='+', metavar='SHARE_ID')
+        parser.add_argument('--batch-size', type=pos_int, default=BATCH_SIZE,
+                            help='Number of expenses deleted per transaction')
+        parser.add_argument('--max-batches', type=pos_int,
+                            help='Stop after this many batches per share')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the expenses that would be deleted')
+
+    def handle(self, *args, shares, batch_size, max_batches, dry_run, **options):
+        for share_id in shares:
+            if not Share.objects.filter(pk=share_id).exists():
+                self.stderr.write(f'Share {share_id} does not exist.')
+                continue
+            if dry_run:
+                count = (Expense.objects.filter(share_id=share_id).count()
+                         + ArchivedExpense.objects.filter(share_id=share_id).count())
+                self.stdout.write(f'Would delete share {share_id} and {count} expenses.')
+                continue
+            started = perf_counter()
+
+            def progress(deleted):
+                self.stderr.write(f'{deleted} deleted, '
+                                  f'{deleted / max(perf_counter() - started, 1e-9):.0f} rows/s')
+
+            deleted = delete_share(share_id, batch_size=batch_size, max_batches=max_batches,
+                                   on_batch=progress)
+            done = 'not deleted yet' if Share.objects.filter(pk=share_id).exists() else 'deleted'
+            self.stdout.write(f'Deleted {deleted} expenses in {perf_counter() - started:.1f} s, '
+                              f'share {share_id} {done}.')
@@ -0,0 +1,55 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Stream the expenses of a share or user as CSV or NDJSON."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import CHUNK_SIZE, FORMATS, export, export_queryset
+from core import comparison, epoch, pos_int
+
+
+class Command(BaseCommand):
+    help = 'Export the expenses of a share or user, with their ratios, as CSV or NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--share', type=int, help='ID of the share')
+        parser.add_argument('--user', type=int,
+                            help='ID of a user, exports the expenses paid by or for the user')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--created-at', type=comparison(epoch),
+                            help='Comparisons on the creation time epoch, e.g. gte:1500000000')
+        parser.add_argument('--updated-at', type=comparison(epoch),
+                            help='Comparisons on the latest update time epoch')
+        parser.add_argument('--output', '-o', help='Output file, defaults to stdout')
+        parser.add_argument('--chunk-size', type=pos_int, default=CHUNK_SIZE,
+                            help='Number of expenses read at a time')
+
+    def handle(self, *args, output, chunk_size, **options):
+        if options['share'] is None and options['user'] is None:
+            raise CommandError('Provide --share and/or --user.')
+        params = {key: options[key] for key in ('share', 'user', 'created_at', 'updated_at')
+                  if options[key] is not None}
+        chunks = export(export_queryset(params), options['format'], chunk_size,
+                        archived=export_queryset(params, archived=True))
+        if output is None:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
+            return
+        with open(output, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
@@ -0,0 +1,70 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Bulk import expenses from CSV."""
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.importer import BATCH_SIZE, RowError, import_expenses
+from core import natural_number, pos_int
+
+# Invalid rows listed when an import fails
+MAX_ERRORS_SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = ('Bulk import expenses from CSV, see api.importer for the format. '
+            'Nothing is imported unless every row is valid, or --max-errors allows it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="CSV file, '-' for stdin")
+        parser.add_argument('--key', choices=('name', 'id'), default='name',
+                            help='Look shares and users up by name or ID, rows naming a '
+                                 'share or member shared by several are rejected by name')
+        parser.add_argument('--batch-size', type=pos_int, default=BATCH_SIZE)
+        parser.add_argument('--max-errors', type=natural_number, default=0,
+                            help='Import the valid rows if there are at most this many errors')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate and write, then roll back')
+
+    def progress(self, stats):
+        self.stderr.write(f'{stats.rows} rows, {stats.imported} imported, '
+                          f'{len(stats.errors)} errors, {stats.rate:.0f} rows/s')
+
+    def handle(self, *args, file, key, batch_size, max_errors, dry_run, **options):
+        lines = sys.stdin if file == '-' else open(file, newline='')
+        try:
+            with transaction.atomic():
+                stats = import_expenses(lines, key=key, batch_size=batch_size,
+                                        max_errors=max_errors, on_batch=self.progress)
+                for line, reason in stats.errors[:MAX_ERRORS_SHOWN]:
+                    self.stderr.write(f'line {line}: {reason}')
+                if len(stats.errors) > max_errors:
+                    raise CommandError('Too many invalid rows, nothing was imported.')
+                if dry_run:
+                    transaction.set_rollback(True)
+        except RowError as e:
+            raise CommandError(str(e))
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        verb = 'Would import' if dry_run else 'Imported'
+        self.stdout.write(f'{verb} {stats.imported} expenses in '
+                          f'{stats.elapsed:.1f} s ({stats.rate:.0f} rows/s).')
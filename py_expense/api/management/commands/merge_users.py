@@ -0,0 +1,40 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Merge a duplicate user into another user."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.merge import merge_users
+from api.models import User
+from core import natural_number
+
+
+class Command(BaseCommand):
+    help = ('Move the expenses, ratios, share memberships and tokens of the source '
+            'user to the target user, then delete the source user, see api.merge.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', type=natural_number, help='ID of the user to merge')
+        parser.add_argument('target', type=natural_number, help='ID of the user to keep')
+
+    def handle(self, *args, source, target, **options):
+        try:
+            counts = merge_users(source, target)
+        except (ValueError, User.DoesNotExist) as e:
+            raise CommandError(str(e))
+        self.stdout.write(f'Merged user {source} into user {target}: '
+                          + ', '.join(f'{count} {kind}' for kind, count in counts.items()))
@@ -0,0 +1,152 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Production server: a gunicorn master that pre-forks worker processes.
+
+    python manage.py serve --bind 0.0.0.0:8000
+
+The app is loaded in the master before forking so workers share its memory
+copy-on-write. Send the master SIGHUP to gracefully replace all workers,
+and SIGTERM to gracefully shut down.
+"""
+
+import os
+import sys
+from importlib import reload
+from typing import Any, Dict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import clear_url_caches, get_resolver
+from django.utils.module_loading import import_string
+
+
+def default_workers() -> int:
+    """The number of cores available to this process."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        return os.cpu_count() or 1
+
+
+def use_async_views():
+    """
+    Serve the async views: set ``ASYNC_VIEWS``, and reload the URLconf if it
+    was already imported with the sync views.
+    """
+    settings.ASYNC_VIEWS = True
+    os.environ['ASYNC_VIEWS'] = '1'
+    urlconf = sys.modules.get(settings.ROOT_URLCONF)
+    if urlconf is not None:
+        reload(urlconf)
+    clear_url_caches()
+
+
+def _post_fork(server, worker):
+    # Never share database connections opened in the master with workers.
+    connections.close_all()
+
+
+def gunicorn_options(*, bind: str, workers: int, threads: int, asgi: bool, preload: bool,
+                     graceful_timeout: int, max_requests: int, pidfile: str = None,
+                     **kwargs) -> Dict[str, Any]:
+    """
+    Gunicorn settings for the command line options.
+
+    :return: A mapping of gunicorn setting name to value.
+    """
+    options = {
+        'bind': bind,
+        'workers': workers or default_workers(),
+        'threads': threads,
+        'preload_app': preload,
+        'graceful_timeout': graceful_timeout,
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests // 10,
+        'pidfile': pidfile,
+        'post_fork': _post_fork,
+        'accesslog': '-',
+    }
+    if asgi:
+        options['worker_class'] = 'uvicorn.workers.UvicornWorker'
+    elif threads > 1:
+        options['worker_class'] = 'gthread'
+    return options
+
+
+class Command(BaseCommand):
+    help = 'Run the production server with pre-forked worker processes.'
+    # The checks import the URLconf, they're run once the views are chosen
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default='127.0.0.1:8000',
+                            help='Address to listen on, defaults to 127.0.0.1:8000')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Number of worker processes, defaults to the number of cores')
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Number of threads per WSGI worker')
+        parser.add_argument('--asgi', action='store_true',
+                            help='Serve the ASGI app with the async views (requires uvicorn)')
+        parser.add_argument('--no-preload', dest='preload', action='store_false',
+                            help='Load the app in each worker instead of the master, so '
+                                 'SIGHUP also reloads code')
+        parser.add_argument('--graceful-timeout', type=int, default=30,
+                            help='Seconds workers get to finish requests on reload/shutdown')
+        parser.add_argument('--max-requests', type=int, default=0,
+                            help='Restart a worker after this many requests, 0 to disable')
+        parser.add_argument('--pidfile', help='Write the master PID to this file')
+
+    def handle(self, *args, **options):
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            raise CommandError('gunicorn is required, pip install gunicorn')
+        if options['asgi']:
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                raise CommandError('uvicorn is required for --asgi, pip install uvicorn')
+            use_async_views()
+            app_path = settings.ASGI_APPLICATION
+        else:
+            app_path = settings.WSGI_APPLICATION
+            if options['threads'] <= 1:
+                self.stderr.write(self.style.WARNING(
+                    'Serving with the sync worker, each open share event stream takes a whole '
+                    'worker until the worker timeout. Use --asgi or --threads to serve them.'))
+        self.check()
+
+        config = gunicorn_options(**options)
+
+        class Server(BaseApplication):
+            def load_config(self):
+                for key, val in config.items():
+                    self.cfg.set(key, val)
+
+            def load(self):
+                app = import_string(app_path)
+                # Import every view up front so preloading shares them too.
+                get_resolver().url_patterns
+                return app
+
+        self.stdout.write(
+            f"Serving {app_path} on {config['bind']} with {config['workers']} workers"
+        )
+        Server().run()
@@ -0,0 +1,36 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Grant or revoke the staff access of a user."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import User
+from core import natural_number
+
+
+class Command(BaseCommand):
+    help = 'Let a user use the staff only API endpoints, such as merging users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_id', type=natural_number)
+        parser.add_argument('--revoke', action='store_true',
+                            help='Take the staff access away instead')
+
+    def handle(self, *args, user_id, revoke, **options):
+        if not User.objects.filter(pk=user_id).update(is_staff=not revoke):
+            raise CommandError(f'User with ID {user_id} not found.')
+        self.stdout.write(f"User {user_id} is {'no longer' if revoke else 'now'} staff.")
@@ -0,0 +1,58 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Create, list and revoke API tokens."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Token, User
+
+
+class Command(BaseCommand):
+    help = 'Create, list and revoke API tokens.'
+
+    def add_arguments(self, parser):
+        sub = parser.add_subparsers(dest='action', required=True)
+        create = sub.add_parser('create', help='Create a token for a user')
+        create.add_argument('user_id', type=int)
+        show = sub.add_parser('list', help='List the tokens of a user, or of every user')
+        show.add_argument('user_id', type=int, nargs='?')
+        revoke = sub.add_parser('revoke', help='Revoke a token')
+        revoke.add_argument('key')
+
+    def handle(self, *args, action, **options):
+        if action == 'revoke':
+            token = Token.objects.filter(pk=options['key']).first()
+            if token is None:
+                raise CommandError('Token not found.')
+            token.revoke()
+            self.stdout.write('Revoked.')
+            return
+        if action == 'list' and options['user_id'] is None:
+            for token in Token.objects.order_by('created_at'):
+                self.stdout.write(
+                    f'{token.key} {token.user_id} {int(token.created_at.timestamp())}')
+            return
+        try:
+            user = User.objects.get(pk=options['user_id'])
+        except User.DoesNotExist:
+            raise CommandError(f"User with ID {options['user_id']} not found.")
+        if action == 'create':
+            self.stdout.write(Token.new(user).key)
+        else:
+            for token in Token.objects.filter(user=user).order_by('created_at'):
+                self.stdout.write(f'{token.key} {int(token.created_at.timestamp())}')
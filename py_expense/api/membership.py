@@ -0,0 +1,126 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Share membership lookups.
+
+"Is this user in this share" is answered with one EXISTS query, and "which
+of these users are in this share" with one IN query, instead of loading
+the user's shares or the share's users.
+
+Answers are kept per (share, user) in an in process ``TTLCache`` for
+``MEMBERSHIP_CACHE_TTL`` seconds, set it to 0 to turn the cache off.
+Changing the users of a share invalidates its entries in this process
+right away, other worker processes see the change once their entries
+expire. Answers read inside a transaction are only cached once it commits,
+so a membership that is rolled back is never cached.
+"""
+
+from typing import Iterable, Set
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+
+from core import TTLCache
+from .models import Share, User
+
+Membership = Share.users.through
+
+membership_cache = TTLCache('membership', settings.MEMBERSHIP_CACHE_SIZE,
+                            settings.MEMBERSHIP_CACHE_TTL)
+
+_MISSING = object()
+
+
+def _cached() -> bool:
+    return membership_cache.ttl > 0
+
+
+def is_member(share_id: int, user_id: int) -> bool:
+    """
+    Check a user is in a share.
+
+    :param share_id: The ID of the share.
+    :param user_id: The ID of the user.
+    """
+    return user_id in members_in(share_id, (user_id,))
+
+
+def members_in(share_id: int, user_ids: Iterable[int]) -> Set[int]:
+    """
+    Find which of some users are in a share.
+
+    :param share_id: The ID of the share.
+    :param user_ids: The IDs of the users.
+    :return: The IDs of the users that are in the share.
+    """
+    user_ids = set(user_ids)
+    found = set()
+    if _cached():
+        for user_id in list(user_ids):
+            member = membership_cache.get((share_id, user_id), _MISSING)
+            if member is not _MISSING:
+                user_ids.discard(user_id)
+                if member:
+                    found.add(user_id)
+    if not user_ids:
+        return found
+    if len(user_ids) == 1:
+        user_id, = user_ids
+        exists = Membership.objects.filter(share_id=share_id, user_id=user_id).exists()
+        loaded = {user_id} if exists else set()
+    else:
+        loaded = set(Membership.objects.filter(share_id=share_id, user_id__in=user_ids)
+                     .values_list('user_id', flat=True))
+    if _cached():
+        answers = {(share_id, user_id): user_id in loaded for user_id in user_ids}
+        # Right away outside of a transaction
+        transaction.on_commit(lambda: _store(answers))
+    return found | loaded
+
+
+def _store(answers: dict):
+    for pair, member in answers.items():
+        membership_cache.set(pair, member)
+
+
+def _invalidate(pairs: Iterable[tuple]):
+    for pair in pairs:
+        membership_cache.invalidate(pair)
+
+
+@receiver(m2m_changed, sender=Membership)
+def _invalidate_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        if reverse:
+            # ``user.share_set.add(...)``
+            pairs = [(share_id, instance.pk) for share_id in pk_set]
+        else:
+            pairs = [(instance.pk, user_id) for user_id in pk_set]
+        _invalidate(pairs)
+        # Another thread may cache the old membership before this commits
+        transaction.on_commit(lambda: _invalidate(pairs))
+    elif action == 'post_clear':
+        membership_cache.clear()
+        transaction.on_commit(membership_cache.clear)
+
+
+@receiver(post_delete, sender=Share)
+@receiver(post_delete, sender=User)
+def _invalidate_deleted(sender, instance, **kwargs):
+    membership_cache.clear()
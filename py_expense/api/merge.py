@@ -0,0 +1,232 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Merging of duplicate users.
+
+``merge_users`` moves everything of a source user to a target user with a
+few set based statements, in one transaction, then deletes the source
+user. Where both users have a ratio of the same expense, or a summary of
+the same share, the two are added up into the target's row, and an equal
+split both users are in is split by ratios instead. Expenses
+whose payer or ratios changed, and shares whose members changed, get a
+new ``updated_at`` so the change feed picks them up.
+"""
+
+from collections import defaultdict
+from fractions import Fraction
+from typing import Dict, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .auth import token_cache
+from .membership import membership_cache
+from .models import (RATIO, ArchivedExpense, ArchivedExpenseParticipant, ArchivedExpenseRatio,
+                     ArchiveSummary, Expense, ExpenseParticipant, ExpenseRatio, Share, Token,
+                     User, participates)
+from .multiget import invalidate
+from .signals import expenses_changed
+from .summary import invalidate_summaries
+
+Membership = Share.users.through
+
+
+def _raw_delete(queryset):
+    # The rows are accounted for by ``merge_users``, don't collect them and
+    # send ``post_delete`` for each
+    queryset._raw_delete(queryset.db)
+
+
+def _move_ratios(model, source_id: int, target_id: int) -> Tuple[int, int]:
+    """
+    Move the ratios of the source user to the target user, adding the
+    source's part to the target's ratio on expenses they are both in.
+
+    :return: The number of ratios moved and coalesced.
+    """
+    duplicates = model.objects.filter(
+        user_id=source_id,
+        expense_id__in=model.objects.filter(user_id=target_id).values('expense_id'),
+    )
+    extra = defaultdict(Fraction)
+    for expense_id, top, bot in duplicates.values_list('expense_id', 'numerator', 'denominator'):
+        extra[expense_id] += Fraction(top, bot)
+    if extra:
+        ratios = []
+        for ratio in model.objects.filter(user_id=target_id, expense_id__in=list(extra)):
+            part = extra.pop(ratio.expense_id, None)
+            if part is None:
+                continue
+            part += Fraction(ratio.numerator, ratio.denominator)
+            ratio.numerator, ratio.denominator = part.numerator, part.denominator
+            ratios.append(ratio)
+        model.objects.bulk_update(ratios, ['numerator', 'denominator'])
+        _raw_delete(duplicates)
+    else:
+        ratios = ()
+    moved = model.objects.filter(user_id=source_id).update(user_id=target_id)
+    return moved, len(ratios)
+
+
+def _move_participants(model, participant_model, ratio_model, source_id: int,
+                       target_id: int) -> Tuple[int, int]:
+    """
+    Replace the source user with the target user in equal splits. Equal
+    splits both users are in are split by ratios instead, the target getting
+    both parts.
+
+    :return: The number of equal splits moved and split by ratios.
+    """
+    both = participant_model.objects.filter(
+        user_id=source_id,
+        expense_id__in=participant_model.objects.filter(user_id=target_id).values('expense_id'),
+    ).values('expense_id')
+    participants = defaultdict(list)
+    for expense_id, user_id in participant_model.objects.filter(
+            expense_id__in=both).values_list('expense_id', 'user_id'):
+        participants[expense_id].append(user_id)
+    if participants:
+        ratios = []
+        for expense_id, user_ids in participants.items():
+            for user_id in user_ids:
+                if user_id == source_id:
+                    continue
+                part = Fraction(2 if user_id == target_id else 1, len(user_ids))
+                ratios.append(ratio_model(expense_id=expense_id, user_id=user_id,
+                                          numerator=part.numerator, denominator=part.denominator))
+        ratio_model.objects.bulk_create(ratios)
+        _raw_delete(participant_model.objects.filter(expense_id__in=list(participants)))
+        model.objects.filter(id__in=list(participants)).update(split=RATIO)
+    moved = participant_model.objects.filter(user_id=source_id).update(user_id=target_id)
+    return moved, len(participants)
+
+
+def _move_summaries(source_id: int, target_id: int) -> int:
+    """
+    Move the archive summaries of the source user to the target user, adding
+    them up on shares both have one in.
+
+    :return: The number of summaries moved or coalesced.
+    """
+    duplicates = ArchiveSummary.objects.filter(
+        user_id=source_id,
+        share_id__in=ArchiveSummary.objects.filter(user_id=target_id).values('share_id'),
+    )
+    extra = {row['share_id']: row
+             for row in duplicates.values('share_id', 'expenses', 'paid', 'owed')}
+    if extra:
+        summaries = list(ArchiveSummary.objects.filter(user_id=target_id,
+                                                       share_id__in=list(extra)))
+        for summary in summaries:
+            row = extra[summary.share_id]
+            summary.expenses += row['expenses']
+            summary.paid += row['paid']
+            summary.owed += row['owed']
+        ArchiveSummary.objects.bulk_update(summaries, ['expenses', 'paid', 'owed'])
+        _raw_delete(duplicates)
+    return len(extra) + ArchiveSummary.objects.filter(user_id=source_id).update(user_id=target_id)
+
+
+def _move_memberships(source_id: int, target_id: int) -> list:
+    """
+    Move the share memberships of the source user to the target user.
+
+    :return: The IDs of the shares the source user was in.
+    """
+    memberships = Membership.objects.filter(user_id=source_id)
+    share_ids = list(memberships.values_list('share_id', flat=True))
+    if share_ids:
+        memberships.exclude(
+            share_id__in=Membership.objects.filter(user_id=target_id).values('share_id')
+        ).update(user_id=target_id)
+        # Left are the shares both users were in
+        _raw_delete(memberships)
+        membership_cache.clear()
+        transaction.on_commit(membership_cache.clear)
+    return share_ids
+
+
+def merge_users(source_id: int, target_id: int) -> Dict[str, int]:
+    """
+    Merge a user into another one and delete it.
+
+    :param source_id: ID of the user to merge, it is deleted.
+    :param target_id: ID of the user to keep.
+    :return: The number of rows affected, by kind.
+    :raises ValueError: If both IDs are the same.
+    :raises User.DoesNotExist: If either user does not exist.
+    """
+    if source_id == target_id:
+        raise ValueError('cannot merge a user into itself')
+    with transaction.atomic():
+        users = User.objects.select_for_update().in_bulk([source_id, target_id])
+        if len(users) < 2:
+            missing = source_id if source_id not in users else target_id
+            raise User.DoesNotExist(f'User with ID {missing} does not exist.')
+        changed = Expense.objects.filter(
+            Q(paid_by_id=source_id)
+            | Q(id__in=ExpenseRatio.objects.filter(user_id=source_id).values('expense_id'))
+            | participates([source_id])
+        )
+        rows = list(changed.order_by('id').values_list('id', 'share_id'))
+        # Marked now, stamped when done
+        marked = timezone.now()
+        changed.update(updated_at=marked)
+        counts = {
+            'expenses': Expense.objects.filter(paid_by_id=source_id).update(paid_by_id=target_id),
+            'archived_expenses': ArchivedExpense.objects.filter(paid_by_id=source_id)
+            .update(paid_by_id=target_id),
+        }
+        counts['ratios'], counts['ratios_coalesced'] = _move_ratios(
+            ExpenseRatio, source_id, target_id)
+        counts['archived_ratios'], counts['archived_ratios_coalesced'] = _move_ratios(
+            ArchivedExpenseRatio, source_id, target_id)
+        # Parts of equal splits count as ratios
+        for *models, prefix in (
+                (Expense, ExpenseParticipant, ExpenseRatio, ''),
+                (ArchivedExpense, ArchivedExpenseParticipant, ArchivedExpenseRatio, 'archived_')):
+            moved, converted = _move_participants(*models, source_id, target_id)
+            counts[f'{prefix}ratios'] += moved
+            counts[f'{prefix}ratios_coalesced'] += converted
+        archived_shares = list(ArchiveSummary.objects.filter(user_id=source_id)
+                               .values_list('share_id', flat=True))
+        counts['summaries'] = _move_summaries(source_id, target_id)
+
+        share_ids = _move_memberships(source_id, target_id)
+        counts['shares'] = len(share_ids)
+
+        keys = list(Token.objects.filter(user_id=source_id).values_list('key', flat=True))
+        counts['tokens'] = Token.objects.filter(user_id=source_id).update(user_id=target_id)
+        for key in keys:
+            token_cache.invalidate(key)
+
+        users[source_id].delete()
+
+        # The change feed only waits ``CHANGES_SAFETY_LAG`` for a transaction
+        # to commit, stamp the changes as late as possible
+        now = timezone.now()
+        Expense.objects.filter(updated_at=marked).update(updated_at=now)
+        Share.objects.filter(id__in=share_ids).update(updated_at=now)
+        User.objects.filter(pk=target_id).update(updated_at=now)
+
+        invalidate('shares', share_ids)
+        invalidate_summaries({*share_ids, *archived_shares})
+        invalidate('users', (target_id,))
+        if rows:
+            expenses_changed.send(sender=Expense, expenses=rows, event='updated')
+    return counts
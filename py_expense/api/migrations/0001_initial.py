@@ -0,0 +1,144 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:38
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Share',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('description', models.CharField(max_length=256)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('share', 'share'), ('expense', 'expense')], max_length=16)),
+                ('object_id', models.PositiveIntegerField()),
+                ('deleted_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64)),
+                ('is_staff', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Expense',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('description', models.CharField(max_length=256)),
+                ('total', models.DecimalField(decimal_places=10, max_digits=19, validators=[django.core.validators.MinValueValidator(0)])),
+                ('resolved', models.BooleanField(default=False)),
+                ('split', models.CharField(choices=[('ratio', 'By ratios'), ('equal', 'Equally')], default='ratio', max_length=8)),
+                ('share', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.share')),
+                ('paid_by', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='api.user')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedExpense',
+            fields=[
+                ('id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('updated_at', models.DateTimeField(db_index=True)),
+                ('description', models.CharField(max_length=256)),
+                ('total', models.DecimalField(decimal_places=10, max_digits=19)),
+                ('resolved', models.BooleanField(default=True)),
+                ('split', models.CharField(choices=[('ratio', 'By ratios'), ('equal', 'Equally')], default='ratio', max_length=8)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('share', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.share')),
+                ('paid_by', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='api.user')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Token',
+            fields=[
+                ('key', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.user')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='share',
+            name='users',
+            field=models.ManyToManyField(to='api.user'),
+        ),
+        migrations.CreateModel(
+            name='ExpenseRatio',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numerator', models.PositiveIntegerField()),
+                ('denominator', models.PositiveIntegerField()),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.expense')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='api.user')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedExpenseRatio',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numerator', models.PositiveIntegerField()),
+                ('denominator', models.PositiveIntegerField()),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.archivedexpense')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='api.user')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExpenseParticipant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.expense')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='api.user')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('expense', 'user'), name='unique_participant')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchiveSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expenses', models.PositiveIntegerField(default=0)),
+                ('paid', models.DecimalField(decimal_places=10, default=0, max_digits=19)),
+                ('owed', models.DecimalField(decimal_places=10, default=0, max_digits=19)),
+                ('share', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.share')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='api.user')),
+            ],
+            options={
+                'unique_together': {('share', 'user')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedExpenseParticipant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.archivedexpense')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='api.user')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('expense', 'user'), name='unique_archived_participant')],
+            },
+        ),
+    ]
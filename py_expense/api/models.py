@@ -14,21 +14,35 @@
 #  You should have received a copy of the GNU Affero General Public License
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from itertools import chain
 from math import fsum
-from typing import Dict, Tuple
+from secrets import token_hex
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
 
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import QuerySet
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Q, QuerySet, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 
 from core import MONEY, STRING_SIZE as SS
+from .signals import expense_changed, expenses_changed, ratios_changed
 
 Model = models.Model
 
-name_field = models.CharField(max_length=SS['small'])
-auto_created_at = models.DateTimeField(auto_now_add=True)
-auto_updateed_at = models.DateTimeField(auto_now=True)
+
+# A field instance can only belong to one model, so every model gets its own.
+def name_field():
+    return models.CharField(max_length=SS['small'])
+
+
+def auto_created_at():
+    return models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+def auto_updateed_at():
+    return models.DateTimeField(auto_now=True, db_index=True)
 
 
 class User(Model):
@@ -37,6 +51,7 @@ class User(Model):
 
     Fields:
         name: A string for the name.
+        is_staff: Whether the user can use the staff only endpoints.
         created_at: A Django datetime object for creation time.
         updated_at:  A Dajango datetime object for latest update time.
 
@@ -44,26 +59,39 @@ class User(Model):
         Many to many: Share
         One to Many: One User -> Many Expense
                      One User -> Many Expense Ratio
+                     One User -> Many ExpenseParticipant
     """
 
-    name = name_field
-    created_at = auto_created_at
-    updated_at = auto_updateed_at
+    name = name_field()
+    is_staff = models.BooleanField(default=False)
+    created_at = auto_created_at()
+    updated_at = auto_updateed_at()
 
     @property
     def paid_by(self) -> QuerySet:
         """Return a QuerySet of ``Expense`` paid by this user."""
-        return Expense.objects.filter(paid_by=self).distinct()
+        return self.expense_set.all()
 
     @property
-    def paid_for(self) -> QuerySet:
-        """Return a QuerySet of ``ExpenseRatio`` for this user."""
-        return ExpenseRatio.objects.filter(user=self).distinct()
+    def paid_for(self) -> List['ExpenseRatio']:
+        """
+        Return the ``ExpenseRatio`` of this user, with unsaved ones for the
+        expenses split equally.
+        """
+        # Prefetched with ``parts`` by ``UserSerializer``
+        participations = self.__dict__.get('participations')
+        if participations is None:
+            participations = self.expenseparticipant_set.with_parts().order_by('expense_id')
+        ratios = list(self.expenseratio_set.all())
+        for participation in participations:
+            ratios.append(ExpenseRatio(expense_id=participation.expense_id, user_id=self.pk,
+                                       numerator=1, denominator=participation.parts))
+        return ratios
 
     @property
     def shares(self) -> QuerySet:
         """Returns a QuerySet of ``Share`` the user is in."""
-        return Share.objects.filter(users__in=[self]).distinct()
+        return self.share_set.all()
 
     @property
     def balance(self) -> Dict['User', float]:
@@ -74,6 +102,32 @@ class User(Model):
 
 PaidFor = Dict[User, Tuple[int, int]]
 
+RATIO, EQUAL = 'ratio', 'equal'
+
+SPLITS = ((RATIO, 'By ratios'), (EQUAL, 'Equally'))
+
+
+def participates(user_ids: Iterable[int], archived: bool = False) -> Q:
+    """
+    Q of the expenses split equally with any of the users.
+
+    :param archived: Match ``ArchivedExpense`` instead of ``Expense``
+    """
+    model = ArchivedExpenseParticipant if archived else ExpenseParticipant
+    return Q(id__in=model.objects.filter(user_id__in=list(user_ids)).values('expense_id'))
+
+
+def is_equal_split(ratios: Iterable[Tuple[int, int]]) -> bool:
+    """Whether ratios are exactly 1/N each, N being the number of ratios."""
+    ratios = list(ratios)
+    return bool(ratios) and all(tuple(ratio) == (1, len(ratios)) for ratio in ratios)
+
+
+def equal_ratios(user_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+    """{user ID: (1, N)} of the participants of an equal split."""
+    user_ids = sorted(set(user_ids))
+    return {pk: (1, len(user_ids)) for pk in user_ids}
+
 
 class Share(Model):
     """
@@ -90,19 +144,42 @@ class Share(Model):
         Many to many: User
         One to many: One Share -> Many Expense
     """
-    name = name_field
-    created_at = auto_created_at
-    updated_at = auto_updateed_at
+    name = name_field()
+    created_at = auto_created_at()
+    updated_at = auto_updateed_at()
     description = models.CharField(max_length=SS['medium'])
     users = models.ManyToManyField(User)
 
     @property
     def expenses(self) -> QuerySet:
-        return Expense.objects.filter(share=self).distinct()
+        return self.expense_set.all()
 
     @property
     def total(self) -> float:
-        return fsum(e.total for e in self.expenses)
+        # Archived expenses are only counted through their summaries
+        archived = self.archivesummary_set.values_list('paid', flat=True)
+        return fsum(chain((e.total for e in self.expenses), archived))
+
+
+class ExpenseQuerySet(QuerySet):
+    def resolve(self, resolved: bool = True) -> List[int]:
+        """
+        Resolve, or unresolve, the expenses of this QuerySet with one UPDATE,
+        which also sets their ``updated_at``. Expenses that are already in
+        that state are left as is.
+
+        :param resolved: The new value of ``resolved``
+        :return: The IDs of the expenses that changed.
+        """
+        with transaction.atomic(using=self.db):
+            rows = list(self.exclude(resolved=resolved).select_for_update()
+                        .order_by('id').values_list('id', 'share_id'))
+            if rows:
+                self.model.objects.filter(id__in=[pk for pk, _ in rows]).update(
+                    resolved=resolved, updated_at=timezone.now())
+                expenses_changed.send(sender=self.model, expenses=rows,
+                                      event='resolved' if resolved else 'updated')
+        return [pk for pk, _ in rows]
 
 
 class Expense(Model):
@@ -117,32 +194,108 @@ class Expense(Model):
         total: The total amount of money for this Expense.
         paid_by: This Expense is *paid by* the User.
         resolved: A bool indicating wether this Expense is resolved.
+        split: How the expense is split, ``RATIO`` by its ``ExpenseRatio``
+               or ``EQUAL`` among its ``ExpenseParticipant``
 
     Relations:
         One to Many: One Expense -> Many ExpenseRatio
+                     One Expense -> Many ExpenseParticipant
                      One Share -> Many Expense
                      One User -> Many Expense
     """
-    created_at = models.DateTimeField(default=timezone.now)
-    updated_at = auto_updateed_at
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    updated_at = auto_updateed_at()
     description = models.CharField(max_length=SS['medium'])
     share = models.ForeignKey(Share, on_delete=models.CASCADE)
     total = models.DecimalField(**MONEY, validators=[MinValueValidator(0)])
     paid_by = models.ForeignKey(User, on_delete=models.DO_NOTHING)
     resolved = models.BooleanField(default=False)
+    split = models.CharField(max_length=8, choices=SPLITS, default=RATIO)
+
+    objects = ExpenseQuerySet.as_manager()
+
+    # Columns remembered as last loaded or saved, caches keyed by them drop
+    # the old keys when they change, see ``stored``
+    _STORED = ('share_id', 'paid_by_id', 'total')
 
     @classmethod
-    def new(cls, *, paid_for: PaidFor, **kwargs):
-        instance = cls.objects.create(**kwargs)
-        instance.generate_ratio(paid_for)
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember()
+        return instance
+
+    def _remember(self):
+        # Deferred columns are unknown
+        self._stored = {attname: self.__dict__.get(attname) for attname in self._STORED}
+
+    def stored(self, attname: str):
+        """
+        The value of ``share_id``, ``paid_by_id`` or ``total`` as last loaded
+        from or saved to the database, None if unknown. In ``post_save`` receivers
+        it is the value before the save.
+        """
+        return self.__dict__.get('_stored', {}).get(attname)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._remember()
+
+    @classmethod
+    def new(cls, *, paid_for: Optional[PaidFor] = None,
+            participants: Optional[Iterable[User]] = None, **kwargs):
+        """
+        Create an expense split by ratios, or equally.
+
+        :param paid_for: A dict of User to a tuple representing a fraction
+                         like so {User: (numerator, denominator)}
+        :param participants: The users splitting the expense equally,
+                             instead of ``paid_for``
+        """
+        if participants is not None:
+            user_ids = {user.pk for user in participants}
+            if not user_ids:
+                raise ValueError('participants cannot be empty.')
+            instance = cls.objects.create(split=EQUAL, **kwargs)
+            ExpenseParticipant.objects.bulk_create(
+                ExpenseParticipant(expense=instance, user_id=pk) for pk in user_ids)
+        else:
+            instance = cls.objects.create(**kwargs)
+            instance.generate_ratio(paid_for)
+        expense_changed.send(sender=cls, instance=instance, event='created')
         return instance
 
     @property
-    def paid_for(self) -> QuerySet:
+    def paid_for(self) -> Union[QuerySet, List['ExpenseRatio']]:
         """
-        Returns a QuerySet of ExpenseRatio that belongs to this Expense.
+        Returns a QuerySet of ExpenseRatio that belongs to this Expense, or
+        a list of unsaved ones if it's split equally.
         """
-        return ExpenseRatio.objects.filter(expense=self)
+        if self.split == EQUAL:
+            return [ExpenseRatio(expense=self, user_id=pk, numerator=top, denominator=bot)
+                    for pk, (top, bot) in self.ratios().items()]
+        return self.expenseratio_set.all()
+
+    def ratios(self) -> Dict[int, Tuple[int, int]]:
+        """Returns {user ID: (numerator, denominator)} however the expense is split."""
+        if self.split == EQUAL:
+            return equal_ratios(p.user_id for p in self.expenseparticipant_set.all())
+        return {r.user_id: (r.numerator, r.denominator) for r in self.expenseratio_set.all()}
+
+    def _clear_split(self) -> Set[int]:
+        # Delete the ratios or participants, return the IDs of their users
+        rows = self.expenseparticipant_set if self.split == EQUAL else self.expenseratio_set
+        user_ids = set(rows.values_list('user_id', flat=True))
+        rows.all().delete()
+        return user_ids
+
+    def _set_split(self, split: str, user_ids: Set[int]):
+        self.split = split
+        # Prefetched rows of the old split are stale
+        for name in ('expenseratio_set', 'expenseparticipant_set'):
+            getattr(self, '_prefetched_objects_cache', {}).pop(name, None)
+        # Ratios are synced as part of their expense, see ``api.changes``
+        self.save(update_fields=['split', 'updated_at'])
+        ratios_changed.send(sender=Expense, instance=self, user_ids=user_ids)
 
     def generate_ratio(self, paid_for: PaidFor):
         """
@@ -155,11 +308,27 @@ class Expense(Model):
         """
         if not paid_for:
             raise ValueError('paid_for cannot be empty.')
-        for ratio in self.paid_for:
-            ratio.delete()
-        return [ExpenseRatio.objects.create(
+        old = self._clear_split()
+        ratios = [ExpenseRatio.objects.create(
             user=user, numerator=top, denominator=bot, expense=self)
             for user, (top, bot) in paid_for.items()]
+        self._set_split(RATIO, old | {user.pk for user in paid_for})
+        return ratios
+
+    def split_equally(self, users: Iterable[User]):
+        """
+        Split this expense equally among users, with an ``ExpenseParticipant``
+        per user instead of an ``ExpenseRatio``
+
+        :param users: The users splitting the expense.
+        """
+        user_ids = {user.pk for user in users}
+        if not user_ids:
+            raise ValueError('participants cannot be empty.')
+        old = self._clear_split()
+        ExpenseParticipant.objects.bulk_create(
+            ExpenseParticipant(expense=self, user_id=pk) for pk in user_ids)
+        self._set_split(EQUAL, old | user_ids)
 
 
 class ExpenseRatio(Model):
@@ -180,3 +349,205 @@ class ExpenseRatio(Model):
     numerator = models.PositiveIntegerField()
     denominator = models.PositiveIntegerField()
     expense = models.ForeignKey(Expense, on_delete=models.CASCADE)
+
+
+class ParticipantQuerySet(QuerySet):
+
+    def with_parts(self) -> 'ParticipantQuerySet':
+        """Annotate ``parts``, the number of participants of the expense, the N of 1/N."""
+        parts = (self.model.objects.filter(expense_id=OuterRef('expense_id'))
+                 .values('expense_id').annotate(parts=Count('*')).values('parts'))
+        return self.annotate(parts=Subquery(parts))
+
+
+class ExpenseParticipant(Model):
+    """
+    A user an ``Expense`` is split equally with. Unlike ``ExpenseRatio`` it
+    has no ratio, a user takes part in an expense at most once.
+
+    Fields:
+        expense: The Expense split equally.
+        user: The User taking part.
+
+    Relations:
+        One to Many: One Expense -> Many ExpenseParticipant
+                     One User -> Many ExpenseParticipant
+    """
+    # The unique constraint's index finds the users of an expense
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE)
+    # Indexed, finds the expenses of a user
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING)
+
+    objects = ParticipantQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('expense', 'user'), name='unique_participant'),
+        ]
+
+
+class ArchivedExpense(Model):
+    """
+    A resolved ``Expense`` moved out of the live tables by ``api.archive``,
+    it keeps the ID it had as an ``Expense``.
+
+    Fields:
+        Same as ``Expense``, and
+        archived_at: A Django datetime object for archival time.
+
+    Relations:
+        One to Many: One ArchivedExpense -> Many ArchivedExpenseRatio
+                     One ArchivedExpense -> Many ArchivedExpenseParticipant
+                     One Share -> Many ArchivedExpense
+                     One User -> Many ArchivedExpense
+    """
+    id = models.PositiveIntegerField(primary_key=True)
+    created_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField(db_index=True)
+    description = models.CharField(max_length=SS['medium'])
+    share = models.ForeignKey(Share, on_delete=models.CASCADE)
+    total = models.DecimalField(**MONEY)
+    paid_by = models.ForeignKey(User, on_delete=models.DO_NOTHING)
+    resolved = models.BooleanField(default=True)
+    split = models.CharField(max_length=8, choices=SPLITS, default=RATIO)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+
+class ArchivedExpenseRatio(Model):
+    """
+    An ``ExpenseRatio`` of an ``ArchivedExpense``
+
+    Fields:
+        Same as ``ExpenseRatio``
+
+    Relations:
+        One to Many: One ArchivedExpense -> Many ArchivedExpenseRatio
+                     One User -> Many ArchivedExpenseRatio
+    """
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING)
+    numerator = models.PositiveIntegerField()
+    denominator = models.PositiveIntegerField()
+    expense = models.ForeignKey(ArchivedExpense, on_delete=models.CASCADE)
+
+
+class ArchivedExpenseParticipant(Model):
+    """
+    An ``ExpenseParticipant`` of an ``ArchivedExpense``
+
+    Fields:
+        Same as ``ExpenseParticipant``
+
+    Relations:
+        One to Many: One ArchivedExpense -> Many ArchivedExpenseParticipant
+                     One User -> Many ArchivedExpenseParticipant
+    """
+    expense = models.ForeignKey(ArchivedExpense, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING)
+
+    objects = ParticipantQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('expense', 'user'),
+                                    name='unique_archived_participant'),
+        ]
+
+
+class ArchiveSummary(Model):
+    """
+    Running totals of the archived expenses of a user in a share, so totals
+    and balances don't need to read the archive.
+
+    Fields:
+        share: The Share of the archived expenses.
+        user: The User these totals are for.
+        expenses: The number of archived expenses paid by the user.
+        paid: The sum of the totals of archived expenses paid by the user.
+        owed: The sum of the user's parts of archived expenses.
+
+    Relations:
+        One to Many: One Share -> Many ArchiveSummary
+                     One User -> Many ArchiveSummary
+    """
+    share = models.ForeignKey(Share, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING)
+    expenses = models.PositiveIntegerField(default=0)
+    paid = models.DecimalField(**MONEY, default=0)
+    owed = models.DecimalField(**MONEY, default=0)
+
+    class Meta:
+        unique_together = ('share', 'user')
+
+
+class Token(Model):
+    """
+    API Token model.
+
+    Fields:
+        key: The token string, clients send it as ``Authorization: Token <key>``
+        user: The User this token authenticates as.
+        created_at: A Django datetime object for creation time.
+
+    Relations:
+        One to Many: One User -> Many Token
+    """
+    key = models.CharField(max_length=40, primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def new(cls, user: User) -> 'Token':
+        """Create a new random token for a user."""
+        return cls.objects.create(key=token_hex(20), user=user)
+
+    def revoke(self):
+        """Revoke this token, it can no longer be used to authenticate."""
+        self.delete()
+
+
+class Tombstone(Model):
+    """
+    Record of a deleted Share or Expense, so the change feed can tell
+    clients about deletions.
+
+    Fields:
+        kind: The kind of the deleted object, one of ``KINDS``
+        object_id: The ID of the deleted object.
+        deleted_at: A Django datetime object for deletion time.
+    """
+    KINDS = ('share', 'expense')
+
+    kind = models.CharField(max_length=16, choices=[(k, k) for k in KINDS])
+    object_id = models.PositiveIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+
+@receiver(post_delete, sender=Share)
+@receiver(post_delete, sender=Expense)
+def _record_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(kind=sender.__name__.lower(), object_id=instance.pk)
+
+
+def touch_shares(share_ids: Iterable[Optional[int]]):
+    """
+    Give shares a new ``updated_at``, so the change feed picks them up when
+    their expenses or total change without the share itself being saved.
+    """
+    share_ids = {pk for pk in share_ids if pk is not None}
+    if share_ids:
+        Share.objects.filter(id__in=share_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Expense)
+def _expense_saved(sender, instance, created, **kwargs):
+    # Shares list their expenses and add up their totals
+    old_share = instance.stored('share_id')
+    if created or old_share != instance.share_id or instance.stored('total') != instance.total:
+        touch_shares({instance.share_id, old_share})
+
+
+@receiver(post_delete, sender=Expense)
+def _expense_deleted(sender, instance, origin=None, **kwargs):
+    # Not when the share itself is being deleted
+    if not isinstance(origin, Share) and getattr(origin, 'model', None) is not Share:
+        touch_shares((instance.share_id,))
@@ -0,0 +1,166 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Fetching shares, users and expenses by ID.
+
+Objects are represented as in the list endpoints, and each representation
+is cached in the ``OBJECT_CACHE`` Django cache, so hydrating known IDs
+usually doesn't touch the database. The misses of each model are read with
+one query and cached.
+
+Saving or deleting an object, its expense ratios, or share membership
+invalidates the cached objects whose representation includes it, once the
+transaction commits. Bulk writes that don't send signals, like imports and
+archival, are only seen once the entries expire after ``TTL`` seconds.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Expense, ExpenseRatio, Share, User
+from .readers import ExpenseReader, ShareReader, UserReader
+from .signals import expenses_changed, ratios_changed
+
+# kind -> (model, reader)
+KINDS = {
+    'shares': (Share, ShareReader),
+    'users': (User, UserReader),
+    'expenses': (Expense, ExpenseReader),
+}
+
+
+def object_cache():
+    """The Django cache of object representations."""
+    return caches[settings.OBJECT_CACHE['ALIAS']]
+
+
+def _key(kind: str, pk: int) -> str:
+    return f'obj:{kind}:{pk}'
+
+
+def get_objects(kind: str, ids: List[int]) -> List[Optional[dict]]:
+    """
+    Get objects of a kind by ID, from the cache or the database.
+
+    :param kind: One of ``KINDS``
+    :param ids: The IDs.
+    :return: The representations in the order of ``ids``, None for IDs not found.
+    """
+    model, reader_cls = KINDS[kind]
+    cache = object_cache()
+    keys = {pk: _key(kind, pk) for pk in ids}
+    cached = cache.get_many(keys.values())
+    found = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    misses = [pk for pk in keys if pk not in found]
+    if misses:
+        loaded = {obj['id']: obj for obj in
+                  reader_cls().serialize(model.objects.filter(id__in=misses))}
+        cache.set_many({keys[pk]: obj for pk, obj in loaded.items()},
+                       timeout=settings.OBJECT_CACHE['TTL'])
+        found.update(loaded)
+    return [found.get(pk) for pk in ids]
+
+
+def multi_get(ids: Dict[str, List[int]]) -> Dict[str, List[Optional[dict]]]:
+    """
+    Get objects of several kinds by ID.
+
+    :param ids: {kind: IDs}, kinds are ``KINDS``
+    :return: {kind: representations in the order of the IDs, None if not found}
+    """
+    return {kind: get_objects(kind, pks) for kind, pks in ids.items()}
+
+
+def invalidate(kind: str, ids: Iterable[Optional[int]]):
+    """Drop cached objects once the current transaction commits."""
+    keys = [_key(kind, pk) for pk in ids if pk is not None]
+    if keys:
+        transaction.on_commit(lambda: object_cache().delete_many(keys))
+
+
+@receiver(post_save, sender=Share)
+@receiver(post_delete, sender=Share)
+def _share_changed(sender, instance, **kwargs):
+    invalidate('shares', (instance.pk,))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _user_changed(sender, instance, **kwargs):
+    invalidate('users', (instance.pk,))
+
+
+@receiver(pre_delete, sender=Share)
+def _share_deleting(sender, instance, **kwargs):
+    # The users list their shares, and the memberships are gone after deletion
+    invalidate('users', instance.users.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=User)
+def _user_deleting(sender, instance, **kwargs):
+    invalidate('shares', instance.share_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def _expense_changed(sender, instance, update_fields=None, **kwargs):
+    invalidate('expenses', (instance.pk,))
+    # Shares list their expenses and total, users the expenses they paid,
+    # both before and after an expense moves
+    if update_fields is None or update_fields & {'share', 'total'}:
+        invalidate('shares', {instance.share_id, instance.stored('share_id')})
+    if update_fields is None or 'paid_by' in update_fields:
+        invalidate('users', {instance.paid_by_id, instance.stored('paid_by_id')})
+
+
+@receiver(post_save, sender=ExpenseRatio)
+@receiver(post_delete, sender=ExpenseRatio)
+def _ratio_changed(sender, instance, **kwargs):
+    invalidate('expenses', (instance.expense_id,))
+    invalidate('users', (instance.user_id,))
+
+
+@receiver(ratios_changed)
+def _split_changed(sender, instance, user_ids, **kwargs):
+    # Equal splits have no ``ExpenseRatio`` to send ``post_save``
+    invalidate('expenses', (instance.pk,))
+    invalidate('users', user_ids)
+
+
+@receiver(expenses_changed)
+def _expenses_changed(sender, expenses, **kwargs):
+    invalidate('expenses', (expense_id for expense_id, _ in expenses))
+
+
+@receiver(m2m_changed, sender=Share.users.through)
+def _membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if action == 'pre_clear':
+        related = instance.share_set if reverse else instance.users
+        pk_set = related.values_list('id', flat=True)
+    if reverse:
+        invalidate('users', (instance.pk,))
+        invalidate('shares', pk_set)
+    else:
+        invalidate('shares', (instance.pk,))
+        invalidate('users', pk_set)
@@ -0,0 +1,200 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Read only serializers that skip model instances and DRF field machinery.
+
+A reader fetches exactly the columns it needs with ``values_list``, fetches
+each relation with one query for all rows, and converts whole columns at
+once. The output is the same as the matching ``ModelSerializer`` with its
+``setup_queryset``, and can be passed to ``core.dumps`` as is.
+"""
+
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db.models import Expression, F, QuerySet, Value
+
+from core import MONEY
+from .archive import share_total
+from .models import Expense, ExpenseParticipant, ExpenseRatio, Share
+from .serializers import ExpenseSerializer, ShareSerializer, UserSerializer
+
+Relation = Callable[[List[int]], Dict[int, Any]]
+
+
+def _timestamp(value) -> Optional[int]:
+    """Same as ``UnixTimeStamp.to_representation``"""
+    return int(value.timestamp()) if value else None
+
+
+def _money(value) -> float:
+    """Same as ``ShareSerializer.get_total``"""
+    return float(round(value or 0, MONEY['decimal_places']))
+
+
+def _group(pairs: Iterable[Tuple[int, Any]]) -> Dict[int, list]:
+    res = defaultdict(list)
+    for key, val in pairs:
+        res[key].append(val)
+    return res
+
+
+def _group_ratios(rows: Iterable[Tuple[int, int, int, int]]) -> Dict[int, dict]:
+    res = defaultdict(dict)
+    for key, ratio_key, top, bot in rows:
+        res[key][ratio_key] = f'{top}/{bot}'
+    return res
+
+
+def _split_rows(ratios: QuerySet, participants: QuerySet) -> Iterator[Tuple[int, int, int, int]]:
+    """
+    Read ``ExpenseRatio`` and ``ExpenseParticipant`` rows with one query,
+    ratios by ID and then participants by expense and user.
+
+    :return: (expense ID, user ID, numerator, denominator) rows.
+    """
+    ratios = ratios.annotate(kind=Value(0), key=F('id')).values_list(
+        'kind', 'key', 'expense_id', 'user_id', 'numerator', 'denominator')
+    participants = participants.with_parts().annotate(
+        kind=Value(1), key=F('expense_id'), numerator=Value(1)).values_list(
+        'kind', 'key', 'expense_id', 'user_id', 'numerator', 'parts')
+    for _, _, expense_id, user_id, top, bot in \
+            ratios.union(participants, all=True).order_by('kind', 'key', 'user_id'):
+        yield expense_id, user_id, top, bot
+
+
+def _expense_ratios(ids: List[int]) -> Dict[int, dict]:
+    """Mirrors ``Expense.paid_for``"""
+    return _group_ratios(_split_rows(ExpenseRatio.objects.filter(expense_id__in=ids),
+                                     ExpenseParticipant.objects.filter(expense_id__in=ids)))
+
+
+def _user_ratios(ids: List[int]) -> Dict[int, dict]:
+    """Mirrors ``User.paid_for``"""
+    rows = _split_rows(ExpenseRatio.objects.filter(user_id__in=ids),
+                       ExpenseParticipant.objects.filter(user_id__in=ids))
+    return _group_ratios((user_id, expense_id, top, bot)
+                         for expense_id, user_id, top, bot in rows)
+
+
+class Reader:
+    """
+    Base class for readers.
+
+    Subclasses define:
+        serializer_class: The ``ModelSerializer`` this reader mirrors.
+        converters: Mapping of column field name to a function that converts
+                    one value.
+        annotations: Mapping of field name to an annotation expression,
+                     the annotated value is then treated as a column.
+        relations: Mapping of field name to a function that takes a list of
+                   primary keys and returns {primary key: value}
+        defaults: Mapping of relation field name to a factory for the value
+                  of rows missing from the relation.
+
+    :param fields: The fields to serialize, defaults to all fields.
+    """
+    serializer_class = None
+    converters: Dict[str, Callable[[Any], Any]] = {
+        'created_at': _timestamp,
+        'updated_at': _timestamp,
+    }
+    annotations: Dict[str, Expression] = {}
+    relations: Dict[str, Relation] = {}
+    defaults: Dict[str, Callable[[], Any]] = {}
+
+    def __init__(self, fields: Optional[Iterable[str]] = None):
+        all_fields = self.serializer_class.Meta.fields
+        if fields is None:
+            self.fields = tuple(all_fields)
+        else:
+            fields = set(fields)
+            self.fields = tuple(f for f in all_fields if f in fields)
+
+    def serialize(self, queryset: QuerySet) -> List[dict]:
+        """
+        Serialize a QuerySet.
+
+        :param queryset: The QuerySet to serialize.
+        :return: A list of dicts, one per row.
+        """
+        columns = [f for f in self.fields if f not in self.relations]
+        annotations = {f'_{f}': self.annotations[f] for f in columns if f in self.annotations}
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        select = ['id'] + [f'_{f}' if f in self.annotations else f for f in columns]
+        rows = list(queryset.values_list(*select))
+        if not rows:
+            return []
+        ids, *values = zip(*rows)
+        ids = list(ids)
+        values = dict(zip(columns, values))
+        result_columns = []
+        for name in self.fields:
+            if name in self.relations:
+                related = self.relations[name](ids)
+                default = self.defaults.get(name, list)
+                result_columns.append([related.get(pk) or default() for pk in ids])
+            else:
+                convert = self.converters.get(name)
+                col = values[name]
+                result_columns.append(col if convert is None else list(map(convert, col)))
+        names = self.fields
+        return [dict(zip(names, row)) for row in zip(*result_columns)]
+
+
+class UserReader(Reader):
+    serializer_class = UserSerializer
+    relations = {
+        'shares': lambda ids: _group(
+            Share.users.through.objects.filter(user_id__in=ids)
+            .order_by('share_id').values_list('user_id', 'share_id')
+        ),
+        'paid_by': lambda ids: _group(
+            Expense.objects.filter(paid_by_id__in=ids)
+            .order_by('id').values_list('paid_by_id', 'id')
+        ),
+        'paid_for': _user_ratios,
+        # Mirrors ``User.balance``
+        'balance': lambda ids: {},
+    }
+    defaults = {'paid_for': dict, 'balance': dict}
+
+
+class ShareReader(Reader):
+    serializer_class = ShareSerializer
+    converters = dict(Reader.converters, total=_money)
+    annotations = {'total': share_total()}
+    relations = {
+        'users': lambda ids: _group(
+            Share.users.through.objects.filter(share_id__in=ids)
+            .order_by('user_id').values_list('share_id', 'user_id')
+        ),
+        'expenses': lambda ids: _group(
+            Expense.objects.filter(share_id__in=ids).order_by('id').values_list('share_id', 'id')
+        ),
+    }
+
+
+class ExpenseReader(Reader):
+    serializer_class = ExpenseSerializer
+    converters = dict(Reader.converters, total=float)
+    relations = {
+        'paid_for': _expense_ratios,
+    }
+    defaults = {'paid_for': dict}
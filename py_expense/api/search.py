@@ -0,0 +1,230 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Full-text search over expense and share descriptions.
+
+Each query word is matched as a prefix and every word must match. The
+search backend depends on the database:
+
+    PostgreSQL: A GIN index on ``to_tsvector('simple', description)``,
+                ranked with ``ts_rank``
+    SQLite: An FTS5 inverted index kept in sync by triggers, ranked with bm25
+    Others: A regex scan of the descriptions, unranked
+
+The indexes are created after ``migrate``, by ``install_search``, since they
+can't be declared on the models without breaking the other databases.
+"""
+
+from re import escape, findall
+from typing import Iterable, List, Optional, Tuple
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, QuerySet, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Expense, ExpenseRatio, Share, participates
+
+SEARCHABLE = {'expense': Expense, 'share': Share}
+
+Ranked = List[Tuple[int, float]]
+
+
+def terms(query: str) -> List[str]:
+    """Split a search query into lower case words."""
+    return findall(r'\w+', query.lower())
+
+
+class SearchBackend:
+    """
+    Base search backend, scans descriptions with a regex
+    """
+
+    def install(self, connection):
+        """Create the search indexes on a database connection."""
+        pass
+
+    def search(self, queryset: QuerySet, words: List[str], limit: int) -> Ranked:
+        """
+        Search the descriptions of the objects in a QuerySet.
+
+        :param queryset: The objects to search.
+        :param words: The query words, see ``terms``
+        :param limit: The maximum number of results.
+        :return: The best ``limit`` matches as (id, rank), best first.
+        """
+        for word in words:
+            queryset = queryset.filter(description__iregex=rf'(^|\W){escape(word)}')
+        return list(queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+                    .order_by('-id').values_list('id', 'rank')[:limit])
+
+
+class PostgresSearchBackend(SearchBackend):
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            for model in SEARCHABLE.values():
+                table = model._meta.db_table
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_description_fts ON {table} '
+                    f"USING gin (to_tsvector('simple', description))"
+                )
+
+    def search(self, queryset: QuerySet, words: List[str], limit: int) -> Ranked:
+        # Must be the same expression as the index to use it
+        vector = f"to_tsvector('simple', \"{queryset.model._meta.db_table}\".description)"
+        query = ' & '.join(f'{word}:*' for word in words)
+        return list(
+            queryset.filter(RawSQL(f"{vector} @@ to_tsquery('simple', %s)", [query],
+                                   output_field=BooleanField()))
+            .annotate(rank=RawSQL(f"ts_rank({vector}, to_tsquery('simple', %s))", [query],
+                                  output_field=FloatField()))
+            .order_by('-rank', 'id').values_list('id', 'rank')[:limit]
+        )
+
+
+class SqliteSearchBackend(SearchBackend):
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            for model in SEARCHABLE.values():
+                table = model._meta.db_table
+                fts = f'{table}_fts'
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [fts])
+                exists = cursor.fetchone() is not None
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING '
+                    f"fts5(description, content='{table}', content_rowid='id')"
+                )
+                cursor.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN '
+                    f'INSERT INTO {fts}(rowid, description) VALUES (new.id, new.description); '
+                    f'END'
+                )
+                cursor.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN '
+                    f"INSERT INTO {fts}({fts}, rowid, description) "
+                    f"VALUES ('delete', old.id, old.description); "
+                    f'END'
+                )
+                cursor.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF description '
+                    f'ON {table} BEGIN '
+                    f"INSERT INTO {fts}({fts}, rowid, description) "
+                    f"VALUES ('delete', old.id, old.description); "
+                    f'INSERT INTO {fts}(rowid, description) VALUES (new.id, new.description); '
+                    f'END'
+                )
+                if not exists:
+                    cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def search(self, queryset: QuerySet, words: List[str], limit: int) -> Ranked:
+        fts = f'{queryset.model._meta.db_table}_fts'
+        match = ' '.join(f'"{word}"*' for word in words)
+        sql = f'SELECT rowid, -bm25({fts}) FROM {fts} WHERE {fts} MATCH %s'
+        params = [match]
+        if queryset.query.where:
+            scope, scope_params = queryset.values('id').query.sql_with_params()
+            # The unary + stops SQLite from handing the rowid constraint to
+            # FTS5, which would run the full-text query once per scoped row.
+            sql += f' AND +rowid IN ({scope})'
+            params.extend(scope_params)
+        sql += f' ORDER BY bm25({fts}), rowid LIMIT %s'
+        params.append(limit)
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SqliteSearchBackend,
+}
+
+
+def get_search_backend(using: str = 'default') -> SearchBackend:
+    """:return: The search backend for a database."""
+    return _BACKENDS.get(connections[using].vendor, SearchBackend)()
+
+
+def install_search(using: str = 'default', **kwargs):
+    """Create the search indexes, connected to ``post_migrate``"""
+    get_search_backend(using).install(connections[using])
+
+
+def scope(kind: str, share_id: Optional[int] = None,
+          user_id: Optional[int] = None) -> QuerySet:
+    """
+    The objects of a kind within a share and/or visible to a user.
+
+    Expenses are visible to the user who paid them and the users they are
+    paid for, shares to their users.
+    """
+    if kind == 'expense':
+        queryset = Expense.objects.all()
+        if share_id is not None:
+            queryset = queryset.filter(share_id=share_id)
+        if user_id is not None:
+            paid_for = ExpenseRatio.objects.filter(user_id=user_id).values('expense_id')
+            queryset = queryset.filter(Q(paid_by_id=user_id) | Q(id__in=paid_for)
+                                       | participates([user_id]))
+    else:
+        queryset = Share.objects.all()
+        if share_id is not None:
+            queryset = queryset.filter(id=share_id)
+        if user_id is not None:
+            queryset = queryset.filter(users__id=user_id)
+    return queryset
+
+
+_HIT_FIELDS = {
+    'expense': ('id', 'share', 'description'),
+    'share': ('id', 'name', 'description'),
+}
+
+
+def search(query: str, kinds: Iterable[str] = tuple(SEARCHABLE), *,
+           share_id: Optional[int] = None, user_id: Optional[int] = None,
+           limit: int = 50) -> List[dict]:
+    """
+    Search expense and share descriptions.
+
+    :param query: The search query.
+    :param kinds: What to search, any of ``SEARCHABLE``
+    :param share_id: Only search within this share.
+    :param user_id: Only search what this user can see.
+    :param limit: The maximum number of hits.
+    :return: The hits, best first. Each hit has a ``type`` and a ``rank``
+             plus the fields in ``_HIT_FIELDS``
+    """
+    words = terms(query)
+    if not words:
+        return []
+    backend = get_search_backend()
+    hits = []
+    for kind in kinds:
+        ranked = backend.search(scope(kind, share_id, user_id), words, limit)
+        if not ranked:
+            continue
+        fields = _HIT_FIELDS[kind]
+        rows = {row[0]: row for row in SEARCHABLE[kind].objects
+                .filter(id__in=[pk for pk, _ in ranked]).values_list(*fields)}
+        hits.extend(
+            {'type': kind, **dict(zip(fields, rows[pk])), 'rank': rank}
+            for pk, rank in ranked if pk in rows
+        )
+    hits.sort(key=lambda hit: -hit['rank'])
+    return hits[:limit]
@@ -15,12 +15,22 @@
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
 
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Prefetch, QuerySet
+from django.utils.functional import cached_property
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework.fields import SkipField
+from rest_framework.relations import MANY_RELATION_KWARGS, PKOnlyObject
 from rest_framework.serializers import ModelSerializer
 
-from .models import Expense, Share, User
+from core import MONEY, get_loader, loader_scope
+from .archive import share_total
+from .membership import is_member
+from .models import Expense, ExpenseParticipant, ExpenseRatio, Share, User, is_equal_split
+from .signals import expense_changed
 from .validators import validate_expense_ratio, validate_shares, validate_users
 
 _base_fields = ('id', 'created_at', 'updated_at')
@@ -51,24 +61,294 @@ class UnixTimeStamp(serializers.IntegerField, serializers.DateTimeField):
         return int(value.timestamp())
 
 
-def update_attrs(instance, validated_data, *, key_set=None, exclude_set=None):
+class IdListField(serializers.ReadOnlyField):
+    """
+    Represent a QuerySet of models as a list of their IDs.
+    """
+
+    def to_representation(self, value):
+        return [obj.pk for obj in value]
+
+
+class RatioField(serializers.ReadOnlyField):
+    """
+    Represent a QuerySet of ``ExpenseRatio`` as {key: 'numerator/denominator'}
+
+    :param key: The ``ExpenseRatio`` attribute to use as the mapping key.
+    """
+
+    def __init__(self, key: str, **kwargs):
+        self.key = key
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return {getattr(r, self.key): f'{r.numerator}/{r.denominator}' for r in value}
+
+
+class LoadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    A ``PrimaryKeyRelatedField`` that looks instances up with the
+    ``Loader`` of the request, so lookups queued by a list serializer or a
+    many related field are done with one query per model.
+
+    Instances are looked up with the default manager of the queryset's model.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return LoadedManyRelatedField(**list_kwargs)
+
+    def queue(self, values: Iterable):
+        """Queue primary keys to be loaded with the next lookup."""
+        loader = get_loader()
+        model = self.get_queryset().model
+        for value in values:
+            if isinstance(value, (int, str)) and not isinstance(value, bool):
+                try:
+                    loader.queue(model, (value,))
+                except DjangoValidationError:
+                    # Reported by ``to_internal_value``
+                    pass
+
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        if isinstance(data, bool) or not isinstance(data, (int, str)):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            instance = get_loader().load(self.get_queryset().model, data)
+        except DjangoValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
+class LoadedManyRelatedField(serializers.ManyRelatedField):
+    """
+    Many ``LoadedPrimaryKeyRelatedField``, all looked up with one query.
+    """
+
+    @loader_scope()
+    def to_internal_value(self, data):
+        if isinstance(data, (list, tuple)):
+            self.child_relation.queue(data)
+        return super().to_internal_value(data)
+
+
+def queue_related(serializer: serializers.Serializer, items: Iterable):
+    """
+    Queue the related primary keys of data to be validated by a serializer,
+    so they are looked up with one query per model.
+
+    :param serializer: The serializer.
+    :param items: The data of each instance, items that aren't dicts are skipped.
+    """
+    related = [(name, field) for name, field in serializer.fields.items()
+               if not field.read_only]
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        for name, field in related:
+            if name not in item:
+                continue
+            if isinstance(field, LoadedPrimaryKeyRelatedField):
+                field.queue((item[name],))
+            elif isinstance(field, LoadedManyRelatedField) and \
+                    isinstance(item[name], (list, tuple)):
+                field.child_relation.queue(item[name])
+
+
+def _is_prepared(queryset: QuerySet) -> bool:
+    return bool(queryset._prefetch_related_lookups or queryset.query.annotations
+                or queryset.query.deferred_loading[0])
+
+
+class LoaderListSerializer(serializers.ListSerializer):
+    """
+    List serializer that batches the lookups of its items.
+
+    Before validation, the related primary keys of every item are queued, so
+    each related model is looked up with one query for the whole list. A
+    QuerySet that hasn't been prepared is prepared with the child's
+    ``setup_queryset`` before serialization, so the number of queries does
+    not grow with the number of rows.
+    """
+
+    @loader_scope()
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            queue_related(self.child, data)
+        return super().to_internal_value(data)
+
+    def to_representation(self, data):
+        setup = getattr(self.child, 'setup_queryset', None)
+        if isinstance(data, QuerySet) and setup is not None and not _is_prepared(data):
+            data = setup(data, list(self.child.fields))
+        return super().to_representation(data)
+
+
+class SparseFieldsMixin:
+    """
+    Allow a serializer to only serialize a subset of its fields.
+
+    Pass ``fields`` to the serializer to drop every other field before
+    evaluation, and use ``setup_queryset`` to only query what those fields
+    need.
+
+    ``query_plan`` maps a field name to a function that prepares a QuerySet
+    for that field, e.g. with a prefetch or an annotation.
+
+    ``query_columns`` maps a field name to the columns it's computed from,
+    besides its query plan.
+    """
+    query_plan: Dict[str, Callable[[QuerySet], QuerySet]] = {}
+    query_columns: Dict[str, Tuple[str, ...]] = {}
+
+    def __init__(self, *args, fields: Optional[Iterable[str]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            fields = set(fields)
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+    @classmethod
+    def setup_queryset(cls, queryset: QuerySet,
+                       fields: Optional[Iterable[str]] = None) -> QuerySet:
+        """
+        Prepare a QuerySet for serialization.
+
+        Only the columns, prefetches and annotations needed by ``fields``
+        are added to the QuerySet.
+
+        :param queryset: The QuerySet to be serialized.
+        :param fields: The fields to be serialized, defaults to all fields.
+        :return: The prepared QuerySet.
+        """
+        fields = cls.Meta.fields if fields is None else fields
+        opts = cls.Meta.model._meta
+        columns = {'id'}
+        for name in fields:
+            columns.update(cls.query_columns.get(name, ()))
+            plan = cls.query_plan.get(name)
+            if plan is not None:
+                queryset = plan(queryset)
+                continue
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete and not field.many_to_many:
+                columns.add(name)
+        return queryset.only(*columns)
+
+
+class PlainRepresentationMixin:
+    """
+    Represent instances as plain dicts instead of ``OrderedDict``, and only
+    compute the readable fields once per serializer instead of once per
+    instance. The output can be passed to ``core.dumps`` as is.
+    """
+
+    @cached_property
+    def _plain_fields(self):
+        return [(field.field_name, field) for field in self._readable_fields]
+
+    def to_representation(self, instance):
+        ret = {}
+        for name, field in self._plain_fields:
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                continue
+            check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+            ret[name] = None if check_for_none is None else field.to_representation(attribute)
+        return ret
+
+
+def _prefetch_ids(lookup: str, ModelCls, *extra: str) -> Callable[[QuerySet], QuerySet]:
+    """
+    Prefetch a relation in ID order, only loading the columns needed for
+    representation.
+    """
+    return lambda qs: qs.prefetch_related(
+        Prefetch(lookup, queryset=ModelCls.objects.only('id', *extra).order_by('id'))
+    )
+
+
+_ratio_columns = ('user', 'expense', 'numerator', 'denominator')
+
+
+def _prefetch_paid_for(lookup: str, participations: Prefetch) -> Callable[[QuerySet], QuerySet]:
+    """
+    Prefetch the ratios of ``paid_for``, and the participations of equal
+    splits, which have no ``ExpenseRatio``
+    """
+    ratios = _prefetch_ids(lookup, ExpenseRatio, *_ratio_columns)
+    return lambda qs: ratios(qs).prefetch_related(participations)
+
+
+def update_attrs(instance, validated_data, *, key_set=None, exclude_set=None,
+                 touch=False) -> Set[str]:
+    """
+    Set the attributes of a model instance from validated data, then save
+    only the fields that changed, along with ``updated_at``. Nothing is
+    written if no field changed.
+
+    :param touch: Save ``updated_at`` even if no field changed, e.g. because
+                  a relation of the instance changed.
+    :return: The names of the fields that changed.
+    """
+    changed = set()
     for key, val in validated_data.items():
         if key_set is not None and key not in key_set:
             continue
         if exclude_set is not None and key in exclude_set:
             continue
+        field = instance._meta.get_field(key)
+        old = field.value_from_object(instance)
         setattr(instance, key, val)
-    instance.save()
+        if field.value_from_object(instance) != old:
+            changed.add(key)
+    if changed or touch:
+        instance.save(update_fields=changed | {'updated_at'})
+    return changed
 
 
-class UserSerializer(ReadonlyMixin, ModelSerializer):
+def _ratio_users(ratios: Dict) -> Dict[User, tuple]:
+    """{user ID: ratio} -> {User: ratio}, the users are known to exist."""
+    users = get_loader().load_many(User, ratios)
+    return {users[User._meta.pk.to_python(key)]: ratio for key, ratio in ratios.items()}
+
+
+class UserSerializer(SparseFieldsMixin, PlainRepresentationMixin, ReadonlyMixin,
+                     ModelSerializer):
     created_at = UnixTimeStamp(read_only=True)
     updated_at = UnixTimeStamp(read_only=True)
+    shares = IdListField()
+    paid_by = IdListField()
+    paid_for = RatioField('expense_id')
+
+    query_plan = {
+        'shares': _prefetch_ids('share_set', Share),
+        'paid_by': _prefetch_ids('expense_set', Expense, 'paid_by'),
+        # See ``User.paid_for``
+        'paid_for': _prefetch_paid_for('expenseratio_set', Prefetch(
+            'expenseparticipant_set', to_attr='participations',
+            queryset=ExpenseParticipant.objects.with_parts().order_by('expense_id'))),
+    }
+
+    serializer_related_field = LoadedPrimaryKeyRelatedField
 
     class Meta:
         model = User
         fields = _base_fields + ('name', 'shares', 'paid_by', 'paid_for', 'balance')
         read_only_fields = _base_fields + ('paid_by', 'paid_for', 'balance')
+        list_serializer_class = LoaderListSerializer
 
     def to_internal_value(self, data):
         data = data.copy()
@@ -100,29 +380,45 @@ class UserSerializer(ReadonlyMixin, ModelSerializer):
         :return: The updated ``User`` instance.
         """
         new_shares = validated_data.get('shares')
+        shares_changed = False
         if new_shares is not None:
             new_shares = set(new_shares)
             old_shares = set(instance.shares)
             for to_add in new_shares - old_shares:
                 to_add.users.add(instance)
-                to_add.save()
+                to_add.save(update_fields=['updated_at'])
             for to_del in old_shares - new_shares:
                 to_del.users.remove(instance)
-                to_del.save()
-        update_attrs(instance, validated_data, key_set={'name'})
+                to_del.save(update_fields=['updated_at'])
+            shares_changed = new_shares != old_shares
+        update_attrs(instance, validated_data, key_set={'name'}, touch=shares_changed)
         return instance
 
 
-class ShareSerializer(ReadonlyMixin, ModelSerializer):
+class ShareSerializer(SparseFieldsMixin, PlainRepresentationMixin, ReadonlyMixin,
+                      ModelSerializer):
     created_at = UnixTimeStamp(read_only=True)
     updated_at = UnixTimeStamp(read_only=True)
+    expenses = IdListField()
+    total = serializers.SerializerMethodField()
+
+    query_plan = {
+        'users': _prefetch_ids('users', User),
+        'expenses': _prefetch_ids('expense_set', Expense, 'share'),
+        'total': lambda qs: qs.annotate(total_sum=share_total()),
+    }
+
+    serializer_related_field = LoadedPrimaryKeyRelatedField
 
     class Meta:
         model = Share
         fields = _base_fields + ('name', 'description', 'users', 'expenses', 'total')
         read_only_fields = _base_fields + ('total', 'expenses')
         extra_kwargs = {'users': {'allow_empty': True}}
+        list_serializer_class = LoaderListSerializer
 
+    # The users field and ``validate_users`` share one lookup
+    @loader_scope()
     def to_internal_value(self, data):
         data = data.copy()
         ret = super()._read_only(data)
@@ -130,6 +426,12 @@ class ShareSerializer(ReadonlyMixin, ModelSerializer):
             ret['users'] = validate_users(data['users'])
         return ret
 
+    def get_total(self, instance):
+        # Annotated by ``setup_queryset``
+        if hasattr(instance, 'total_sum'):
+            return float(round(instance.total_sum or 0, MONEY['decimal_places']))
+        return instance.total
+
     def create(self, validated_data):
         """
         Create a new ``Share``
@@ -172,24 +474,40 @@ class ShareSerializer(ReadonlyMixin, ModelSerializer):
         :return: The updated ``Share`` instance
         """
         users = validated_data.get('users')
+        users_changed = False
         if users is not None:
-            instance.users.clear()
-            for user in users:
-                instance.users.add(user)
-        update_attrs(instance, validated_data, exclude_set={'users'})
+            old_ids = set(instance.users.values_list('id', flat=True))
+            users_changed = {user.id for user in users} != old_ids
+            if users_changed:
+                instance.users.set(users)
+        update_attrs(instance, validated_data, exclude_set={'users'}, touch=users_changed)
         return instance
 
 
-class ExpenseSerializer(ReadonlyMixin, ModelSerializer):
+class ExpenseSerializer(SparseFieldsMixin, PlainRepresentationMixin, ReadonlyMixin,
+                        ModelSerializer):
     created_at = UnixTimeStamp(required=False)
     updated_at = UnixTimeStamp(read_only=True)
+    paid_for = RatioField('user_id')
+
+    query_plan = {
+        'paid_for': _prefetch_paid_for('expenseratio_set', Prefetch(
+            'expenseparticipant_set', queryset=ExpenseParticipant.objects.order_by('user_id'))),
+    }
+    # See ``Expense.paid_for``
+    query_columns = {'paid_for': ('split',)}
+
+    serializer_related_field = LoadedPrimaryKeyRelatedField
 
     class Meta:
         model = Expense
         fields = _base_fields + ('description', 'share', 'total',
                                  'paid_by', 'paid_for', 'resolved')
         read_only_fields = ('id', 'updated_at')
+        list_serializer_class = LoaderListSerializer
 
+    # The share field and ``validate_shares`` share one lookup
+    @loader_scope()
     def to_internal_value(self, data):
         data = data.copy()
         errors = {}
@@ -199,11 +517,15 @@ class ExpenseSerializer(ReadonlyMixin, ModelSerializer):
         if share_id is not None:
             share, = validate_shares([share_id])
         else:
-            share = self.fields['share']
+            # A partial update checks against the current share
+            share = getattr(self.instance, 'share', None)
 
         ratio = data.get('paid_for')
         ret = super()._read_only(data)
 
+        if share is None and (ratio is not None or ret.get('paid_by') is not None):
+            raise ValidationError({'share': 'This field is required.'})
+
         if ratio is not None:
             if not ratio:
                 errors['paid_for'] = 'Cannot be empty.'
@@ -212,13 +534,13 @@ class ExpenseSerializer(ReadonlyMixin, ModelSerializer):
                 if not validate:
                     errors.update(ratio_res)
                 else:
-                    data['paid_for'] = ratio_res
+                    ret['paid_for'] = _ratio_users(ratio_res)
             else:
                 errors['paid_for'] = 'Must be a dict.'
 
         paid_by = ret.get('paid_by')
         if paid_by is not None:
-            if share not in paid_by.shares:
+            if not is_member(share.id, paid_by.id):
                 errors['paid_by'] = f'Paid by user with ID {paid_by.id} must be in the share.'
         if errors:
             raise ValidationError(errors)
@@ -231,9 +553,6 @@ class ExpenseSerializer(ReadonlyMixin, ModelSerializer):
         total = res.get('total')
         if total is not None:
             res['total'] = float(total)
-        ratios = res.get('paid_for')
-        if ratios is not None:
-            res['paid_for'] = {r.user.id: f"{r.numerator}/{r.denominator}" for r in ratios}
         return res
 
     def create(self, validated_data):
@@ -254,6 +573,9 @@ class ExpenseSerializer(ReadonlyMixin, ModelSerializer):
 
                       It should be in the form {User: (numerator, denominator)}
 
+                      If every ratio is 1/N, N being the number of users,
+                      the expense is split equally with ``ExpenseParticipant``
+
         It may contain two optional fields:
 
             created_at: The creation datetime of the expense, if not provided
@@ -266,6 +588,8 @@ class ExpenseSerializer(ReadonlyMixin, ModelSerializer):
         """
         validated_data = validated_data.copy()
         paid_for = validated_data.pop('paid_for')
+        if is_equal_split(paid_for.values()):
+            return Expense.new(participants=list(paid_for), **validated_data)
         return Expense.new(paid_for=paid_for, **validated_data)
 
     def update(self, instance, validated_data):
@@ -293,8 +617,19 @@ class ExpenseSerializer(ReadonlyMixin, ModelSerializer):
 
         :return: The updated expense instance.
         """
+        was_resolved = instance.resolved
         paid_for = validated_data.get('paid_for')
+        changed = set()
         if paid_for is not None:
-            instance.generate_ratio(paid_for)
-        update_attrs(instance, validated_data, exclude_set={'paid_for'})
+            new_ratios = {user.id: tuple(ratio) for user, ratio in paid_for.items()}
+            if new_ratios != instance.ratios():
+                if is_equal_split(new_ratios.values()):
+                    instance.split_equally(paid_for)
+                else:
+                    instance.generate_ratio(paid_for)
+                changed.add('paid_for')
+        changed |= update_attrs(instance, validated_data, exclude_set={'paid_for'})
+        if changed:
+            event = 'resolved' if instance.resolved and not was_resolved else 'updated'
+            expense_changed.send(sender=Expense, instance=instance, event=event, fields=changed)
         return instance
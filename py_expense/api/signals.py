@@ -0,0 +1,34 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Signals sent by the API write paths"""
+
+from django.dispatch import Signal
+
+# Sent with ``instance`` and ``event``, one of created/updated/resolved,
+# after an expense is written through ``Expense.new`` or ``ExpenseSerializer``.
+# Updates also send ``fields``, the names of the fields that changed, and
+# are not sent if nothing changed
+expense_changed = Signal()
+
+# Sent with ``expenses``, a list of (ID, share ID), and ``event`` after
+# expenses are updated in bulk by ``ExpenseQuerySet``, which sends no
+# ``post_save``
+expenses_changed = Signal()
+
+# Sent with ``instance`` and ``user_ids``, the users whose part of the
+# expense changed, after ``Expense.generate_ratio`` or ``Expense.split_equally``
+ratios_changed = Signal()
@@ -0,0 +1,157 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Per member totals of a share.
+
+For each user in a share, or with expenses in it, ``share_summary`` adds up
+what they paid, the totals of the expenses they paid, and what they owe,
+their part of every expense by its ratio or split equally, including archived expenses
+through ``ArchiveSummary``. It's computed with one query and cached in the
+object cache, see ``api.multiget``, until an expense or membership of the
+share changes.
+"""
+
+from typing import Any, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (BooleanField, DecimalField, ExpressionWrapper, F, FloatField,
+                              OuterRef, Q, Subquery, Sum, Value)
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core import MONEY
+from .models import ArchiveSummary, Expense, ExpenseParticipant, ExpenseRatio, Share, User
+from .multiget import object_cache
+from .signals import expenses_changed
+
+Membership = Share.users.through
+
+
+def _key(share_id: int) -> str:
+    return f'summary:share:{share_id}'
+
+
+def _total(queryset, value) -> Coalesce:
+    # The sum of ``value`` over the rows of the user, grouped by user
+    total = (queryset.values('user_id')
+             .annotate(total=Sum(value, output_field=DecimalField(**MONEY))).values('total'))
+    return Coalesce(Subquery(total), Value(0), output_field=DecimalField(**MONEY))
+
+
+def _money(value) -> float:
+    return float(round(value, MONEY['decimal_places']))
+
+
+def summary_queryset(share_id: int):
+    """
+    The users of a share, and users with expenses in it, annotated with
+    ``paid``, ``owed`` and ``is_member``, in one query.
+    """
+    paid = Expense.objects.filter(share_id=share_id, paid_by_id=OuterRef('pk')).annotate(
+        user_id=F('paid_by_id'))
+    owed = ExpenseRatio.objects.filter(expense__share_id=share_id, user_id=OuterRef('pk'))
+    equal = ExpenseParticipant.objects.filter(
+        expense__share_id=share_id, user_id=OuterRef('pk')).with_parts()
+    archived = ArchiveSummary.objects.filter(share_id=share_id, user_id=OuterRef('pk'))
+    members = Membership.objects.filter(share_id=share_id).values('user_id')
+    return User.objects.filter(
+        Q(id__in=members)
+        | Q(id__in=Expense.objects.filter(share_id=share_id).values('paid_by_id'))
+        | Q(id__in=ExpenseRatio.objects.filter(expense__share_id=share_id).values('user_id'))
+        | Q(id__in=ArchiveSummary.objects.filter(share_id=share_id).values('user_id'))
+        | Q(id__in=ExpenseParticipant.objects.filter(expense__share_id=share_id).values('user_id'))
+    ).annotate(
+        paid=_total(paid, 'total') + _total(archived, 'paid'),
+        # Cast so SQLite doesn't divide integers
+        owed=_total(owed, F('expense__total') * F('numerator')
+                    / Cast('denominator', FloatField()))
+        + _total(equal, F('expense__total') / Cast('parts', FloatField()))
+        + _total(archived, 'owed'),
+        is_member=ExpressionWrapper(Q(id__in=members), output_field=BooleanField()),
+    ).order_by('id').values_list('id', 'is_member', 'paid', 'owed')
+
+
+def compute_summary(share_id: int) -> Dict[str, Any]:
+    """
+    Compute the summary of a share, see ``share_summary``
+    """
+    members = []
+    for user_id, is_member, paid, owed in summary_queryset(share_id):
+        paid, owed = _money(paid), _money(owed)
+        members.append({'user': user_id, 'member': is_member, 'paid': paid, 'owed': owed,
+                        'net': round(paid - owed, MONEY['decimal_places'])})
+    return {'share': share_id, 'members': members}
+
+
+def share_summary(share_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Get the per member totals of a share, from the cache when possible.
+
+    :param share_id: ID of the share.
+    :return: ``{'share': ID, 'members': [...]}``, each member with ``user``,
+             ``member``, whether the user is still in the share, ``paid``,
+             ``owed`` and ``net``, paid minus owed. None if there is no
+             share with that ID.
+    """
+    cache = object_cache()
+    key = _key(share_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = compute_summary(share_id)
+        if not summary['members'] and not Share.objects.filter(pk=share_id).exists():
+            return None
+        cache.set(key, summary, timeout=settings.OBJECT_CACHE['TTL'])
+    return summary
+
+
+def invalidate_summaries(share_ids: Iterable[Optional[int]]):
+    """Drop the cached summaries of shares once the current transaction commits."""
+    keys = [_key(pk) for pk in share_ids if pk is not None]
+    if keys:
+        transaction.on_commit(lambda: object_cache().delete_many(keys))
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def _expense_changed(sender, instance, **kwargs):
+    # Ratios are written through ``Expense.generate_ratio``, which saves the
+    # expense. An expense moved to another share leaves its old share too.
+    invalidate_summaries({instance.share_id, instance.stored('share_id')})
+
+
+@receiver(expenses_changed)
+def _expenses_changed(sender, expenses, **kwargs):
+    invalidate_summaries({share_id for _, share_id in expenses})
+
+
+@receiver(post_delete, sender=Share)
+def _share_deleted(sender, instance, **kwargs):
+    invalidate_summaries((instance.pk,))
+
+
+@receiver(m2m_changed, sender=Share.users.through)
+def _membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_summaries((instance.pk,))
+    elif action == 'pre_clear':
+        invalidate_summaries(instance.share_set.values_list('id', flat=True))
+    else:
+        invalidate_summaries(pk_set)
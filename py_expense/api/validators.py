@@ -16,11 +16,13 @@
 
 """Validators for serializers"""
 from fractions import Fraction
+from typing import Iterable, Tuple
 
-from django.core.exceptions import ObjectDoesNotExist
 from rest_framework.exceptions import ValidationError
 
+from api.membership import members_in
 from api.models import Expense, Share, User
+from core.loader import get_loader
 from core.parse import natural_number, pos_int
 
 
@@ -41,13 +43,13 @@ def __validate_id_list(ModelCls, name, value):
     except (TypeError, ValueError) as e:
         raise ValidationError({type(e).__name__: str(e)})
 
-    found = ModelCls.objects.filter(pk__in=id_set)
+    found = get_loader().load_many(ModelCls, id_set)
 
-    if found.count() != len(id_set):
-        diff = id_set - set(f.id for f in found)
-        diff_repr = ', '.join(map(str, diff))
+    if len(found) != len(id_set):
+        diff = id_set - found.keys()
+        diff_repr = ', '.join(map(str, sorted(diff)))
         raise ValidationError({name: f"{ModelCls.__name__} with IDs '{diff_repr}' not found."})
-    return list(found)
+    return [found[pk] for pk in sorted(id_set)]
 
 
 def validate_users(value):
@@ -65,32 +67,53 @@ def validate_shares(value):
     return __validate_id_list(Share, 'shares', value)
 
 
-def _validate_ratio_entry(key, val, share):
-    try:
-        share.users.get(pk=key)
-    except ObjectDoesNotExist:
-        return {'paid_for': f'User with ID {key} is not in the share this expense belongs to.'}, \
-               False
+def parse_ratio(val) -> Tuple[int, int]:
+    """
+    'numerator/denominator' -> (numerator, denominator)
+
+    :raises ValueError: If the format is wrong or either part is not positive.
+    """
     try:
         top, bot = val.split('/')
-    except (ValueError, TypeError):
-        return {'paid_for': "Ratio format must be 'numerator/denominator'"}, False
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError("Ratio format must be 'numerator/denominator'")
     try:
-        top = pos_int(top)
-        bot = pos_int(bot)
+        return pos_int(top), pos_int(bot)
     except (ValueError, TypeError) as e:
+        raise ValueError(str(e))
+
+
+def ratios_sum_to_one(ratios: Iterable[Tuple[int, int]]) -> bool:
+    """Check (numerator, denominator) ratios add up to exactly 1."""
+    return sum(Fraction(*val) for val in ratios) == 1
+
+
+def _user_id(key):
+    try:
+        return natural_number(key)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _validate_ratio_entry(key, val, members):
+    if _user_id(key) not in members:
+        return {'paid_for': f'User with ID {key} is not in the share this expense belongs to.'}, \
+               False
+    try:
+        return parse_ratio(val), True
+    except ValueError as e:
         return {'paid_for': str(e)}, False
-    return (top, bot), True
 
 
 def validate_expense_ratio(data, share):
     res = {}
+    members = members_in(share.id, {_user_id(key) for key in data} - {None})
     for key, val in data.items():
-        entry, success = _validate_ratio_entry(key, val, share)
+        entry, success = _validate_ratio_entry(key, val, members)
         if not success:
             return entry, False
         else:
             res[key] = entry
-    if sum(Fraction(*val) for val in res.values()) != 1:
+    if not ratios_sum_to_one(res.values()):
         return {'paid_for': 'Ratio sum must be 1.'}, False
     return res, True
@@ -14,26 +14,453 @@
 #  You should have received a copy of the GNU Affero General Public License
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from django.http import JsonResponse
+from json import loads
+from typing import Any, Dict, Iterator, Optional, Tuple
 
-from api.models import Share
-from api.serializers import ShareSerializer
-from core import ParamSpec, list_of_naturals, list_of_str, method, uri_params
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
 
+from api.changes import changes_since, cursor
+from api.events import share_channel
+from api.export import FORMATS, export, export_queryset
+from api.merge import merge_users
+from api.models import Expense, Share, User
+from api.multiget import KINDS, multi_get
+from api.readers import ShareReader
+from api.search import SEARCHABLE, search
+from api.serializers import (ExpenseSerializer, ShareSerializer, UnixTimeStamp, UserSerializer,
+                             queue_related)
+from api.summary import share_summary
+from core import (FastJsonResponse, ParamSpec, boolean, cache_stats, comparison, compile_lookups,
+                  epoch, get_broker, get_loader, list_of_naturals, list_of_str, loader_scope,
+                  method, natural_number, one_of, pos_int, sse_event, subset_of, uri_params)
 
-@method(allowed='GET')
-@uri_params(
-    spec=(ParamSpec('name', list_of_str), ParamSpec('id', list_of_naturals)),
-    method='GET'
+Result = Tuple[Dict[str, Any], int]
+
+SHARE_LIST_SPEC = (
+    ParamSpec('name', list_of_str),
+    ParamSpec('id', list_of_naturals),
+    ParamSpec('created_at', comparison(epoch)),
+    ParamSpec('updated_at', comparison(epoch)),
+    ParamSpec('fields', subset_of(ShareSerializer.Meta.fields)),
+)
+
+SHARE_LOOKUP_SPEC = (ParamSpec('name', str), ParamSpec('id', natural_number))
+
+CHANGES_SPEC = (ParamSpec('cursor', cursor), ParamSpec('limit', pos_int))
+
+MAX_CHANGES = 1000
+
+SEARCH_SPEC = (
+    ParamSpec('q', str),
+    ParamSpec('type', subset_of(SEARCHABLE)),
+    ParamSpec('share', natural_number),
+    ParamSpec('user', natural_number),
+    ParamSpec('limit', pos_int),
+)
+
+MAX_SEARCH_RESULTS = 200
+
+EXPORT_SPEC = (
+    ParamSpec('share', natural_number),
+    ParamSpec('user', natural_number),
+    ParamSpec('created_at', comparison(epoch)),
+    ParamSpec('updated_at', comparison(epoch)),
+    ParamSpec('format', one_of(FORMATS)),
 )
+
+RESOLVE_SPEC = (
+    ParamSpec('share', natural_number),
+    ParamSpec('id', list_of_naturals),
+    ParamSpec('created_at', comparison(epoch)),
+    ParamSpec('updated_at', comparison(epoch)),
+    ParamSpec('resolved', boolean),
+)
+
+MERGE_SPEC = (ParamSpec('source', natural_number), ParamSpec('target', natural_number))
+
+OBJECTS_SPEC = tuple(ParamSpec(kind, list_of_naturals) for kind in KINDS)
+
+MAX_OBJECTS = 100
+
+_timestamp = UnixTimeStamp().to_representation
+
+
+class BadRequest(ValueError):
+    """
+    Error raised when a request body cannot be parsed.
+    """
+    pass
+
+
+def json_body(request) -> dict:
+    """
+    Parse a JSON object request body.
+
+    :param request: The request.
+    :return: The parsed JSON object.
+    :raises BadRequest: If the body is not a JSON object.
+    """
+    try:
+        data = loads(request.body or b'{}')
+    except ValueError:
+        raise BadRequest('Request body must be JSON.')
+    if not isinstance(data, dict):
+        raise BadRequest('Request body must be a JSON object.')
+    return data
+
+
+def error_reason(errors: Dict[str, Any]) -> str:
+    """Turn serializer errors into a single failure reason."""
+    return '; '.join(
+        f"{key}: {' '.join(map(str, val)) if isinstance(val, list) else val}"
+        for key, val in errors.items()
+    )
+
+
+def share_queryset(params: Dict[str, Any]) -> Tuple[QuerySet, Optional[list]]:
+    """
+    Build the ``share_list`` QuerySet from its parsed URI parameters.
+
+    :return: The QuerySet and the requested fields.
+    """
+    params = params.copy()
+    fields = params.pop('fields', None)
+    if params:
+        shares = Share.objects.filter(**compile_lookups(params)).distinct()
+    else:
+        shares = Share.objects.all().distinct()
+    return shares, fields
+
+
+def share_lookup_error(params: Dict[str, Any], found: bool) -> Optional[Result]:
+    """
+    Check the result of looking up a share by ``SHARE_LOOKUP_SPEC``
+
+    :param params: The parsed URI parameters.
+    :param found: Whether the share was found.
+    :return: The error response body and status code, None if the share was found.
+    """
+    if not params:
+        return {'success': False, 'reason': 'did not provide a name nor an id'}, 400
+    if not found:
+        key = 'id' if 'id' in params else 'name'
+        return {'success': False, 'reason': f'{key} is not found'}, 404
+    return None
+
+
+def event_stream_response(stream) -> StreamingHttpResponse:
+    """Wrap a stream of encoded Server-Sent Events in a response."""
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering events
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def share_event_stream(share_id: int) -> Iterator[bytes]:
+    """
+    Stream the events of a share until the client disconnects, with a
+    comment every ``SSE_HEARTBEAT`` seconds to keep the connection open.
+    """
+    with get_broker().subscribe(share_channel(share_id)) as subscription:
+        yield b': connected\n\n'
+        while True:
+            message = subscription.get(settings.SSE_HEARTBEAT)
+            if message is None:
+                yield b': keepalive\n\n'
+            else:
+                yield sse_event(message['data'], message['event'])
+
+
+def search_result(params: Dict[str, Any]) -> Result:
+    """
+    Run a search from its parsed URI parameters.
+
+    :return: The response body and status code.
+    """
+    if 'q' not in params:
+        return {'success': False, 'reason': 'did not provide a query'}, 400
+    return search(
+        params['q'], dict.fromkeys(params.get('type', SEARCHABLE)),
+        share_id=params.get('share'), user_id=params.get('user'),
+        limit=min(params.get('limit', 50), MAX_SEARCH_RESULTS),
+    ), 200
+
+
+def resolve_result(params: Dict[str, Any]) -> Result:
+    """
+    Resolve, or unresolve, the expenses matching the parsed ``RESOLVE_SPEC``
+    parameters with one UPDATE.
+
+    :return: The response body and status code.
+    """
+    params = params.copy()
+    resolved = params.pop('resolved', True)
+    if not params:
+        return {'success': False, 'reason': 'did not provide any of share, id, created_at '
+                                            'or updated_at'}, 400
+    queryset = Expense.objects.all()
+    if 'share' in params:
+        queryset = queryset.filter(share_id=params.pop('share'))
+    if 'id' in params:
+        queryset = queryset.filter(id__in=params.pop('id'))
+    if params:
+        queryset = queryset.filter(**compile_lookups(params))
+    ids = queryset.resolve(resolved)
+    return {'success': True, 'resolved': resolved, 'ids': ids}, 200
+
+
+def merge_result(params: Dict[str, Any], user: User) -> Result:
+    """
+    Merge the users given by the parsed ``MERGE_SPEC`` parameters.
+
+    :param user: The user making the request, only staff can merge users.
+    :return: The response body and status code.
+    """
+    if not user.is_staff:
+        return {'success': False, 'reason': 'only staff can merge users'}, 403
+    if 'source' not in params or 'target' not in params:
+        return {'success': False, 'reason': 'did not provide a source and a target'}, 400
+    try:
+        counts = merge_users(params['source'], params['target'])
+    except ValueError as e:
+        return {'success': False, 'reason': str(e)}, 400
+    except User.DoesNotExist as e:
+        return {'success': False, 'reason': str(e)}, 404
+    return {'success': True, 'counts': counts}, 200
+
+
+def summary_result(params: Dict[str, Any]) -> Result:
+    """
+    Get the summary of the share found by ``SHARE_LOOKUP_SPEC`` parameters.
+
+    :return: The response body and status code.
+    """
+    if set(params) == {'id'}:
+        # Served from the cache without looking up the share
+        summary = share_summary(params['id'])
+    else:
+        share_id = None
+        if params:
+            share_id = Share.objects.filter(**params).values_list('id', flat=True).first()
+        summary = None if share_id is None else share_summary(share_id)
+    error = share_lookup_error(params, summary is not None)
+    if error is not None:
+        return error
+    return summary, 200
+
+
+def objects_result(params: Dict[str, Any]) -> Result:
+    """
+    Get objects by ID from the parsed ``OBJECTS_SPEC`` parameters.
+
+    :return: The response body and status code.
+    """
+    ids = {kind: pks for kind, pks in params.items() if pks}
+    if not ids:
+        return {'success': False, 'reason': f"did not provide any of {', '.join(KINDS)}"}, 400
+    too_many = ', '.join(kind for kind, pks in ids.items() if len(pks) > MAX_OBJECTS)
+    if too_many:
+        return {'success': False, 'reason': f'more than {MAX_OBJECTS} IDs of {too_many}'}, 400
+    return multi_get(ids), 200
+
+
+def export_response(params: Dict[str, Any], stream=None):
+    """
+    Respond to an export request.
+
+    :param params: The parsed ``EXPORT_SPEC`` parameters.
+    :param stream: Wraps the stream of encoded chunks, e.g. to make it async.
+    :return: The streaming response, or an error response.
+    """
+    if 'share' not in params and 'user' not in params:
+        return FastJsonResponse(
+            {'success': False, 'reason': 'did not provide a share nor a user'}, status=400
+        )
+    fmt = params.get('format', 'csv')
+    content_type, _ = FORMATS[fmt]
+    chunks = export(export_queryset(params), fmt,
+                    archived=export_queryset(params, archived=True))
+    response = StreamingHttpResponse(
+        chunks if stream is None else stream(chunks), content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="expenses.{fmt}"'
+    return response
+
+
+def create_object(serializer_cls, data: dict) -> Result:
+    """
+    Create a share or an expense from a request body.
+
+    :param serializer_cls: The serializer of the model.
+    :return: The response body and status code.
+    """
+    serializer = serializer_cls(data=data)
+    if not serializer.is_valid():
+        reason = error_reason(serializer.errors)
+        return {'success': False, 'reason': reason, 'id': None, 'created_at': None}, 400
+    instance = serializer.save()
+    return {
+        'success': True, 'reason': None, 'id': instance.id,
+        'created_at': _timestamp(instance.created_at)
+    }, 200
+
+
+def update_object(serializer_cls, instance, data: dict) -> Result:
+    """
+    Update a share, user or expense from a request body.
+
+    :param serializer_cls: The serializer of the model.
+    :param instance: The instance to update.
+    :return: The response body and status code.
+    """
+    serializer = serializer_cls(instance, data=data, partial=True)
+    if not serializer.is_valid():
+        reason = error_reason(serializer.errors)
+        return {'success': False, 'reason': reason, 'id': None, 'updated_at': None}, 403
+    instance = serializer.save()
+    return {
+        'success': True, 'reason': None, 'id': instance.id,
+        'updated_at': _timestamp(instance.updated_at)
+    }, 200
+
+
+def create_share(data: dict) -> Result:
+    """
+    Create a share from a request body.
+
+    :return: The response body and status code.
+    """
+    return create_object(ShareSerializer, data)
+
+
+def update_share(share: Optional[Share], params: Dict[str, Any], data: dict) -> Result:
+    """
+    Update a share found by its URI parameters from a request body.
+
+    :param share: The share found by ``params``, if any.
+    :return: The response body and status code.
+    """
+    if not params:
+        reason = 'did not provide a name nor an id'
+        return {'success': False, 'reason': reason, 'id': None, 'updated_at': None}, 400
+    if share is None:
+        key = 'id' if 'id' in params else 'name'
+        reason = f'{key} is not found'
+        return {'success': False, 'reason': reason, 'id': None, 'updated_at': None}, 404
+    return update_object(ShareSerializer, share, data)
+
+
+# operation -> (model, serializer, creates)
+BATCH_OPERATIONS = {
+    'share.create': (Share, ShareSerializer, True),
+    'share.update': (Share, ShareSerializer, False),
+    'user.update': (User, UserSerializer, False),
+    'expense.create': (Expense, ExpenseSerializer, True),
+    'expense.update': (Expense, ExpenseSerializer, False),
+}
+
+MAX_BATCH_OPERATIONS = 100
+
+
+def _operation_error(operation) -> Optional[str]:
+    if not isinstance(operation, dict):
+        return 'must be a JSON object'
+    if operation.get('op') not in BATCH_OPERATIONS:
+        return f"op must be one of {', '.join(BATCH_OPERATIONS)}"
+    if not isinstance(operation.get('data'), dict):
+        return 'data must be a JSON object'
+    _, _, creates = BATCH_OPERATIONS[operation['op']]
+    if not creates:
+        try:
+            natural_number(operation.get('id'))
+        except (AttributeError, TypeError, ValueError):
+            return 'id must be the ID of the object to update'
+    return None
+
+
+def run_operation(operation: dict) -> Result:
+    """
+    Run one operation of a batch, see ``run_batch``
+
+    :return: The response body and status code.
+    """
+    error = _operation_error(operation)
+    if error is not None:
+        return {'success': False, 'reason': error, 'id': None}, 400
+    model, serializer_cls, creates = BATCH_OPERATIONS[operation['op']]
+    loader = get_loader()
+    if creates:
+        result = create_object(serializer_cls, operation['data'])
+        # The new object may have been looked up, and not found, before
+        loader.forget(model)
+        return result
+    instance = loader.load(model, operation['id'])
+    if instance is None:
+        return {'success': False, 'reason': 'id is not found', 'id': None,
+                'updated_at': None}, 404
+    return update_object(serializer_cls, instance, operation['data'])
+
+
+@loader_scope()
+def run_batch(data: dict) -> Result:
+    """
+    Run a batch of operations from a request body, in order and in one
+    transaction.
+
+    With ``atomic`` (the default) the batch stops at the first failed
+    operation and nothing is committed. Otherwise every operation runs in
+    its own savepoint, and the ones that succeeded are committed.
+
+    :return: The response body and status code.
+    """
+    operations = data.get('operations')
+    atomic = data.get('atomic', True)
+    if not isinstance(operations, list) or not operations:
+        return {'success': False, 'reason': 'operations must be a non empty list'}, 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return {'success': False,
+                'reason': f'more than {MAX_BATCH_OPERATIONS} operations'}, 400
+    if not isinstance(atomic, bool):
+        return {'success': False, 'reason': 'atomic must be a bool'}, 400
+    # Look up the related objects of every operation together
+    for op, (model, serializer_cls, creates) in BATCH_OPERATIONS.items():
+        ops = [o for o in operations if isinstance(o, dict) and o.get('op') == op]
+        queue_related(serializer_cls(), [o.get('data') for o in ops])
+        if not creates:
+            ids = [o.get('id') for o in ops if _operation_error(o) is None]
+            get_loader().queue(model, ids)
+    results = []
+    with transaction.atomic():
+        for operation in operations:
+            with transaction.atomic(savepoint=not atomic):
+                body, status = run_operation(operation)
+                if status != 200 and not atomic:
+                    transaction.set_rollback(True)
+            results.append(dict(body, status=status))
+            if status != 200 and atomic:
+                transaction.set_rollback(True)
+                break
+    success = all(result['success'] for result in results)
+    committed = success or not atomic
+    return {'success': success, 'committed': committed, 'results': results}, \
+        200 if committed else 400
+
+
+@method(allowed='GET')
+@uri_params(spec=SHARE_LIST_SPEC, method='GET')
 def share_list(request, *, params):
     """
     /api/v1/shares/list
 
     Method: GET
 
-    Get a list of shares based on the provided names/IDs.
-    Returns all shares if neither names nor IDs are provided.
+    Get a list of shares based on the provided names/IDs/time ranges.
+    Returns all shares if no parameters are provided.
 
     The request is evaluated at an AND basis, so if both name and id are
     provided, any share with name in the list AND id in the list are returned.
@@ -42,8 +469,15 @@ def share_list(request, *, params):
         Optional:
             name: a comma separated list of share names.
             id: a comma separated list of share ids.
+            created_at: a comma separated list of comparisons on the unix
+                        epoch of the creation time, e.g. ``gte:1500000000``
+                        or ``1500000000..1600000000``
+            updated_at: same as created_at, for the latest updated time.
+            fields: a comma separated list of fields to include in the
+                    response, defaults to all fields.
 
-    Response Body: A list of shares. Each share contains these fields:
+    Response Body: A list of shares. Each share contains these fields,
+    or only the fields requested with ``fields``:
         id: ID of the share
         type: int
 
@@ -68,15 +502,11 @@ def share_list(request, *, params):
         total: The total cost for all expenses in the share.
         type: float
     """
-    if params:
-        params = {f'{key}__in': val for key, val in params.items()}
-        shares = Share.objects.filter(**params).distinct()
-    else:
-        shares = Share.objects.all().distinct()
-    serializer = ShareSerializer(shares, many=True)
-    return JsonResponse(serializer.data, safe=False)
+    shares, fields = share_queryset(params)
+    return FastJsonResponse(ShareReader(fields).serialize(shares))
 
 
+@csrf_exempt
 @method(allowed='POST')
 def share_create(request):
     """
@@ -111,4 +541,407 @@ def share_create(request):
         created_at: Unix epoch of the share creation time.
         type: int
     """
-    pass
+    try:
+        data = json_body(request)
+    except BadRequest as e:
+        return FastJsonResponse({'success': False, 'reason': str(e)}, status=400)
+    body, status = create_share(data)
+    return FastJsonResponse(body, status=status)
+
+
+@csrf_exempt
+@method(allowed='POST')
+@uri_params(spec=SHARE_LOOKUP_SPEC, method='GET')
+def share_update(request, *, params):
+    """
+    /api/v1/shares/update
+
+    Method: POST
+
+    Update an existing share.
+
+    URI parameters:
+        One of name or id must be present:
+            name: Name of the share.
+            id: ID of the share.
+
+    Request Body:
+        Optional:
+            name: New name of the share. Max length 64 characters.
+            type: str
+
+            description: New description of the share. Max length 256 characters.
+            type: str
+
+            users: New list of IDs of users in this share.
+            type: List[int]
+
+    Response Body:
+        success: True is the update was successful, otherwise False.
+        type: bool
+
+        reason: Failure reason, if any.
+        type: str
+
+        id: ID of the updated share.
+        type: int
+
+        updated_at: Unix epoch of the latest update time of the share.
+        type: int
+    """
+    try:
+        data = json_body(request)
+    except BadRequest as e:
+        return FastJsonResponse({'success': False, 'reason': str(e)}, status=400)
+    share = Share.objects.filter(**params).first() if params else None
+    body, status = update_share(share, params, data)
+    return FastJsonResponse(body, status=status)
+
+
+@method(allowed='GET')
+@uri_params(spec=SHARE_LOOKUP_SPEC, method='GET')
+def share_events(request, *, params):
+    """
+    /api/v1/shares/events
+
+    Method: GET
+
+    Stream the activity of a share as Server-Sent Events, until the client
+    disconnects. Each blocks a worker thread, so serve with threads or ASGI.
+
+    URI parameters:
+        One of name or id must be present:
+            name: Name of the share.
+            id: ID of the share.
+
+    Events:
+        expense.created, expense.updated, expense.resolved
+        data: The expense, same as in ``changes``
+    """
+    share_id = None
+    if params:
+        share_id = Share.objects.filter(**params).values_list('id', flat=True).first()
+    error = share_lookup_error(params, share_id is not None)
+    if error is not None:
+        body, status = error
+        return FastJsonResponse(body, status=status)
+    return event_stream_response(share_event_stream(share_id))
+
+
+@method(allowed='GET')
+@uri_params(spec=SHARE_LOOKUP_SPEC, method='GET')
+def share_summary_view(request, *, params):
+    """
+    /api/v1/shares/summary
+
+    Method: GET
+
+    Get what every user of a share paid, owes and is owed, including
+    archived expenses. Users who left the share but still have expenses in
+    it are listed too. Summaries are cached until an expense or member of
+    the share changes.
+
+    URI parameters:
+        Only one of the following should be present, if both are present,
+        the share must match both:
+            name: The name of the share.
+            id: The ID of the share.
+
+    Response Body:
+        share: ID of the share.
+        type: int
+
+        members: One entry per user, ordered by user ID, with:
+            user: ID of the user.
+            member: Whether the user is in the share.
+            paid: The total of the expenses paid by the user.
+            owed: The user's part of every expense, by its ratio.
+            net: paid minus owed, positive if the user is owed money.
+        type: List[dict]
+    """
+    body, status = summary_result(params)
+    return FastJsonResponse(body, status=status)
+
+
+@method(allowed='GET')
+@uri_params(spec=CHANGES_SPEC, method='GET')
+def changes(request, *, params):
+    """
+    /api/v1/changes
+
+    Method: GET
+
+    Get the shares and expenses changed, and the shares and expenses deleted,
+    after a cursor. Start without a cursor, then pass the returned cursor to
+    get the next changes.
+
+    URI parameters:
+        Optional:
+            cursor: The cursor returned by the previous request.
+            limit: The maximum number of changes, defaults to and is capped at 1000.
+
+    Response Body:
+        shares: Changed shares, same as ``share_list``
+        type: List[dict]
+
+        expenses: Changed expenses, with their ratios.
+        type: List[dict]
+
+        deleted: Deleted objects, e.g. {"type": "expense", "id": 1}
+        type: List[dict]
+
+        cursor: The cursor to get the next changes, null if there were never
+                any changes.
+        type: str
+
+        has_more: True if there are more changes after the cursor.
+        type: bool
+    """
+    limit = min(params.get('limit', MAX_CHANGES), MAX_CHANGES)
+    return FastJsonResponse(changes_since(params.get('cursor'), limit))
+
+
+@method(allowed='GET')
+@uri_params(spec=SEARCH_SPEC, method='GET')
+def search_view(request, *, params):
+    """
+    /api/v1/search
+
+    Method: GET
+
+    Search the descriptions of expenses and shares. Every word of the query
+    must match the start of a word in the description.
+
+    URI parameters:
+        Required:
+            q: The search query.
+        Optional:
+            type: A comma separated list of what to search, expense and/or
+                  share, defaults to both.
+            share: Only search within the share with this ID.
+            user: Only search expenses paid by or for, and shares of, the user
+                  with this ID.
+            limit: The maximum number of hits, defaults to 50 and is capped at 200.
+
+    Response Body: A list of hits, best match first. Each hit contains:
+        type: expense or share
+        type: str
+
+        id: ID of the expense or share.
+        type: int
+
+        share: ID of the share of the expense, for expenses.
+        type: int
+
+        name: Name of the share, for shares.
+        type: str
+
+        description: The description.
+        type: str
+
+        rank: How well the hit matches, higher is better.
+        type: float
+    """
+    body, status = search_result(params)
+    return FastJsonResponse(body, status=status)
+
+
+@method(allowed='GET')
+@uri_params(spec=EXPORT_SPEC, method='GET')
+def expense_export(request, *, params):
+    """
+    /api/v1/expenses/export
+
+    Method: GET
+
+    Stream the expenses of a share or user, with their ratios, ordered by ID.
+
+    URI parameters:
+        At least one of share or user must be present:
+            share: ID of the share.
+            user: ID of a user, exports the expenses paid by or for the user.
+        Optional:
+            created_at: a comma separated list of comparisons on the unix
+                        epoch of the creation time, e.g. ``gte:1500000000``
+            updated_at: same as created_at, for the latest updated time.
+            format: csv or ndjson, defaults to csv.
+
+    Response Body:
+        csv: A header, then one row per expense with the columns in
+             ``api.export.COLUMNS``
+        ndjson: One expense per line, same as the expenses in ``changes``
+    """
+    return export_response(params)
+
+
+@csrf_exempt
+@method(allowed='POST')
+def batch(request):
+    """
+    /api/v1/batch
+
+    Method: POST
+
+    Run a list of create and update operations, in order and in one
+    transaction.
+
+    Request Body:
+        Required:
+            operations: At most 100 operations, each with:
+                op: share.create, share.update, user.update, expense.create
+                    or expense.update
+                id: ID of the object to update, for updates.
+                data: The request body of the operation, same as the
+                      create/update endpoint of the model.
+            type: List[dict]
+
+        Optional:
+            atomic: If true (the default), stop at the first failed
+                    operation and commit nothing. If false, commit every
+                    operation that succeeded.
+            type: bool
+
+    Response Body:
+        success: True if every operation succeeded.
+        type: bool
+
+        committed: True if the operations that succeeded were committed.
+        type: bool
+
+        results: The result of each operation that was run, in order, same
+                 as the response body of its endpoint, with its HTTP status
+                 code as ``status``
+        type: List[dict]
+    """
+    try:
+        data = json_body(request)
+    except BadRequest as e:
+        return FastJsonResponse({'success': False, 'reason': str(e)}, status=400)
+    body, status = run_batch(data)
+    return FastJsonResponse(body, status=status)
+
+
+@csrf_exempt
+@method(allowed='POST')
+@uri_params(spec=RESOLVE_SPEC, method='GET')
+def expense_resolve(request, *, params):
+    """
+    /api/v1/expenses/resolve
+
+    Method: POST
+
+    Resolve, or unresolve, many expenses at once. The expenses are updated
+    with one query, which also sets their updated_at.
+
+    URI parameters:
+        At least one filter must be present, expenses must match all of them:
+            share: ID of the share of the expenses.
+            id: a comma separated list of expense IDs.
+            created_at: a comma separated list of comparisons on the unix
+                        epoch of the creation time, e.g. ``lt:1500000000``
+            updated_at: same as created_at, for the latest updated time.
+        Optional:
+            resolved: true or false, defaults to true.
+
+    Response Body:
+        success: True
+        type: bool
+
+        resolved: The new value of resolved.
+        type: bool
+
+        ids: IDs of the expenses that changed, expenses that already had
+             that value are left as is.
+        type: List[int]
+    """
+    body, status = resolve_result(params)
+    return FastJsonResponse(body, status=status)
+
+
+@csrf_exempt
+@method(allowed='POST')
+@uri_params(spec=MERGE_SPEC, method='GET')
+def user_merge(request, *, params):
+    """
+    /api/v1/users/merge
+
+    Method: POST
+
+    Merge a duplicate user into another user, in one transaction. The
+    expenses paid by the source user, its ratios, archived expenses, share
+    memberships and tokens move to the target user, then the source user
+    is deleted. Where both users have a ratio of the same expense, the
+    ratios are added up. Only staff users can merge users, other tokens
+    get a 403.
+
+    URI parameters:
+        Required:
+            source: ID of the user to merge, it is deleted.
+            target: ID of the user to keep.
+
+    Response Body:
+        success: True
+        type: bool
+
+        counts: The number of rows affected, by kind: expenses,
+                archived_expenses, ratios, ratios_coalesced,
+                archived_ratios, archived_ratios_coalesced, summaries,
+                shares and tokens.
+        type: Dict[str, int]
+    """
+    body, status = merge_result(params, request.api_user)
+    return FastJsonResponse(body, status=status)
+
+
+@method(allowed='GET')
+@uri_params(spec=OBJECTS_SPEC, method='GET')
+def objects(request, *, params):
+    """
+    /api/v1/objects
+
+    Method: GET
+
+    Get shares, users and expenses by ID, e.g. to hydrate the IDs listed by
+    a share. Objects are served from a cache when possible.
+
+    URI parameters:
+        At least one must be present, each with at most 100 IDs:
+            shares: a comma separated list of share IDs.
+            users: a comma separated list of user IDs.
+            expenses: a comma separated list of expense IDs.
+
+    Response Body: A mapping of each requested kind to a list with, in the
+    order of the requested IDs, the object, same as in the list endpoints,
+    or null if there is no object with that ID.
+    """
+    body, status = objects_result(params)
+    return FastJsonResponse(body, status=status)
+
+
+@method(allowed='GET')
+def status_caches(request):
+    """
+    /api/v1/status/caches
+
+    Method: GET
+
+    Get the stats of the in process caches of the worker process that
+    served the request.
+
+    Response Body: A mapping of cache name to its stats:
+        size: Number of entries.
+        type: int
+
+        maxsize: Maximum number of entries.
+        type: int
+
+        hits: Number of lookups that found an entry.
+        type: int
+
+        misses: Number of lookups that did not find an entry.
+        type: int
+
+        hit_rate: hits / (hits + misses), null if there were no lookups.
+        type: float
+    """
+    return FastJsonResponse(cache_stats())
@@ -0,0 +1,73 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Benchmarks, run them from the py_expense directory, e.g.
+
+    python -m benchmarks.bench_json
+"""
+
+import os
+from random import uniform
+from timeit import repeat
+from typing import Callable
+
+import django
+
+
+def setup_django(settings: str = 'tests.pytest_settings'):
+    """Configure Django so benchmarks can import project modules."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings)
+    django.setup()
+
+
+def best_of(func: Callable, number: int, repeat_: int) -> float:
+    """Return the best time per call of ``func`` in seconds."""
+    return min(repeat(func, number=number, repeat=repeat_)) / number
+
+
+def setup_database():
+    """Create the tables of the api app, for the in memory test database."""
+    from django.apps import apps
+    from django.db import connection
+
+    from api.search import install_search
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config('api').get_models():
+            editor.create_model(model)
+    install_search()
+
+
+def populate(shares: int, users: int, expenses: int):
+    """
+    Create ``shares`` shares with ``users`` users and ``expenses`` equally
+    split expenses each.
+    """
+    from api.models import Expense, ExpenseRatio, Share, User
+    for i in range(shares):
+        share = Share.objects.create(name=f'share {i}', description='bench')
+        members = User.objects.bulk_create(User(name=f'user {i} {j}') for j in range(users))
+        share.users.add(*members)
+        created = Expense.objects.bulk_create(
+            Expense(description='bench', share=share, paid_by=members[j % users],
+                    total=uniform(0.5, 1000.0))
+            for j in range(expenses)
+        )
+        ExpenseRatio.objects.bulk_create(
+            ExpenseRatio(expense=expense, user=user, numerator=1, denominator=users)
+            for expense in created for user in members
+        )
@@ -0,0 +1,65 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Throughput of archiving resolved expenses, and the share list total query
+before and after.
+
+    python -m benchmarks.bench_archive [--expenses 5000]
+"""
+
+from argparse import ArgumentParser
+from time import perf_counter
+
+from benchmarks import best_of, populate, setup_database, setup_django
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--shares', type=int, default=10)
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--expenses', type=int, default=5000,
+                        help='Expenses per share')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    setup_database()
+    from django.utils import timezone
+
+    from api.archive import archive_expenses
+    from api.models import Expense, Share
+    from api.readers import ShareReader
+
+    populate(args.shares, args.users, args.expenses)
+    # Resolve 90% of the expenses
+    Expense.objects.exclude(id__endswith='0').update(resolved=True)
+
+    def totals():
+        return ShareReader(['total']).serialize(Share.objects.all())
+
+    before = totals()
+    print(f'share totals, live only:   {best_of(totals, 10, 3) * 1000:.2f} ms')
+    started = perf_counter()
+    archived = archive_expenses(timezone.now(), batch_size=args.batch_size)
+    elapsed = perf_counter() - started
+    print(f'archived {archived} expenses in {elapsed:.2f} s, {archived / elapsed:.0f} rows/s')
+    print(f'share totals, with archive: {best_of(totals, 10, 3) * 1000:.2f} ms')
+    assert [round(t['total'], 2) for t in totals()] == [round(t['total'], 2) for t in before]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Time of deleting a share with a large expense history, through the ORM
+cascade and in batches with ``api.deletion``.
+
+    python -m benchmarks.bench_delete [--expenses 20000]
+"""
+
+from argparse import ArgumentParser
+from time import perf_counter
+
+from benchmarks import populate, setup_database, setup_django
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--expenses', type=int, default=20000,
+                        help='Expenses per share')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    setup_database()
+    from api.deletion import delete_share
+    from api.models import Expense, Share
+
+    populate(2, args.users, args.expenses)
+    orm, batched = Share.objects.order_by('id').values_list('id', flat=True)
+
+    started = perf_counter()
+    Share.objects.get(pk=orm).delete()
+    print(f'ORM cascade: {perf_counter() - started:.2f} s')
+
+    started = perf_counter()
+    deleted = delete_share(batched, batch_size=args.batch_size)
+    elapsed = perf_counter() - started
+    print(f'batched:     {elapsed:.2f} s, {deleted / elapsed:.0f} rows/s')
+    assert not Expense.objects.exists()
+
+
+if __name__ == '__main__':
+    main()
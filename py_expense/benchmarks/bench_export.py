@@ -0,0 +1,75 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Peak memory and time of exporting a share's expenses, streaming versus a
+full ``ExpenseSerializer(many=True)`` dump.
+
+    python -m benchmarks.bench_export [--expenses 100000]
+"""
+
+from argparse import ArgumentParser
+from time import perf_counter
+from tracemalloc import get_traced_memory, start, stop
+
+from benchmarks import populate, setup_database, setup_django
+
+
+def measure(func):
+    start()
+    began = perf_counter()
+    func()
+    seconds = perf_counter() - began
+    _, peak = get_traced_memory()
+    stop()
+    return seconds, peak
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--expenses', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=4)
+    args = parser.parse_args()
+
+    setup_django()
+    setup_database()
+    from api.export import export
+    from api.models import Expense, Share
+    from api.serializers import ExpenseSerializer
+    from core import dumps
+
+    populate(1, args.users, args.expenses)
+    share = Share.objects.get()
+    queryset = Expense.objects.filter(share=share)
+
+    def drain(fmt):
+        for _ in export(queryset, fmt):
+            pass
+
+    def serializer():
+        dumps(ExpenseSerializer(
+            ExpenseSerializer.setup_queryset(queryset.order_by('id')), many=True).data)
+
+    for label, func in (('csv stream', lambda: drain('csv')),
+                        ('ndjson stream', lambda: drain('ndjson')),
+                        ('serializer dump', serializer)):
+        seconds, peak = measure(func)
+        print(f'{label:16} {seconds:7.2f} s  peak {peak / 2 ** 20:8.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
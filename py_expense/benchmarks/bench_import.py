@@ -0,0 +1,69 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Throughput of the bulk CSV import.
+
+    python -m benchmarks.bench_import [--rows 100000]
+"""
+
+from argparse import ArgumentParser
+from random import randrange, seed
+
+from benchmarks import setup_database, setup_django
+
+
+def rows(count: int, shares: int, users: int):
+    yield 'share,description,total,paid_by,paid_for,created_at,resolved\n'
+    ratios = ';'.join(f'user {{}} {j}:1/{users}' for j in range(users))
+    for i in range(count):
+        share = i % shares
+        yield (f'share {share},expense {i},{randrange(1, 100000) / 100},user {share} 0,'
+               f'{ratios.format(*[share] * users)},{1500000000 + i},0\n')
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--shares', type=int, default=100)
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    setup_django()
+    setup_database()
+    from django.db import transaction
+
+    from api.importer import import_expenses
+    from api.models import Share, User
+
+    seed(0)
+    for i in range(args.shares):
+        share = Share.objects.create(name=f'share {i}', description='bench')
+        share.users.add(*User.objects.bulk_create(
+            User(name=f'user {i} {j}') for j in range(args.users)))
+
+    with transaction.atomic():
+        stats = import_expenses(rows(args.rows, args.shares, args.users),
+                                batch_size=args.batch_size)
+    assert not stats.errors, stats.errors[:5]
+    print(f'{stats.imported} expenses with {args.users} ratios each in {stats.elapsed:.2f} s, '
+          f'{stats.rate:.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
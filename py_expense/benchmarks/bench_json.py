@@ -0,0 +1,76 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Compare the JSON backends on a ``share_list`` shaped payload.
+
+    python -m benchmarks.bench_json [--shares 10000] [--repeat 5]
+"""
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+from json import dumps as json_dumps
+from random import randint, uniform
+
+from benchmarks import best_of, setup_django
+
+
+def share_payload(amt: int, ordered: bool) -> list:
+    dict_cls = OrderedDict if ordered else dict
+    return [dict_cls([
+        ('id', i),
+        ('created_at', randint(1300000000, 1600000000)),
+        ('updated_at', randint(1300000000, 1600000000)),
+        ('name', f'share {i}'),
+        ('description', 'Trip to Japan' * 5),
+        ('users', list(range(i, i + 5))),
+        ('expenses', list(range(i * 20, i * 20 + 20))),
+        ('total', uniform(0.5, 10000.0)),
+    ]) for i in range(amt)]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--shares', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.serializers.json import DjangoJSONEncoder
+    from core.render import _BACKENDS, dumps
+
+    ordered = share_payload(args.shares, True)
+    plain = [dict(x) for x in ordered]
+
+    results = {
+        'JsonResponse (stdlib + DjangoJSONEncoder)':
+            lambda: json_dumps(ordered, cls=DjangoJSONEncoder).encode('utf-8'),
+    }
+    for name in _BACKENDS:
+        results[f'{name}, OrderedDict'] = lambda name=name: dumps(ordered, name)
+        results[f'{name}, dict'] = lambda name=name: dumps(plain, name)
+
+    print(f'{args.shares} shares, payload {len(dumps(plain)) / 1024:.0f} KiB')
+    baseline = None
+    for label, func in results.items():
+        seconds = best_of(func, 1, args.repeat)
+        baseline = baseline or seconds
+        print(f'{label:45} {seconds * 1000:8.2f} ms  {baseline / seconds:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
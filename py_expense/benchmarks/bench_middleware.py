@@ -0,0 +1,65 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Per request overhead of the full middleware stack versus the API fast path.
+
+    python -m benchmarks.bench_middleware [--requests 2000]
+"""
+
+from argparse import ArgumentParser
+
+from benchmarks import best_of, setup_database, setup_django
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    setup_database()
+    from django.conf import settings
+    from django.test import Client, override_settings
+
+    from api.models import Token, User
+
+    path = '/api/v1/shares/list/?fields=id'
+    full_stack = settings.MIDDLEWARE[1:]
+    stacks = {
+        'full MIDDLEWARE': full_stack,
+        'no middleware': [],
+        'API fast path': settings.MIDDLEWARE,
+    }
+    token = Token.new(User.objects.create(name='bench'))
+    rate_limit = {**settings.RATE_LIMIT, 'LIMIT': 10 ** 9}
+    timings = {}
+    for label, middleware in stacks.items():
+        with override_settings(MIDDLEWARE=middleware, RATE_LIMIT=rate_limit):
+            client = Client(headers={'Authorization': f'Token {token.key}'})
+            client.get(path)
+            timings[label] = best_of(lambda: client.get(path), args.requests, args.repeat)
+
+    floor = timings['no middleware']
+    for label, seconds in timings.items():
+        print(f'{label:16} {seconds * 1e6:8.1f} us/request, '
+              f'middleware {max(seconds - floor, 0) * 1e6:6.1f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Per request overhead of the rate limit backends.
+
+    python -m benchmarks.bench_ratelimit [--keys 1000]
+"""
+
+from argparse import ArgumentParser
+from itertools import cycle
+
+from benchmarks import best_of, setup_django
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=1000)
+    parser.add_argument('--hits', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from core import DjangoCacheBackend, SharedMemoryBackend
+
+    keys = cycle([f'auth:Token {i:040x}' for i in range(args.keys)])
+    for backend in SharedMemoryBackend(10 ** 9, 60), DjangoCacheBackend(10 ** 9, 60):
+        seconds = best_of(lambda: backend.hit(next(keys)), args.hits, args.repeat)
+        print(f'{type(backend).__name__:20} {seconds * 1e6:6.2f} us/request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Search latency over many expense descriptions.
+
+    python -m benchmarks.bench_search [--expenses 1000000]
+"""
+
+from argparse import ArgumentParser
+from random import choices, seed
+
+from benchmarks import best_of, setup_database, setup_django
+
+WORDS = ('pizza pasta train plane hotel taxi groceries dinner lunch coffee rent gas '
+         'tickets museum beer wine snacks ferry parking market').split()
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--expenses', type=int, default=200000)
+    parser.add_argument('--shares', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    setup_database()
+    from api.models import Expense, Share, User
+    from api.search import search
+
+    seed(0)
+    user = User.objects.create(name='bench')
+    shares = Share.objects.bulk_create(
+        Share(name=f'share {i}', description='bench') for i in range(args.shares)
+    )
+    batch = 10000
+    for start in range(0, args.expenses, batch):
+        Expense.objects.bulk_create(
+            Expense(description=' '.join(choices(WORDS, k=4)) + f' note{i}',
+                    share=shares[i % args.shares], paid_by=user, total=1)
+            for i in range(start, min(start + batch, args.expenses))
+        )
+
+    queries = {
+        'common word': dict(query='pizza'),
+        'prefix': dict(query='gro'),
+        'two words': dict(query='pizza wine'),
+        'rare word': dict(query=f'note{args.expenses // 2}'),
+        'in one share': dict(query='pizza', share_id=shares[0].id),
+    }
+    for label, kwargs in queries.items():
+        seconds = best_of(lambda: search(**kwargs), 1, args.repeat)
+        print(f'{label:14} {seconds * 1e3:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
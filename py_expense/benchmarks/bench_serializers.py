@@ -0,0 +1,65 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Compare ``ModelSerializer`` with the values based readers on list reads.
+
+    python -m benchmarks.bench_serializers [--shares 200] [--expenses 20]
+"""
+
+from argparse import ArgumentParser
+
+from benchmarks import best_of, populate, setup_database, setup_django
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--shares', type=int, default=200)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--expenses', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    setup_database()
+    populate(args.shares, args.users, args.expenses)
+
+    from api.models import Expense, Share, User
+    from api.readers import ExpenseReader, ShareReader, UserReader
+    from api.serializers import ExpenseSerializer, ShareSerializer, UserSerializer
+
+    print(f'{args.shares} shares, {args.users} users and {args.expenses} expenses per share')
+    for ModelCls, SerializerCls, ReaderCls in (
+            (Share, ShareSerializer, ShareReader),
+            (Expense, ExpenseSerializer, ExpenseReader),
+            (User, UserSerializer, UserReader)):
+        def drf():
+            queryset = SerializerCls.setup_queryset(ModelCls.objects.all())
+            return SerializerCls(queryset, many=True).data
+
+        def reader():
+            return ReaderCls().serialize(ModelCls.objects.all())
+
+        count = ModelCls.objects.count()
+        drf_time = best_of(drf, 1, args.repeat)
+        reader_time = best_of(reader, 1, args.repeat)
+        print(f'{ModelCls.__name__:8} x{count:<7} ModelSerializer {drf_time * 1000:8.2f} ms'
+              f'  Reader {reader_time * 1000:8.2f} ms  {drf_time / reader_time:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+A small HTTP load generator to compare server setups, e.g. WSGI and ASGI.
+
+Start a server, then point this at it:
+
+    gunicorn py_expense.wsgi -w 1 --threads 4
+    uvicorn py_expense.asgi:application --workers 1
+
+    python -m benchmarks.load_test http://127.0.0.1:8000/api/v1/shares/list/ \
+        --concurrency 200 --requests 5000 --slow 0.5
+
+``--slow`` makes every client send its request headers in two parts with a
+pause in between, like a client on a slow network, which ties up a worker
+thread on a sync server but not on an async one.
+"""
+
+import asyncio
+from argparse import ArgumentParser
+from statistics import median
+from time import perf_counter
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+
+async def _request(host: str, port: int, path: str, slow: float) -> Optional[float]:
+    start = perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        head = f'GET {path} HTTP/1.1\r\nHost: {host}\r\n'.encode()
+        writer.write(head)
+        if slow:
+            await writer.drain()
+            await asyncio.sleep(slow)
+        writer.write(b'Connection: close\r\n\r\n')
+        await writer.drain()
+        status = await reader.readline()
+        await reader.read()
+        writer.close()
+    except OSError:
+        return None
+    if b' 200 ' not in status:
+        return None
+    return perf_counter() - start
+
+
+async def run(url: str, concurrency: int, requests: int, slow: float) -> List[Optional[float]]:
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    remaining = iter(range(requests))
+    results = []
+
+    async def client():
+        for _ in remaining:
+            results.append(await _request(parts.hostname, parts.port or 80, path, slow))
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return results
+
+
+def report(results: List[Optional[float]], seconds: float):
+    latencies = sorted(x for x in results if x is not None)
+    errors = len(results) - len(latencies)
+    print(f'{len(results)} requests in {seconds:.2f} s, {len(latencies) / seconds:.1f} req/s, '
+          f'{errors} errors')
+    if latencies:
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f'latency median {median(latencies) * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms')
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('url')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--slow', type=float, default=0.0,
+                        help='seconds each client pauses while sending a request')
+    args = parser.parse_args()
+
+    start = perf_counter()
+    results = asyncio.run(run(args.url, args.concurrency, args.requests, args.slow))
+    report(results, perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Measure how throughput scales with the number of ``serve`` workers.
+
+Starts ``manage.py serve`` once per worker count and runs ``load_test``
+against it:
+
+    python -m benchmarks.scaling --workers 1 2 4 8 \
+        --path '/api/v1/shares/list/?fields=id,name,total'
+
+Pass ``--asgi`` to measure the ASGI server instead. The server uses the
+current DJANGO_SETTINGS_MODULE, so point it at a populated database.
+"""
+
+import asyncio
+import socket
+import subprocess
+import sys
+from argparse import ArgumentParser
+from time import perf_counter, sleep
+
+from benchmarks.load_test import report, run
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    start = perf_counter()
+    while perf_counter() - start < timeout:
+        with socket.socket() as sock:
+            if sock.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        sleep(0.1)
+    raise TimeoutError(f'Server did not start on port {port}')
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--path', default='/api/v1/shares/list/')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--asgi', action='store_true')
+    args = parser.parse_args()
+
+    url = f'http://127.0.0.1:{args.port}{args.path}'
+    for workers in args.workers:
+        cmd = [sys.executable, 'manage.py', 'serve', '--bind', f'127.0.0.1:{args.port}',
+               '--workers', str(workers)] + (['--asgi'] if args.asgi else [])
+        server = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(args.port)
+            # Warm up every worker before measuring.
+            asyncio.run(run(url, workers * 4, workers * 20, 0))
+            print(f'== {workers} workers')
+            start = perf_counter()
+            results = asyncio.run(run(url, args.concurrency, args.requests, 0))
+            report(results, perf_counter() - start)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
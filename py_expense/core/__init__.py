@@ -14,8 +14,16 @@
 #  You should have received a copy of the GNU Affero General Public License
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from .cache import *
 from .constants import *
 from .decorators import *
+from .loader import *
+from .middleware import *
 from .parse import *
+from .pubsub import *
+from .ratelimit import *
+from .render import *
 
-__all__ = constants.__all__ + parse.__all__ + decorators.__all__
+__all__ = cache.__all__ + constants.__all__ + parse.__all__ + decorators.__all__ + \
+    render.__all__ + middleware.__all__ + ratelimit.__all__ + \
+    pubsub.__all__ + loader.__all__
@@ -0,0 +1,147 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Module for in process caching"""
+
+__all__ = [
+    'TTLCache',
+    'cache_stats',
+]
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+# Every cache created, by name
+_caches: Dict[str, 'TTLCache'] = {}
+
+
+class TTLCache:
+    """
+    A bounded, thread safe, in process cache.
+
+    Entries expire ``ttl`` seconds after they are set, and the least recently
+    used entry is evicted when the cache is full. Every cache is registered by
+    name so its stats show up in ``cache_stats``.
+
+    The cache only lives in the current process, so other worker processes
+    only see an invalidation once their own entry expires.
+
+    :param name: The name of the cache.
+    :param maxsize: The maximum number of entries.
+    :param ttl: The time to live of an entry, in seconds.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+        _caches[name] = self
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a value from the cache.
+
+        :param key: The key.
+        :param default: The value to return on a miss.
+        :return: The cached value, or ``default``
+        """
+        with self._lock:
+            value, expires = self._data.get(key, (_MISSING, 0))
+            if value is _MISSING or expires < monotonic():
+                if value is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """
+        Set a value in the cache, evicting the least recently used entry if
+        the cache is full.
+        """
+        with self._lock:
+            self._data[key] = (value, monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        """
+        Get a value from the cache, loading and caching it on a miss.
+
+        :param key: The key.
+        :param load: A function that loads the value, ``None`` is not cached.
+        :return: The cached or loaded value.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = load()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable):
+        """Remove a key from the cache, if it's in the cache."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry, the stats are kept."""
+        with self._lock:
+            self._data.clear()
+
+    def reset_stats(self):
+        """Reset the hit and miss counts."""
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        :return: The size, max size, hits, misses and hit rate of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None,
+        }
+
+
+def cache_stats(name: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Get the stats of the caches in this process.
+
+    :param name: Only get the stats of this cache.
+    :return: A mapping of cache name to its stats.
+    """
+    return {key: cache.stats() for key, cache in _caches.items()
+            if name is None or key == name}
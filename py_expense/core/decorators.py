@@ -21,15 +21,28 @@ __all__ = [
     'func_name',
 ]
 
+from asyncio import iscoroutinefunction
 from functools import wraps
 from typing import Callable, Iterable, Union
 
 from django.http import JsonResponse
 
 
+def _method_not_allowed(request, allowed) -> JsonResponse:
+    allowed_lst = ', '.join(f"'{x}'" for x in allowed)
+    reason = (
+        f"Method '{request.method}' is not allowed. "
+        f"Allowed methods: {allowed_lst}"
+    )
+    return JsonResponse({'success': False, 'reason': reason}, status=404)
+
+
 def method(allowed: Union[str, Iterable[str]]):
     """
     Decorate a view function to only allow certain methods.
+
+    Works on both sync and async view functions.
+
     :param func: The function to decorate.
     :param allowed: The allowed method(s).
     """
@@ -39,17 +52,21 @@ def method(allowed: Union[str, Iterable[str]]):
 
     def decorate(func):
 
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(request):
+                if request.method in allowed:
+                    return await func(request)
+                return _method_not_allowed(request, allowed)
+
+            return async_wrapper
+
         @wraps(func)
         def wrapper(request):
             if request.method in allowed:
                 return func(request)
             else:
-                allowed_lst = ', '.join(f"'{x}'" for x in allowed)
-                reason = (
-                    f"Method '{request.method}' is not allowed. "
-                    f"Allowed methods: {allowed_lst}"
-                )
-                return JsonResponse({'success': False, 'reason': reason}, status=404)
+                return _method_not_allowed(request, allowed)
 
         return wrapper
 
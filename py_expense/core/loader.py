@@ -0,0 +1,164 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Module for request scoped batching of model lookups"""
+
+__all__ = [
+    'Loader',
+    'LoaderMiddleware',
+    'get_loader',
+    'loader_scope',
+]
+
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Type
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.models import Model
+
+
+class Loader:
+    """
+    Batch lookups of model instances by primary key.
+
+    Primary keys are queued, then every queued key of a model is loaded with
+    one ``pk__in`` query the first time one of them is needed. Loaded
+    instances, and keys that were not found, are kept so the same key is
+    never queried twice, and the same instance is returned for it.
+
+    Instances reflect the database when they were loaded, a loader should
+    only live as long as one request, see ``loader_scope``.
+    """
+
+    def __init__(self):
+        # model -> {pk: instance or None if not found}
+        self._loaded: Dict[Type[Model], Dict[Any, Optional[Model]]] = defaultdict(dict)
+        self._queued: Dict[Type[Model], Set[Any]] = defaultdict(set)
+        self.queries = 0
+
+    @staticmethod
+    def _key(model: Type[Model], pk) -> Any:
+        return model._meta.pk.to_python(pk)
+
+    def queue(self, model: Type[Model], pks: Iterable) -> 'Loader':
+        """
+        Queue primary keys to be loaded with the next lookup of the model.
+
+        :raises django.core.exceptions.ValidationError: If a key is invalid.
+        """
+        loaded = self._loaded[model]
+        self._queued[model].update(key for key in (self._key(model, pk) for pk in pks)
+                                   if key not in loaded)
+        return self
+
+    def prime(self, *instances: Model) -> 'Loader':
+        """Add already loaded instances."""
+        for instance in instances:
+            self._loaded[type(instance)][instance.pk] = instance
+        return self
+
+    def _fetch(self, model: Type[Model]):
+        pending = self._queued.pop(model, None)
+        if not pending:
+            return
+        loaded = self._loaded[model]
+        found = {obj.pk: obj for obj in model._default_manager.filter(pk__in=pending)}
+        self.queries += 1
+        for key in pending:
+            loaded[key] = found.get(key)
+
+    def load(self, model: Type[Model], pk) -> Optional[Model]:
+        """
+        Load one instance, with every queued key of its model.
+
+        :return: The instance, or None if it does not exist.
+        """
+        return self.load_many(model, (pk,)).get(self._key(model, pk))
+
+    def load_many(self, model: Type[Model], pks: Iterable) -> Dict[Any, Model]:
+        """
+        Load instances, with every queued key of their model.
+
+        :return: {primary key: instance} of the instances found.
+        """
+        keys = [self._key(model, pk) for pk in pks]
+        self.queue(model, keys)
+        self._fetch(model)
+        loaded = self._loaded[model]
+        return {key: loaded[key] for key in keys if loaded[key] is not None}
+
+    def forget(self, model: Optional[Type[Model]] = None):
+        """Drop the loaded instances of a model, or of every model."""
+        if model is None:
+            self._loaded.clear()
+        else:
+            self._loaded.pop(model, None)
+
+
+_current: ContextVar[Optional[Loader]] = ContextVar('loader', default=None)
+
+
+def get_loader() -> Loader:
+    """
+    The loader of the current ``loader_scope``, or a new loader that isn't
+    shared with anything else outside of a scope.
+    """
+    loader = _current.get()
+    return Loader() if loader is None else loader
+
+
+@contextmanager
+def loader_scope() -> Iterator[Loader]:
+    """
+    Share one ``Loader`` for the duration of the block, nested scopes share
+    the loader of the outermost one.
+    """
+    loader = _current.get()
+    if loader is not None:
+        yield loader
+        return
+    loader = Loader()
+    token = _current.set(loader)
+    try:
+        yield loader
+    finally:
+        _current.reset(token)
+
+
+class LoaderMiddleware:
+    """
+    Run every request in its own ``loader_scope``
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with loader_scope():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with loader_scope():
+            return await self.get_response(request)
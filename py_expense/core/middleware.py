@@ -0,0 +1,88 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Module for middleware"""
+
+__all__ = [
+    'ApiFastPathMiddleware',
+]
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, \
+    sync_to_async
+from django.conf import settings
+from django.core.handlers.exception import convert_exception_to_response
+from django.urls import get_resolver
+from django.utils.module_loading import import_string
+
+
+class ApiFastPathMiddleware:
+    """
+    Send API requests through a lean middleware stack.
+
+    Put this first in ``MIDDLEWARE``. Requests with a path starting with
+    ``API_PREFIX`` skip the rest of ``MIDDLEWARE`` and only go through
+    ``API_MIDDLEWARE`` before their view is resolved and called directly.
+    Every other request goes through ``MIDDLEWARE`` as usual.
+
+    ``API_MIDDLEWARE`` only supports ``__call__``/``process_request``/
+    ``process_response`` middleware, view and exception hooks are not run.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.API_PREFIX
+        self.resolver = get_resolver()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        handler = convert_exception_to_response(
+            self.async_dispatch if self.is_async else self.dispatch
+        )
+        for path in reversed(settings.API_MIDDLEWARE):
+            handler = convert_exception_to_response(import_string(path)(handler))
+        self.api_handler = handler
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if request.path_info.startswith(self.prefix):
+            return self.api_handler(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.path_info.startswith(self.prefix):
+            return await self.api_handler(request)
+        return await self.get_response(request)
+
+    def resolve(self, request):
+        match = self.resolver.resolve(request.path_info)
+        request.resolver_match = match
+        return match
+
+    def dispatch(self, request):
+        view, args, kwargs = self.resolve(request)
+        if iscoroutinefunction(view):
+            view = async_to_sync(view)
+        return view(request, *args, **kwargs)
+
+    async def async_dispatch(self, request):
+        view, args, kwargs = self.resolve(request)
+        if not iscoroutinefunction(view):
+            view = sync_to_async(view, thread_sensitive=True)
+        return await view(request, *args, **kwargs)
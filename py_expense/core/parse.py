@@ -22,9 +22,18 @@ __all__ = [
     'pos_int',
     'list_of_naturals',
     'list_of_str',
+    'subset_of',
+    'one_of',
+    'boolean',
+    'epoch',
+    'comparison',
+    'compile_lookups',
+    'Lookup',
     'ParamSpec',
 ]
 
+from asyncio import iscoroutinefunction
+from datetime import datetime, timezone
 from functools import wraps
 from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
 
@@ -45,6 +54,27 @@ class ParamSpec(NamedTuple):
     type: Callable
 
 
+class Lookup(NamedTuple):
+    """
+    A single ORM lookup on a field, e.g. ``Lookup('gte', 100)`` compiles to
+    ``field__gte=100``
+    """
+    op: str
+    value: Any
+
+
+# URI comparison operator -> Django lookup name
+_COMPARISON_OPS = {
+    'eq': 'exact',
+    'gt': 'gt',
+    'gte': 'gte',
+    'lt': 'lt',
+    'lte': 'lte',
+}
+
+_RANGE_SEP = '..'
+
+
 @func_name('Natural Number')
 def natural_number(s: str) -> int:
     """
@@ -109,6 +139,157 @@ def list_of_str(s: str) -> Optional[List[str]]:
     return s.split(',') if s else None
 
 
+def subset_of(choices: Iterable[str]) -> Callable[[str], Optional[List[str]]]:
+    """
+    Create a parser for a comma seprated list of strings that only allows
+    items from ``choices``
+
+    :param choices: The allowed items.
+    :return: A parser that returns the list of items.
+    """
+    choices = tuple(choices)
+    allowed = set(choices)
+
+    @func_name(f"List of {', '.join(choices)}")
+    def parse(s: str) -> Optional[List[str]]:
+        lst = list_of_str(s)
+        if lst is None:
+            return None
+        lst = [x.strip() for x in lst]
+        unknown = set(lst) - allowed
+        if unknown:
+            raise ValueError(f"Unknown items: {', '.join(sorted(unknown))}")
+        return lst
+
+    return parse
+
+
+def one_of(choices: Iterable[str]) -> Callable[[str], str]:
+    """
+    Create a parser for a string that must be one of ``choices``
+
+    :param choices: The allowed strings.
+    :return: A parser that returns the string.
+    """
+    choices = tuple(choices)
+
+    @func_name(f"One of {', '.join(choices)}")
+    def parse(s: str) -> str:
+        s = s.strip()
+        if s not in choices:
+            raise ValueError(f'Unknown choice {s}.')
+        return s
+
+    return parse
+
+
+@func_name('Boolean')
+def boolean(s: str) -> bool:
+    """
+    Try to convert a string to a boolean.
+
+    :param s: the string to convert, one of true/false/1/0 (case insensitive)
+    :return: the converted boolean.
+    :raises ValueError: If the conversion failed.
+    """
+    val = s.strip().lower()
+    if val in ('true', '1'):
+        return True
+    if val in ('false', '0'):
+        return False
+    raise ValueError('Must be true or false.')
+
+
+@func_name('Unix Epoch')
+def epoch(s: str) -> datetime:
+    """
+    Try to convert a string of unix epoch seconds to an aware UTC datetime.
+
+    :param s: the string to convert.
+    :return: the converted datetime.
+    :raises ValueError: If the conversion failed.
+    """
+    try:
+        return datetime.fromtimestamp(natural_number(s), tz=timezone.utc)
+    except (OverflowError, OSError) as e:
+        raise ValueError(str(e))
+
+
+def comparison(type_: Callable) -> Callable[[str], Optional[List[Lookup]]]:
+    """
+    Create a parser for a comma seprated list of comparisons on ``type_``.
+
+    Each item in the list is either ``op:value`` where op is one of
+    eq/gt/gte/lt/lte, or an inclusive range ``low..high``. Either end of a
+    range can be omitted, ``low..`` is the same as ``gte:low``. Each
+    operator can only be given once.
+
+    e.g. ``gte:100,lt:200`` or ``1500000000..1600000000``
+
+    :param type_: The type of the values being compared.
+    :return: A parser that returns a list of ``Lookup``
+    """
+
+    def parse_item(item: str) -> Lookup:
+        if _RANGE_SEP in item:
+            low, high = (x.strip() for x in item.split(_RANGE_SEP, 1))
+            if low and high:
+                return Lookup('range', (type_(low), type_(high)))
+            if low:
+                return Lookup('gte', type_(low))
+            if high:
+                return Lookup('lte', type_(high))
+            raise ValueError('Range must have at least one end.')
+        op, sep, val = item.partition(':')
+        if not sep:
+            return Lookup('exact', type_(item.strip()))
+        try:
+            return Lookup(_COMPARISON_OPS[op.strip()], type_(val.strip()))
+        except KeyError:
+            raise ValueError(f'Unknown operator {op}.')
+
+    @func_name(f'Comparison of {type_.__name__}')
+    def parse(s: str) -> Optional[List[Lookup]]:
+        s = s.rstrip(' ,').rstrip()
+        if not s:
+            return None
+        try:
+            lookups = [parse_item(x) for x in s.split(',')]
+        except (TypeError, ValueError) as e:
+            raise ValueError(str(e))
+        ops = [lookup.op for lookup in lookups]
+        for op in ops:
+            if ops.count(op) > 1:
+                # Only one value per lookup can be filtered on
+                raise ValueError(f'Operator {op} is given more than once.')
+        return lookups
+
+    return parse
+
+
+def compile_lookups(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compile parsed URI parameters into keyword arguments for
+    ``QuerySet.filter``
+
+    A list of ``Lookup`` compiles to one lookup per item, any other list
+    compiles to an ``__in`` lookup, and everything else is an exact match.
+
+    :param params: The parsed URI parameters.
+    :return: The ORM lookups.
+    """
+    res = {}
+    for name, val in params.items():
+        if isinstance(val, list) and val and all(isinstance(x, Lookup) for x in val):
+            for op, lookup_val in val:
+                res[f'{name}__{op}'] = lookup_val
+        elif isinstance(val, list):
+            res[f'{name}__in'] = val
+        else:
+            res[name] = val
+    return res
+
+
 def parse_parameters(param_specs: Iterable[ParamSpec],
                      param_dict: Dict[str, str]) -> Dict[str, Any]:
     """
@@ -141,23 +322,36 @@ def uri_params(spec: Iterable[ParamSpec], method: str):
     Decorate a view function to parse URI parameters.
 
     This will inject an argument with name ``params`` into the view function.
+    Works on both sync and async view functions.
 
     :param spec: The URI parameter spec.
     :param method: The method name to get the request parameters from.
     """
 
+    def parse(request):
+        try:
+            return parse_parameters(spec, getattr(request, method)), None
+        except ParseError as e:
+            return None, JsonResponse({'success': False, 'reason': e.args[0]}, status=400)
+
     def decorate(func):
 
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(request):
+                params, error = parse(request)
+                if error is not None:
+                    return error
+                return await func(request, params=params)
+
+            return async_wrapper
+
         @wraps(func)
         def wrapper(request):
-            try:
-                params = parse_parameters(spec, getattr(request, method))
-            except ParseError as e:
-                return JsonResponse(
-                    {'success': False, 'reason': e.args[0]}, status=400
-                )
-            else:
-                return func(request, params=params)
+            params, error = parse(request)
+            if error is not None:
+                return error
+            return func(request, params=params)
 
         return wrapper
 
@@ -0,0 +1,275 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Module for in process publish/subscribe.
+
+Messages are JSON serializable dicts published to a named channel, every
+subscription to that channel in this process gets a copy. ``PostgresBroker``
+fans messages out to every process through PostgreSQL LISTEN/NOTIFY.
+"""
+
+__all__ = [
+    'Subscription',
+    'AsyncSubscription',
+    'LocalBroker',
+    'PostgresBroker',
+    'MessageTooLarge',
+    'get_broker',
+]
+
+import asyncio
+import logging
+from collections import defaultdict
+from functools import lru_cache
+from json import loads
+from queue import Empty, SimpleQueue
+from select import select
+from threading import Lock, Thread
+from time import sleep
+from typing import Dict, Optional, Set
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from .render import dumps
+
+logger = logging.getLogger(__name__)
+
+Message = Dict
+
+
+class Subscription:
+    """
+    A subscription to a channel, for sync code. Use it as a context manager
+    or call ``close`` to unsubscribe.
+    """
+
+    def __init__(self, broker: 'LocalBroker', channel: str):
+        self.broker = broker
+        self.channel = channel
+        self.queue = SimpleQueue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def deliver(self, message: Message):
+        """Called by the broker, from any thread, for each message."""
+        self.queue.put(message)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Message]:
+        """
+        Wait for the next message.
+
+        :param timeout: Seconds to wait, forever if None.
+        :return: The message, or None if the timeout expired.
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class AsyncSubscription(Subscription):
+    """
+    A subscription to a channel, for async code. It must be created in the
+    event loop that calls ``get``
+    """
+
+    def __init__(self, broker: 'LocalBroker', channel: str):
+        super().__init__(broker, channel)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def deliver(self, message: Message):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Message]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBroker:
+    """
+    A broker that only delivers messages within the current process.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._lock = Lock()
+
+    def subscribe(self, channel: str, *, asynchronous: bool = False) -> Subscription:
+        """
+        Subscribe to a channel.
+
+        :param channel: The channel name.
+        :param asynchronous: Return an ``AsyncSubscription``, must be called
+                             from a running event loop.
+        :return: The subscription.
+        """
+        cls = AsyncSubscription if asynchronous else Subscription
+        subscription = cls(self, channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.channel, None)
+
+    def has_subscribers(self, channel: str) -> bool:
+        """
+        :return: False if nothing would receive a message published to the
+                 channel, so publishers can skip building it.
+        """
+        return bool(self._subscriptions.get(channel))
+
+    def deliver(self, channel: str, message: Message):
+        """Deliver a message to the subscriptions in this process."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def publish(self, channel: str, message: Message):
+        """
+        Publish a message to a channel.
+
+        :param channel: The channel name.
+        :param message: A JSON serializable dict.
+        """
+        self.deliver(channel, message)
+
+
+class MessageTooLarge(ValueError):
+    """
+    Error raised when a message is too large for the broker to publish.
+    """
+    pass
+
+
+class PostgresBroker(LocalBroker):
+    """
+    A broker that publishes with PostgreSQL NOTIFY, so messages reach the
+    subscriptions of every process connected to the same database.
+
+    Each process listens with its own connection in a daemon thread, started
+    on the first subscription. Like NOTIFY, messages published inside a
+    transaction are only sent once it commits. PostgreSQL limits payloads to
+    less than 8000 bytes, larger messages raise ``MessageTooLarge``.
+
+    :param alias: The alias of the database in ``DATABASES``.
+    :param pg_channel: The name of the PostgreSQL notification channel.
+    :param reconnect_delay: Seconds to wait before reconnecting the listener,
+                            doubled after each failure in a row.
+    :param max_reconnect_delay: The longest wait before reconnecting.
+    """
+
+    def __init__(self, alias: str = 'default', pg_channel: str = 'py_expense_events',
+                 reconnect_delay: float = 1, max_reconnect_delay: float = 60):
+        super().__init__()
+        self.alias = alias
+        self.pg_channel = pg_channel
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._listener = None
+
+    def has_subscribers(self, channel: str) -> bool:
+        # Other processes may be subscribed
+        return True
+
+    # The longest NOTIFY payload, in bytes
+    max_payload = 7999
+
+    def publish(self, channel: str, message: Message):
+        payload = dumps({'channel': channel, 'message': message})
+        if len(payload) > self.max_payload:
+            raise MessageTooLarge(f'A {len(payload)} bytes payload is larger than '
+                                  f'{self.max_payload} bytes.')
+        payload = payload.decode()
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.pg_channel, payload])
+
+    def subscribe(self, channel: str, *, asynchronous: bool = False) -> Subscription:
+        with self._lock:
+            if self._listener is None:
+                self._listener = Thread(target=self._listen, name='pg-listen', daemon=True)
+                self._listener.start()
+        return super().subscribe(channel, asynchronous=asynchronous)
+
+    def _connect(self):
+        import psycopg2
+        db = settings.DATABASES[self.alias]
+        conn = psycopg2.connect(dbname=db['NAME'], user=db['USER'], password=db['PASSWORD'],
+                                host=db['HOST'], port=db['PORT'])
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.pg_channel}"')
+        return conn
+
+    def _notify(self, payload: str):
+        try:
+            data = loads(payload)
+            self.deliver(data['channel'], data['message'])
+        except Exception:
+            # A bad payload doesn't need a new connection
+            logger.exception('Could not deliver notification %.200r', payload)
+
+    def _listen(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                conn = self._connect()
+                delay = self.reconnect_delay
+                try:
+                    while True:
+                        select([conn], [], [], 5)
+                        conn.poll()
+                        while conn.notifies:
+                            self._notify(conn.notifies.pop(0).payload)
+                finally:
+                    conn.close()
+            except Exception:
+                logger.exception('Event listener failed, reconnecting in %s seconds', delay)
+                sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+
+@lru_cache(maxsize=None)
+def get_broker() -> LocalBroker:
+    """
+    :return: The broker of this process, configured by the ``EVENT_BROKER`` setting.
+    """
+    config = settings.EVENT_BROKER
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
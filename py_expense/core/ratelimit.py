@@ -0,0 +1,202 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Module for rate limiting.
+
+Requests are counted with a sliding window counter: a counter for the
+current fixed window and one for the previous window, the previous count is
+weighted by how much of it still overlaps the sliding window. This only
+needs two integers per key no matter the request rate.
+"""
+
+__all__ = [
+    'RateLimitBackend',
+    'SharedMemoryBackend',
+    'DjangoCacheBackend',
+    'RateLimitMiddleware',
+    'get_rate_limit_backend',
+]
+
+from hashlib import blake2b
+from math import ceil
+from mmap import mmap
+from multiprocessing import Lock
+from struct import Struct
+from time import time
+from zlib import crc32
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.module_loading import import_string
+
+from .render import FastJsonResponse
+
+
+def sliding_window(now: float, period: float, limit: int, previous: int,
+                   current: int) -> float:
+    """
+    Check a request against a sliding window.
+
+    :param now: The current time.
+    :param period: The length of the window, in seconds.
+    :param limit: The number of requests allowed per window.
+    :param previous: The count of the previous fixed window.
+    :param current: The count of the current fixed window, excluding this request.
+    :return: 0 if the request is allowed, else the seconds until it would be.
+    """
+    elapsed = now % period / period
+    if previous * (1 - elapsed) + current < limit:
+        return 0
+    if current >= limit or not previous:
+        return period - now % period
+    # The weight of the previous window drops below the limit right after
+    # 1 - (limit - current) / previous through the current window.
+    return max((1 - (limit - current) / previous - elapsed) * period, 1e-3)
+
+
+class RateLimitBackend:
+    """
+    Base class for the storage of rate limit counters.
+
+    :param limit: The number of requests allowed per period.
+    :param period: The length of a period, in seconds.
+    """
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+
+    def hit(self, key: str, now: float = None) -> float:
+        """
+        Count a request, unless it's over the limit.
+
+        :param key: The key to count the request for.
+        :param now: The current time, defaults to ``time()``.
+        :return: 0 if the request is allowed, else the seconds until it would be.
+        """
+        raise NotImplementedError
+
+
+class SharedMemoryBackend(RateLimitBackend):
+    """
+    Counters in a fixed size block of memory shared by every worker process
+    forked after it's created, e.g. by ``manage.py serve`` which preloads the
+    application by default. Without preloading each process gets its own
+    counters.
+
+    Keys are hashed into ``slots``, so keys that collide share a counter.
+
+    :param slots: The number of counters.
+    """
+    # window number, previous count, current count
+    slot = Struct('qqq')
+
+    def __init__(self, limit: int, period: float, slots: int = 65536):
+        super().__init__(limit, period)
+        self.slots = slots
+        self.memory = mmap(-1, slots * self.slot.size)
+        self.lock = Lock()
+
+    def hit(self, key: str, now: float = None) -> float:
+        now = time() if now is None else now
+        window = int(now // self.period)
+        offset = crc32(key.encode()) % self.slots * self.slot.size
+        with self.lock:
+            last, previous, current = self.slot.unpack_from(self.memory, offset)
+            if last != window:
+                previous = current if last == window - 1 else 0
+                current = 0
+            retry_after = sliding_window(now, self.period, self.limit, previous, current)
+            if not retry_after:
+                current += 1
+            self.slot.pack_into(self.memory, offset, window, previous, current)
+        return retry_after
+
+
+class DjangoCacheBackend(RateLimitBackend):
+    """
+    Counters in a Django cache, shared by every process using the same cache.
+
+    The counters rely on ``cache.incr`` being atomic, which it is for the
+    memcached and redis backends. Keys are hashed, so credentials never end
+    up in the cache and every key is safe to use with memcached.
+
+    :param alias: The alias of the cache in ``CACHES``.
+    :param prefix: The prefix of the cache keys.
+    """
+
+    def __init__(self, limit: int, period: float, alias: str = 'default',
+                 prefix: str = 'ratelimit'):
+        super().__init__(limit, period)
+        self.cache = caches[alias]
+        self.prefix = prefix
+
+    def hit(self, key: str, now: float = None) -> float:
+        now = time() if now is None else now
+        window = int(now // self.period)
+        key = blake2b(key.encode(), digest_size=16).hexdigest()
+        current_key = f'{self.prefix}:{key}:{window}'
+        self.cache.add(current_key, 0, timeout=ceil(self.period * 2))
+        current = self.cache.incr(current_key) - 1
+        previous = self.cache.get(f'{self.prefix}:{key}:{window - 1}', 0)
+        retry_after = sliding_window(now, self.period, self.limit, previous, current)
+        if retry_after:
+            self.cache.decr(current_key)
+        return retry_after
+
+
+def get_rate_limit_backend() -> RateLimitBackend:
+    """
+    :return: The backend configured by the ``RATE_LIMIT`` setting.
+    """
+    config = settings.RATE_LIMIT
+    backend = import_string(config['BACKEND'])
+    return backend(config['LIMIT'], config['PERIOD'], **config.get('OPTIONS', {}))
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """
+    Limit the request rate of each client, requests over the limit get a 429
+    response with a ``Retry-After`` header.
+
+    Clients are identified by their IP address, subclasses can override
+    ``client_key`` to tell apart the clients behind one address. The key must
+    not come from anything the client sends unchecked, or a client gets a
+    fresh limit for every value it makes up.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.backend = get_rate_limit_backend()
+
+    @staticmethod
+    def client_key(request) -> str:
+        """
+        :param request: The request.
+        :return: The key the request is counted under.
+        """
+        return f'ip:{request.META.get("REMOTE_ADDR")}'
+
+    def process_request(self, request):
+        retry_after = self.backend.hit(self.client_key(request))
+        if retry_after:
+            response = FastJsonResponse(
+                {'success': False, 'reason': 'Too many requests.'}, status=429
+            )
+            response['Retry-After'] = str(max(ceil(retry_after), 1))
+            return response
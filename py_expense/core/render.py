@@ -0,0 +1,127 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Module for fast JSON rendering"""
+
+__all__ = [
+    'dumps',
+    'get_backend',
+    'register_backend',
+    'FastJsonResponse',
+    'sse_event',
+]
+
+import json
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+Backend = Callable[[Any], bytes]
+
+_encoder = DjangoJSONEncoder()
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(
+        obj, default=_encoder.default, separators=(',', ':'), ensure_ascii=False
+    ).encode('utf-8')
+
+
+_BACKENDS: Dict[str, Backend] = {'stdlib': _stdlib_dumps}
+
+if orjson is not None:
+    # Datetimes are passed through to ``DjangoJSONEncoder`` so both backends
+    # render them the same way.
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def _orjson_dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_encoder.default, option=_ORJSON_OPTIONS)
+
+    _BACKENDS['orjson'] = _orjson_dumps
+
+
+def register_backend(name: str, backend: Backend):
+    """
+    Register a JSON backend.
+
+    :param name: The name of the backend, used in the ``JSON_BACKEND`` setting.
+    :param backend: A function that encodes an object to JSON bytes.
+    """
+    _BACKENDS[name] = backend
+
+
+def get_backend(name: Optional[str] = None) -> Backend:
+    """
+    Get a JSON backend by name.
+
+    :param name: The backend name, defaults to the ``JSON_BACKEND`` setting.
+                 ``auto`` uses orjson if it's installed, otherwise the
+                 standard library.
+    :return: The backend.
+    :raises ValueError: If the backend does not exist.
+    """
+    if name is None:
+        name = getattr(settings, 'JSON_BACKEND', 'auto')
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in _BACKENDS else 'stdlib'
+    try:
+        return _BACKENDS[name]
+    except KeyError:
+        raise ValueError(f'Unknown JSON backend {name}.')
+
+
+def dumps(obj: Any, backend: Optional[str] = None) -> bytes:
+    """
+    Encode an object to JSON bytes.
+
+    :param obj: The object to encode.
+    :param backend: The backend name, defaults to the ``JSON_BACKEND`` setting.
+    :return: The encoded bytes.
+    """
+    return get_backend(backend)(obj)
+
+
+class FastJsonResponse(HttpResponse):
+    """
+    A ``JsonResponse`` that encodes with the configured JSON backend.
+
+    :param data: The data to encode, it does not have to be a dict.
+    :param backend: The backend name, defaults to the ``JSON_BACKEND`` setting.
+    """
+
+    def __init__(self, data: Any, *, backend: Optional[str] = None, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data, backend), **kwargs)
+
+
+def sse_event(data: Any, event: Optional[str] = None) -> bytes:
+    """
+    Encode a Server-Sent Event.
+
+    :param data: The event data, encoded as JSON.
+    :param event: The event type, clients get untyped ``message`` events if None.
+    :return: The encoded event.
+    """
+    head = b'' if event is None else f'event: {event}\n'.encode()
+    return head + b'data: ' + dumps(data) + b'\n\n'
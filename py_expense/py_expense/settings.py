@@ -62,6 +62,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ApiFastPathMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,8 +72,65 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Requests under API_PREFIX skip the rest of MIDDLEWARE and only go through
+# API_MIDDLEWARE, the API is token authenticated JSON so it does not need
+# sessions, CSRF, messages or clickjacking protection.
+API_PREFIX = '/api/'
+
+API_MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'api.auth.TokenRateLimitMiddleware',
+    'api.auth.TokenAuthenticationMiddleware',
+    'core.LoaderMiddleware',
+]
+
+# In process cache of API token -> user, per worker process
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 300
+
+# In process cache of share membership, per worker process, see
+# api.membership. A TTL of 0 turns it off.
+MEMBERSHIP_CACHE_SIZE = 100000
+MEMBERSHIP_CACHE_TTL = 60
+
+# Cache of shares, users and expenses served by /api/v1/objects/, see
+# api.multiget. Use a cache shared by every worker process, or entries
+# invalidated by another process are served until they expire.
+OBJECT_CACHE = {
+    'ALIAS': 'default',
+    'TTL': 60,
+}
+
+# Requests allowed per client per PERIOD seconds, see core.ratelimit. Use
+# core.DjangoCacheBackend with a shared cache when workers are not forked
+# from one preloaded process.
+RATE_LIMIT = {
+    'BACKEND': 'core.SharedMemoryBackend',
+    'LIMIT': int(getenv('RATE_LIMIT', 600)),
+    'PERIOD': 60,
+}
+
+# Broker of live share activity, see core.pubsub. core.LocalBroker only
+# reaches clients connected to the same process, use core.PostgresBroker
+# when serving with more than one worker process.
+EVENT_BROKER = {
+    'BACKEND': getenv('EVENT_BROKER', 'core.LocalBroker'),
+}
+
+# Seconds between keepalive comments on Server-Sent Event streams
+SSE_HEARTBEAT = 15
+
+# Seconds the change feed stays behind the present, see api.changes. Longer
+# than a write transaction takes to commit.
+CHANGES_SAFETY_LAG = 5
+
 ROOT_URLCONF = 'py_expense.urls'
 
+# JSON encoder for API responses, one of 'auto', 'orjson' or 'stdlib'.
+# 'auto' uses orjson if it's installed.
+JSON_BACKEND = 'auto'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -91,6 +149,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'py_expense.wsgi.application'
 
+ASGI_APPLICATION = 'py_expense.asgi.application'
+
+# Serve the API with the async views in ``api.async_views``, set by asgi.py
+ASYNC_VIEWS = getenv('ASYNC_VIEWS') == '1'
+
 # Database
 # https://docs.djangoproject.com/en/1.11/ref/settings/#databases
 DATABASES = {
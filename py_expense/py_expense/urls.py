@@ -14,16 +14,34 @@
 #  You should have received a copy of the GNU Affero General Public License
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 
-from api import views
+if settings.ASYNC_VIEWS:
+    from api import async_views as views
+else:
+    from api import views
 
 API_V1 = 'api/v1'
 V1_SHARES = f'{API_V1}/shares'
+V1_USERS = f'{API_V1}/users'
+V1_EXPENSES = f'{API_V1}/expenses'
+V1_STATUS = f'{API_V1}/status'
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path(f'{V1_SHARES}/list/', views.share_list, name='share_list'),
-    path(f'{V1_SHARES}/create/', views.share_create, name='share_create')
+    path(f'{V1_SHARES}/create/', views.share_create, name='share_create'),
+    path(f'{V1_SHARES}/update/', views.share_update, name='share_update'),
+    path(f'{V1_SHARES}/events/', views.share_events, name='share_events'),
+    path(f'{V1_SHARES}/summary/', views.share_summary_view, name='share_summary'),
+    path(f'{V1_USERS}/merge/', views.user_merge, name='user_merge'),
+    path(f'{V1_EXPENSES}/export/', views.expense_export, name='expense_export'),
+    path(f'{V1_EXPENSES}/resolve/', views.expense_resolve, name='expense_resolve'),
+    path(f'{API_V1}/changes/', views.changes, name='changes'),
+    path(f'{API_V1}/search/', views.search_view, name='search'),
+    path(f'{API_V1}/objects/', views.objects, name='objects'),
+    path(f'{API_V1}/batch/', views.batch, name='batch'),
+    path(f'{V1_STATUS}/caches/', views.status_caches, name='status_caches'),
 ]
@@ -23,3 +23,11 @@ def mock_view(request):
 
 def mock_view_params(request, *, params):
     return params
+
+
+async def mock_async_view(request):
+    return request
+
+
+async def mock_async_view_params(request, *, params):
+    return params
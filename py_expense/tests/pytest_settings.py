@@ -23,3 +23,10 @@ DATABASES = {
         'NAME': ':memory:',
     }
 }
+
+# Test databases reuse IDs after rolling back, the membership tests turn
+# the cache on and clear it themselves.
+MEMBERSHIP_CACHE_TTL = 0
+
+# Tests read the change feed right after writing to it, in one transaction
+CHANGES_SAFETY_LAG = 0
@@ -0,0 +1,156 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from json import loads
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from api.archive import archive_batch, archive_expenses, cutoff
+from api.export import export, export_queryset
+from api.models import (ArchivedExpense, ArchivedExpenseRatio, ArchiveSummary, Expense,
+                        ExpenseRatio, Share, Tombstone, User)
+from api.readers import ShareReader
+from api.serializers import ShareSerializer
+from tests.utils import parametrize
+
+pytestmark = pytest.mark.django_db
+
+OLD = timezone.now() - timedelta(days=365)
+
+
+@pytest.fixture
+def share_expenses():
+    alice, bob = User.objects.create(name='alice'), User.objects.create(name='bob')
+    share = Share.objects.create(name='trip', description='')
+    share.users.add(alice, bob)
+    expenses = [
+        Expense.new(share=share, paid_by=payer, description=str(total), total=total,
+                    resolved=resolved, paid_for={alice: (1, 3), bob: (2, 3)})
+        for payer, total, resolved in ((alice, 30, True), (bob, '1.5', True),
+                                       (alice, 6, True), (bob, 9, False))
+    ]
+    # The last resolved one was updated recently
+    Expense.objects.filter(id__in=[e.id for e in expenses[:2]]).update(updated_at=OLD)
+    return share, expenses, alice, bob
+
+
+def test_archive(share_expenses):
+    share, expenses, alice, bob = share_expenses
+    total = share.total
+    ratios = {e.id: list(e.paid_for.values_list('user_id', 'numerator', 'denominator'))
+              for e in expenses}
+    assert archive_expenses(cutoff(30)) == 2
+    assert set(Expense.objects.values_list('id', flat=True)) == {e.id for e in expenses[2:]}
+    assert not ExpenseRatio.objects.filter(expense_id__in=[e.id for e in expenses[:2]]).exists()
+    for expense in expenses[:2]:
+        archived = ArchivedExpense.objects.get(id=expense.id)
+        assert (archived.share_id, archived.paid_by_id, archived.total, archived.description) \
+            == (share.id, expense.paid_by_id, Decimal(expense.total), expense.description)
+        assert list(ArchivedExpenseRatio.objects.filter(expense=archived).order_by('id')
+                    .values_list('user_id', 'numerator', 'denominator')) == ratios[expense.id]
+    summaries = {s.user_id: s for s in ArchiveSummary.objects.filter(share=share)}
+    assert (summaries[alice.id].expenses, summaries[alice.id].paid) == (1, 30)
+    assert (summaries[bob.id].expenses, summaries[bob.id].paid) == (1, Decimal('1.5'))
+    assert summaries[alice.id].owed == Decimal('10.5')
+    assert summaries[bob.id].owed == Decimal('21')
+    # Archival is not a deletion, but the share lists fewer expenses
+    assert not Tombstone.objects.exists()
+    assert Share.objects.get(id=share.id).updated_at > share.updated_at
+    assert share.total == total == 46.5
+    assert archive_expenses(cutoff(30)) == 0
+
+
+@parametrize('batch_size, max_batches, archived', [(1, 1, 1), (1, None, 2), (5, 1, 2)])
+def test_batches(share_expenses, batch_size, max_batches, archived):
+    share, expenses, *_ = share_expenses
+    progress = []
+    assert archive_expenses(cutoff(30), batch_size=batch_size, max_batches=max_batches,
+                            on_batch=progress.append) == archived
+    assert progress[-1] == archived
+    # The lowest IDs go first
+    assert set(ArchivedExpense.objects.values_list('id', flat=True)) == \
+        {e.id for e in expenses[:archived]}
+
+
+def test_summary_accumulates(share_expenses):
+    share, expenses, alice, _ = share_expenses
+    archive_batch(cutoff(30), 1)
+    archive_batch(cutoff(30), 1)
+    Expense.objects.filter(id=expenses[2].id).update(updated_at=OLD)
+    archive_batch(cutoff(30), 1)
+    summary = ArchiveSummary.objects.get(share=share, user=alice)
+    assert (summary.expenses, summary.paid) == (2, 36)
+    assert ArchiveSummary.objects.count() == 2
+
+
+def test_summary_created_concurrently(share_expenses, monkeypatch):
+    share, expenses, alice, _ = share_expenses
+    bulk_create = ArchiveSummary.objects.bulk_create
+
+    def racing(objs, **kwargs):
+        # Another archival creates the summary first
+        ArchiveSummary.objects.create(share=share, user=alice, expenses=1, paid=1, owed=1)
+        return bulk_create(objs, **kwargs)
+
+    monkeypatch.setattr(ArchiveSummary.objects, 'bulk_create', racing)
+    assert archive_batch(cutoff(30), 1) == 1
+    summary = ArchiveSummary.objects.get(share=share, user=alice)
+    assert (summary.expenses, summary.paid, summary.owed) == (2, 31, Decimal(11))
+
+
+def test_share_totals(share_expenses):
+    share, *_ = share_expenses
+    archive_expenses(cutoff(30))
+    queryset = Share.objects.filter(id=share.id)
+    assert ShareReader(['total']).serialize(queryset) == [{'total': 46.5}]
+    setup = ShareSerializer.setup_queryset(queryset, ['total'])
+    assert ShareSerializer(setup.get()).data['total'] == 46.5
+    empty = Share.objects.create(name='empty', description='')
+    assert ShareReader(['total']).serialize(Share.objects.filter(id=empty.id)) == \
+        [{'total': 0.0}]
+
+
+def test_export(share_expenses):
+    share, expenses, alice, bob = share_expenses
+    before = b''.join(export(Expense.objects.filter(share=share), 'ndjson')).decode()
+    archive_expenses(cutoff(30))
+    params = {'share': share.id}
+    after = b''.join(export(export_queryset(params), 'ndjson',
+                            archived=export_queryset(params, archived=True))).decode()
+    assert sorted(map(loads, after.splitlines()), key=lambda e: e['id']) == \
+        [loads(line) for line in before.splitlines()]
+    assert set(export_queryset({'user': bob.id}, archived=True)) == \
+        set(ArchivedExpense.objects.all())
+
+
+def test_command(share_expenses):
+    out = StringIO()
+    call_command('archive_expenses', '--days', '30', '--dry-run', stdout=out)
+    assert out.getvalue() == 'Would archive 2 expenses.\n'
+    assert not ArchivedExpense.objects.exists()
+    out = StringIO()
+    call_command('archive_expenses', '--days', '30', '--batch-size', '1', '--max-batches', '1',
+                 stdout=out, stderr=StringIO())
+    assert out.getvalue().endswith('1 left.\n')
+    # Resumes where it stopped
+    call_command('archive_expenses', '--days', '30', stdout=StringIO(), stderr=StringIO())
+    assert ArchivedExpense.objects.count() == 2
@@ -0,0 +1,117 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from json import loads
+
+import pytest
+from django.core.management import call_command
+from django.test import Client
+
+from api.auth import authenticate, token_cache
+from api.models import Token
+from tests.utils import parametrize, random_users
+
+pytestmark = pytest.mark.django_db
+
+LIST_PATH = '/api/v1/shares/list/'
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    token_cache.clear()
+    token_cache.reset_stats()
+
+
+def _get(path, key=None, scheme='Token'):
+    headers = {} if key is None else {'HTTP_AUTHORIZATION': f'{scheme} {key}'}
+    return Client().get(path, **headers)
+
+
+def test_authenticated():
+    token = Token.new(random_users(1)[0])
+    res = _get(LIST_PATH, token.key)
+    assert res.status_code == 200
+    assert res.wsgi_request.api_user == token.user
+
+
+@parametrize('key, scheme', [(None, None), ('does not exist', 'Token'), ('', 'Token'),
+                             ('valid', 'Bearer')])
+def test_unauthenticated(key, scheme):
+    token = Token.new(random_users(1)[0])
+    res = _get(LIST_PATH, token.key if key == 'valid' else key, scheme)
+    assert res.status_code == 401
+    assert res['WWW-Authenticate'] == 'Token'
+    assert loads(res.content)['success'] is False
+
+
+def test_non_api_not_authenticated():
+    assert _get('/admin/login/').status_code == 200
+
+
+def test_cached(django_assert_num_queries):
+    token = Token.new(random_users(1)[0])
+    with django_assert_num_queries(1):
+        assert authenticate(token.key) == token.user
+    with django_assert_num_queries(0):
+        assert authenticate(token.key) == token.user
+    assert token_cache.stats()['hits'] == 1
+    assert token_cache.stats()['misses'] == 1
+
+
+def test_missing_not_cached():
+    assert authenticate('does not exist') is None
+    assert len(token_cache) == 0
+
+
+@parametrize('how', ['revoke', 'queryset', 'user'])
+def test_revoke_invalidates(how):
+    user, = random_users(1)
+    token = Token.new(user)
+    assert authenticate(token.key) == user
+    if how == 'revoke':
+        token.revoke()
+    elif how == 'queryset':
+        Token.objects.filter(user=user).delete()
+    else:
+        user.delete()
+    assert authenticate(token.key) is None
+
+
+def test_status_caches():
+    token = Token.new(random_users(1)[0])
+    _get(LIST_PATH, token.key)
+    res = _get('/api/v1/status/caches/', token.key)
+    stats = loads(res.content)['tokens']
+    assert stats['size'] == 1
+    assert stats['hits'] >= 1
+
+
+def test_token_command(capsys):
+    user, = random_users(1)
+    call_command('token', 'create', str(user.id))
+    key = capsys.readouterr().out.strip()
+    assert Token.objects.get(pk=key).user == user
+    call_command('token', 'list', str(user.id))
+    assert capsys.readouterr().out.startswith(key)
+    other = Token.new(random_users(1)[0])
+    call_command('token', 'list')
+    assert capsys.readouterr().out.split('\n')[:2] == [
+        f'{key} {user.id} {int(Token.objects.get(pk=key).created_at.timestamp())}',
+        f'{other.key} {other.user_id} {int(other.created_at.timestamp())}',
+    ]
+    call_command('token', 'revoke', key)
+    assert not Token.objects.filter(pk=key).exists()
@@ -0,0 +1,171 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from json import dumps, loads
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory
+
+from api import async_views, views
+from api.models import Expense, Share, User
+from api.serializers import ExpenseSerializer
+from api.views import MAX_BATCH_OPERATIONS, run_batch
+from tests.utils import parametrize, random_shares, random_users
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def share_users():
+    share, = random_shares(1)
+    users = random_users(3)
+    share.users.add(*users[:2])
+    return share, users
+
+
+def _expense(share, payer, *paid_for, description='lunch'):
+    return {'description': description, 'share': share.id, 'total': 12, 'paid_by': payer.id,
+            'paid_for': {str(u.id): f'1/{len(paid_for)}' for u in paid_for}}
+
+
+def test_expense_paid_for_validated(share_users):
+    share, users = share_users
+    serializer = ExpenseSerializer(data=_expense(share, users[0], *users[:2]))
+    assert serializer.is_valid(), serializer.errors
+    assert serializer.validated_data['paid_for'] == {users[0]: (1, 2), users[1]: (1, 2)}
+    expense = serializer.save()
+    assert {r.user: (r.numerator, r.denominator) for r in expense.paid_for} == \
+        {users[0]: (1, 2), users[1]: (1, 2)}
+
+
+def test_batch(share_users):
+    share, users = share_users
+    body, status = run_batch({'operations': [
+        {'op': 'share.update', 'id': share.id,
+         'data': {'description': 'trip', 'users': [u.id for u in users]}},
+        {'op': 'expense.create', 'data': _expense(share, users[2], *users)},
+        {'op': 'expense.create', 'data': _expense(share, users[0], users[0])},
+        {'op': 'user.update', 'id': str(users[1].id), 'data': {'name': 'bob'}},
+    ]})
+    assert status == 200
+    assert (body['success'], body['committed']) == (True, True)
+    assert [r['status'] for r in body['results']] == [200] * 4
+    share.refresh_from_db()
+    assert share.description == 'trip'
+    assert set(share.users.all()) == set(users)
+    expenses = Expense.objects.filter(share=share).order_by('id')
+    assert [e.id for e in expenses] == [r['id'] for r in body['results'][1:3]]
+    assert len(expenses[0].paid_for) == 3
+    assert User.objects.get(id=users[1].id).name == 'bob'
+
+
+def test_batch_update_expense(share_users):
+    share, users = share_users
+    expense = Expense.new(share=share, paid_by=users[0], description='a', total=1,
+                          paid_for={users[0]: (1, 1)})
+    body, status = run_batch({'operations': [
+        {'op': 'expense.update', 'id': expense.id,
+         'data': {'resolved': True, 'paid_for': {str(users[1].id): '1/1'}}},
+    ]})
+    assert status == 200, body
+    expense.refresh_from_db()
+    assert expense.resolved
+    assert [r.user for r in expense.paid_for] == [users[1]]
+
+
+def test_batch_queries(share_users, django_assert_max_num_queries):
+    share, users = share_users
+    operations = [{'op': 'expense.create', 'data': _expense(share, users[0], *users[:2])}
+                  for _ in range(20)]
+    body, _ = run_batch({'operations': operations})
+    assert body['success']
+    # The share and users are looked up once for the whole batch
+    with django_assert_max_num_queries(5 + 20 * 7):
+        body, _ = run_batch({'operations': operations})
+    assert body['success']
+
+
+@parametrize('operation, status, reason', [
+    ({'op': 'share.delete', 'data': {}}, 400, 'op must be one of'),
+    ({'op': 'share.update', 'data': {}}, 400, 'id must be'),
+    ({'op': 'share.update', 'id': 'a', 'data': {}}, 400, 'id must be'),
+    ({'op': 'share.create', 'data': []}, 400, 'data must be'),
+    ('share.create', 400, 'must be a JSON object'),
+    ({'op': 'share.update', 'id': 9999, 'data': {}}, 404, 'id is not found'),
+    ({'op': 'share.create', 'data': {'name': ''}}, 400, 'name'),
+    ({'op': 'expense.update', 'id': 9999, 'data': {}}, 404, 'id is not found'),
+])
+def test_batch_atomic_failure(share_users, operation, status, reason):
+    share, users = share_users
+    body, code = run_batch({'operations': [
+        {'op': 'share.create', 'data': {'name': 'new', 'description': 'x', 'users': []}},
+        operation,
+        {'op': 'share.create', 'data': {'name': 'never run', 'description': 'x', 'users': []}},
+    ]})
+    assert code == 400
+    assert (body['success'], body['committed']) == (False, False)
+    first, failed = body['results']
+    assert first['success'] and first['status'] == 200
+    assert failed['status'] == status
+    assert reason in failed['reason']
+    assert list(Share.objects.all()) == [share]
+
+
+def test_batch_not_atomic(share_users):
+    share, users = share_users
+    body, status = run_batch({'atomic': False, 'operations': [
+        {'op': 'share.create', 'data': {'name': 'first', 'description': 'x', 'users': []}},
+        {'op': 'expense.create', 'data': _expense(share, users[2], users[0])},
+        {'op': 'share.create', 'data': {'name': 'second', 'description': 'x', 'users': []}},
+    ]})
+    assert status == 200
+    assert (body['success'], body['committed']) == (False, True)
+    assert [r['success'] for r in body['results']] == [True, False, True]
+    assert set(Share.objects.values_list('name', flat=True)) == {share.name, 'first', 'second'}
+    assert not Expense.objects.exists()
+
+
+@parametrize('data, reason', [
+    ({}, 'operations must be a non empty list'),
+    ({'operations': []}, 'operations must be a non empty list'),
+    ({'operations': {}}, 'operations must be a non empty list'),
+    ({'operations': [{}] * (MAX_BATCH_OPERATIONS + 1)},
+     f'more than {MAX_BATCH_OPERATIONS} operations'),
+    ({'operations': [{}], 'atomic': 'yes'}, 'atomic must be a bool'),
+])
+def test_batch_fail(data, reason):
+    assert run_batch(data) == ({'success': False, 'reason': reason}, 400)
+
+
+@parametrize('module', [views, async_views])
+def test_view(share_users, module):
+    share, users = share_users
+    request = RequestFactory().post('/', data=dumps({'operations': [
+        {'op': 'expense.create', 'data': _expense(share, users[0], users[0])},
+    ]}), content_type='application/json')
+    res = async_to_sync(module.batch)(request) if module is async_views else module.batch(request)
+    assert res.status_code == 200
+    assert loads(res.content)['results'][0]['success'] is True
+    assert Expense.objects.filter(share=share).count() == 1
+
+
+@parametrize('module', [views, async_views])
+def test_view_bad_json(module):
+    request = RequestFactory().post('/', data='not json', content_type='application/json')
+    res = async_to_sync(module.batch)(request) if module is async_views else module.batch(request)
+    assert res.status_code == 400
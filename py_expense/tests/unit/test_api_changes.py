@@ -0,0 +1,228 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from datetime import datetime, timedelta, timezone
+from json import loads
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory
+from django.utils import timezone as django_timezone
+
+from api import async_views, views
+from api.changes import Cursor, changes_since, cursor
+from api.importer import import_expenses
+from api.models import Expense, Share, Tombstone, User
+from tests.utils import parametrize, random_expenses, random_shares
+
+pytestmark = pytest.mark.django_db
+
+
+def _sync(limit, position=None):
+    """Page through the whole feed, return every page."""
+    pages = []
+    while True:
+        page = changes_since(position, limit)
+        pages.append(page)
+        position = cursor(page['cursor']) if page['cursor'] else None
+        if not page['has_more']:
+            return pages
+
+
+def _ids(pages, key):
+    return [x['id'] for page in pages for x in page[key]]
+
+
+def test_cursor_round_trip():
+    position = Cursor(datetime(2020, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc), 2, 42)
+    assert str(position) == '1577934245678901.2.42'
+    assert cursor(str(position)) == position
+
+
+@parametrize('s', ['', '1.2', '1.2.3.4', 'a.1.1', '1.3.1', '-1.1.1', '1.1.-1',
+                   '99999999999999999999.1.1'])
+def test_cursor_invalid(s):
+    with pytest.raises(ValueError):
+        cursor(s)
+
+
+def test_empty():
+    assert changes_since(None, 10) == {
+        'shares': [], 'expenses': [], 'deleted': [], 'cursor': None, 'has_more': False
+    }
+
+
+@parametrize('limit', [1, 2, 5, 100])
+def test_full_sync(limit):
+    expenses, shares, _ = random_expenses(5)
+    pages = _sync(limit)
+    assert all(len(p['shares']) + len(p['expenses']) <= limit for p in pages)
+    assert sorted(_ids(pages, 'shares')) == sorted(s.id for s in shares)
+    assert sorted(_ids(pages, 'expenses')) == sorted(e.id for e in expenses)
+    assert pages[-1]['has_more'] is False
+    # Nothing changed since the last cursor
+    last = cursor(pages[-1]['cursor'])
+    assert changes_since(last, limit) == {
+        'shares': [], 'expenses': [], 'deleted': [], 'cursor': str(last), 'has_more': False
+    }
+
+
+@parametrize('limit', [1, 2, 3])
+def test_same_time(limit):
+    expenses, shares, _ = random_expenses(4)
+    position = cursor(changes_since(None, 100)['cursor'])
+    now = datetime.now(timezone.utc)
+    Share.objects.update(updated_at=now)
+    Expense.objects.update(updated_at=now)
+    pages = _sync(limit, position)
+    assert sorted(_ids(pages, 'shares')) == sorted(s.id for s in shares)
+    assert sorted(_ids(pages, 'expenses')) == sorted(e.id for e in expenses)
+
+
+def test_incremental():
+    expenses, shares, users = random_expenses(3)
+    position = cursor(changes_since(None, 100)['cursor'])
+    shares[0].description = 'new'
+    shares[0].save()
+    expenses[1].generate_ratio({users[0]: (1, 2), users[1]: (1, 2)})
+    page = changes_since(position, 100)
+    assert page['shares'] == [{**page['shares'][0], 'id': shares[0].id, 'description': 'new'}]
+    expense, = page['expenses']
+    assert expense['id'] == expenses[1].id
+    assert expense['paid_for'] == {users[0].id: '1/2', users[1].id: '1/2'}
+
+
+def test_deleted():
+    expenses, shares, _ = random_expenses(2)
+    position = cursor(changes_since(None, 100)['cursor'])
+    expected = [
+        {'type': 'expense', 'id': expenses[0].id},
+        {'type': 'expense', 'id': expenses[1].id},
+        {'type': 'share', 'id': shares[1].id},
+    ]
+    expenses[0].delete()
+    shares[1].delete()
+    page = changes_since(position, 100)
+    assert page['deleted'] == expected
+    assert Tombstone.objects.count() == 3
+    # The share of the deleted expense lost it
+    share, = page['shares']
+    assert (share['id'], share['expenses']) == (shares[0].id, [])
+    assert page['expenses'] == []
+
+
+def _add(expenses, shares):
+    Expense.new(description='new', share=shares[1], paid_by=expenses[0].paid_by, total=1,
+                paid_for={expenses[0].paid_by: (1, 1)})
+
+
+def _move(expenses, shares):
+    expenses[0].share = shares[1]
+    expenses[0].save()
+
+
+def _total(expenses, shares):
+    expenses[0].total = 12345
+    expenses[0].save()
+
+
+def _describe(expenses, shares):
+    expenses[0].description = 'new'
+    expenses[0].save()
+
+
+@parametrize('change, changed', [(_add, [1]), (_move, [0, 1]), (_total, [0]), (_describe, [])])
+def test_share_changed(change, changed):
+    expenses, shares, _ = random_expenses(2)
+    position = cursor(changes_since(None, 100)['cursor'])
+    change(expenses, shares)
+    page = changes_since(position, 100)
+    assert sorted(_ids([page], 'shares')) == [shares[i].id for i in changed]
+
+
+def test_safety_lag(settings):
+    settings.CHANGES_SAFETY_LAG = 60
+    expenses, shares, _ = random_expenses(2)
+    # Not served until they are older than the lag
+    assert changes_since(None, 100)['cursor'] is None
+    old = datetime.now(timezone.utc) - timedelta(seconds=120)
+    Share.objects.update(updated_at=old)
+    Expense.objects.filter(id=expenses[0].id).update(updated_at=old)
+    page = changes_since(None, 100)
+    assert (_ids([page], 'shares'), _ids([page], 'expenses')) == \
+        ([s.id for s in shares], [expenses[0].id])
+    assert page['has_more'] is False
+    # A change that commits late, with a time before the lag, is still served
+    late = old + timedelta(seconds=30)
+    Expense.objects.filter(id=expenses[1].id).update(updated_at=late)
+    page = changes_since(cursor(page['cursor']), 100)
+    assert _ids([page], 'expenses') == [expenses[1].id]
+
+
+def test_import_outlives_lag(settings, monkeypatch):
+    settings.CHANGES_SAFETY_LAG = 5
+    alice = User.objects.create(name='alice')
+    trip, other = (Share.objects.create(name=name, description='') for name in ('trip', 'other'))
+    trip.users.add(alice)
+    clock = [datetime.now(timezone.utc) - timedelta(seconds=120)]
+    monkeypatch.setattr(django_timezone, 'now', lambda: clock[0])
+    positions = []
+
+    def on_batch(stats):
+        # Meanwhile another change commits, is served and a client moves past it
+        clock[0] += timedelta(seconds=10)
+        other.save()
+        positions.append(Cursor(other.updated_at, 0, other.id))
+        clock[0] += timedelta(seconds=10)
+
+    stats = import_expenses(['share,description,total,paid_by,paid_for\n',
+                             'trip,a,1,alice,alice:1/1\n', 'trip,b,2,alice,alice:1/1\n'],
+                            batch_size=1, on_batch=on_batch)
+    assert stats.imported == 2
+    page = changes_since(positions[0], 100)
+    assert sorted(e['description'] for e in page['expenses']) == ['a', 'b']
+    assert trip.id in _ids([page], 'shares')
+
+
+def _call(view, **params):
+    request = RequestFactory().get('/', params)
+    if view.__module__ == async_views.__name__:
+        res = async_to_sync(view)(request)
+    else:
+        res = view(request)
+    return res.status_code, loads(res.content)
+
+
+@parametrize('module', [views, async_views])
+def test_view(module):
+    shares = random_shares(3)
+    status, data = _call(module.changes, limit='2')
+    assert status == 200
+    assert _ids([data], 'shares') == [s.id for s in shares[:2]]
+    assert data['has_more'] is True
+    status, data = _call(module.changes, cursor=data['cursor'])
+    assert status == 200
+    assert _ids([data], 'shares') == [shares[2].id]
+    assert data['has_more'] is False
+
+
+@parametrize('module', [views, async_views])
+@parametrize('params', [{'cursor': 'abc'}, {'limit': '0'}, {'limit': 'a'}])
+def test_view_bad_params(module, params):
+    status, data = _call(module.changes, **params)
+    assert status == 400
+    assert data['success'] is False
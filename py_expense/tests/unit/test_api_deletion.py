@@ -0,0 +1,127 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from api.archive import archive_expenses
+from api.deletion import delete_batch, delete_share
+from api.models import (ArchivedExpense, ArchivedExpenseRatio, ArchiveSummary, Expense,
+                        ExpenseRatio, Share, Tombstone, User)
+from api.multiget import get_objects, object_cache
+from tests.utils import random_expenses, random_shares
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def share():
+    share, other = random_shares(2)
+    alice, bob = User.objects.create(name='alice'), User.objects.create(name='bob')
+    share.users.add(alice, bob)
+    for i in range(5):
+        Expense.new(share=share, paid_by=alice, description=str(i), total=i + 1,
+                    resolved=i < 2, paid_for={alice: (1, 2), bob: (1, 2)})
+    random_expenses(2, share=other)
+    archive_expenses(timezone.now())
+    return share
+
+
+def _left(share_id):
+    return (Expense.objects.filter(share_id=share_id).count(),
+            ArchivedExpense.objects.filter(share_id=share_id).count())
+
+
+def test_delete_share(share):
+    other_expenses = Expense.objects.exclude(share=share).count()
+    ids = list(Expense.objects.filter(share=share).values_list('id', flat=True))
+    assert delete_share(share.id, batch_size=2) == 5
+    assert not Share.objects.filter(pk=share.id).exists()
+    assert _left(share.id) == (0, 0)
+    assert not ExpenseRatio.objects.filter(expense_id__in=ids).exists()
+    assert not ArchivedExpenseRatio.objects.exists()
+    assert not ArchiveSummary.objects.filter(share_id=share.id).exists()
+    assert Expense.objects.count() == other_expenses
+    tombstones = Tombstone.objects.filter(kind='expense').values_list('object_id', flat=True)
+    assert sorted(tombstones) == ids
+    assert Tombstone.objects.filter(kind='share', object_id=share.id).exists()
+
+
+def test_batches(share):
+    counts = []
+    delete_share(share.id, batch_size=2, on_batch=counts.append)
+    # 2 batches of the 3 live expenses, then 1 of the 2 archived ones
+    assert counts == [2, 3, 5]
+
+
+def test_batch_queries_constant(share, django_assert_num_queries):
+    # Savepoint, select, ratio and participant users, 3 deletes, tombstones,
+    # share update, release
+    with django_assert_num_queries(9):
+        assert delete_batch(share.id, batch_size=1) == 1
+    with django_assert_num_queries(9):
+        assert delete_batch(share.id, batch_size=2) == 2
+
+
+def test_resume(share):
+    assert delete_share(share.id, batch_size=2, max_batches=1) == 2
+    assert Share.objects.filter(pk=share.id).exists()
+    assert _left(share.id) == (1, 2)
+    assert delete_share(share.id, batch_size=2, max_batches=2) == 3
+    # Every batch ran, but the share is only deleted by a run that finishes
+    assert Share.objects.filter(pk=share.id).exists()
+    assert delete_share(share.id) == 0
+    assert not Share.objects.filter(pk=share.id).exists()
+
+
+def test_missing_share():
+    assert delete_share(1000) == 0
+
+
+def test_cache_invalidated(share, django_capture_on_commit_callbacks):
+    object_cache().clear()
+    expense_id = Expense.objects.filter(share=share).values_list('id', flat=True).first()
+    user_ids = list(share.users.values_list('id', flat=True))
+    assert get_objects('expenses', [expense_id])[0] is not None
+    assert all(u['paid_for'] for u in get_objects('users', user_ids))
+    with django_capture_on_commit_callbacks(execute=True):
+        delete_share(share.id)
+    assert get_objects('expenses', [expense_id]) == [None]
+    assert get_objects('shares', [share.id]) == [None]
+    for user in get_objects('users', user_ids):
+        assert not user['paid_for'] and not user['paid_by'] and not user['shares']
+    object_cache().clear()
+
+
+def test_command(share):
+    out = StringIO()
+    call_command('delete_shares', str(share.id), '--dry-run', stdout=out)
+    assert out.getvalue() == f'Would delete share {share.id} and 5 expenses.\n'
+    assert Share.objects.filter(pk=share.id).exists()
+    out = StringIO()
+    call_command('delete_shares', str(share.id), '--batch-size', '2', '--max-batches', '1',
+                 stdout=out, stderr=StringIO())
+    assert out.getvalue().endswith(f'share {share.id} not deleted yet.\n')
+    out = StringIO()
+    call_command('delete_shares', str(share.id), stdout=out, stderr=StringIO())
+    assert out.getvalue().endswith(f'share {share.id} deleted.\n')
+    err = StringIO()
+    call_command('delete_shares', str(share.id), stdout=StringIO(), stderr=err)
+    assert err.getvalue() == f'Share {share.id} does not exist.\n'
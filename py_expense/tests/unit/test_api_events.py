@@ -0,0 +1,175 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+from json import loads
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory, override_settings
+
+from api import async_views, views
+from api.events import publish_expense, share_channel
+from api.models import Expense
+from api.serializers import ExpenseSerializer
+from core import MessageTooLarge, PostgresBroker, get_broker
+from tests.utils import parametrize, random_expenses, random_shares
+
+pytestmark = pytest.mark.django_db
+
+
+def test_created(django_capture_on_commit_callbacks):
+    share, = random_shares(1)
+    expenses, _, users = random_expenses(1, share=share)
+    share.users.add(*users)
+    with get_broker().subscribe(share_channel(share.id)) as subscription:
+        with django_capture_on_commit_callbacks(execute=True):
+            expense = Expense.new(description='a', share=share, paid_by=users[0], total=1,
+                                  paid_for={users[0]: (1, 1)})
+        message = subscription.get(0)
+    assert message['event'] == 'expense.created'
+    assert message['data']['id'] == expense.id
+    assert message['data']['paid_for'] == {users[0].id: '1/1'}
+
+
+@parametrize('data, event', [({'description': 'new'}, 'updated'),
+                             ({'resolved': True}, 'resolved')])
+def test_updated(django_capture_on_commit_callbacks, data, event):
+    (expense,), (share,), _ = random_expenses(1)
+    serializer = ExpenseSerializer(expense, data=data, partial=True)
+    serializer.is_valid(raise_exception=True)
+    with get_broker().subscribe(share_channel(share.id)) as subscription:
+        with django_capture_on_commit_callbacks(execute=True):
+            serializer.save()
+        message = subscription.get(0)
+    assert message['event'] == f'expense.{event}'
+    assert message['data']['id'] == expense.id
+    for key, val in data.items():
+        assert message['data'][key] == val
+
+
+def test_not_published_before_commit(django_capture_on_commit_callbacks):
+    share, = random_shares(1)
+    with get_broker().subscribe(share_channel(share.id)) as subscription:
+        with django_capture_on_commit_callbacks(execute=False) as callbacks:
+            random_expenses(1, share=share)
+        assert subscription.get(0) is None
+        for callback in callbacks:
+            callback()
+        assert subscription.get(0)['event'] == 'expense.created'
+
+
+def test_too_large(monkeypatch, django_capture_on_commit_callbacks):
+    (expense,), (share,), _ = random_expenses(1)
+    broker = get_broker()
+    publish = broker.publish
+
+    def limited(channel, message):
+        if 'paid_for' in message['data']:
+            raise MessageTooLarge('too large')
+        publish(channel, message)
+
+    monkeypatch.setattr(broker, 'publish', limited)
+    with broker.subscribe(share_channel(share.id)) as subscription:
+        with django_capture_on_commit_callbacks(execute=True):
+            Expense.objects.filter(id=expense.id).resolve()
+        message = subscription.get(0)
+    # Only enough for subscribers to fetch it
+    assert message == {'event': 'expense.resolved',
+                       'data': {'id': expense.id, 'share': share.id}}
+
+
+def test_postgres_payload_limit():
+    with pytest.raises(MessageTooLarge):
+        PostgresBroker().publish('share.1', {'data': 'x' * 8000})
+
+
+def test_publish_failure_logged(monkeypatch, caplog, django_capture_on_commit_callbacks):
+    (expense,), (share,), _ = random_expenses(1)
+    broker = get_broker()
+
+    def fail(channel, message):
+        raise RuntimeError('NOTIFY failed')
+
+    monkeypatch.setattr(broker, 'publish', fail)
+    serializer = ExpenseSerializer(expense, data={'description': 'new'}, partial=True)
+    serializer.is_valid(raise_exception=True)
+    with broker.subscribe(share_channel(share.id)), \
+            caplog.at_level(logging.ERROR, logger='api.events'), \
+            django_capture_on_commit_callbacks(execute=True):
+        serializer.save()
+    record, = caplog.records
+    assert isinstance(record.exc_info[1], RuntimeError)
+    assert Expense.objects.get(id=expense.id).description == 'new'
+
+
+def test_no_subscribers(django_assert_num_queries):
+    (expense,), (share,), _ = random_expenses(1)
+    with django_assert_num_queries(0):
+        publish_expense('updated', share.id, expense.id)
+
+
+def _stream(module, **params):
+    request = RequestFactory().get('/', params)
+    if module is async_views:
+        return async_to_sync(module.share_events)(request)
+    return module.share_events(request)
+
+
+def _expected_stream(share, expense):
+    """Read a share event stream, publishing an event after the keepalive."""
+    yield b': connected\n\n'
+    yield b': keepalive\n\n'
+    get_broker().publish(share_channel(share.id),
+                         {'event': 'expense.updated', 'data': {'id': expense.id}})
+    yield f'event: expense.updated\ndata: {{"id":{expense.id}}}\n\n'.encode()
+
+
+@override_settings(SSE_HEARTBEAT=0.01)
+def test_share_events():
+    (expense,), (share,), _ = random_expenses(1)
+    response = _stream(views, id=share.id)
+    assert response['Content-Type'] == 'text/event-stream'
+    assert response['Cache-Control'] == 'no-cache'
+    for expected in _expected_stream(share, expense):
+        assert next(response.streaming_content) == expected
+    response.close()
+    assert not get_broker().has_subscribers(share_channel(share.id))
+
+
+@override_settings(SSE_HEARTBEAT=0.01)
+def test_share_events_async():
+    (expense,), (share,), _ = random_expenses(1)
+
+    async def read():
+        response = await async_views.share_events(RequestFactory().get('/', {'id': share.id}))
+        assert response['Content-Type'] == 'text/event-stream'
+        stream = response.streaming_content
+        for expected in _expected_stream(share, expense):
+            assert await stream.__anext__() == expected
+        await stream.aclose()
+
+    async_to_sync(read)()
+    assert not get_broker().has_subscribers(share_channel(share.id))
+
+
+@parametrize('module', [views, async_views])
+@parametrize('params, status', [({}, 400), ({'id': '1000'}, 404), ({'name': 'nope'}, 404)])
+def test_share_events_fail(module, params, status):
+    response = _stream(module, **params)
+    assert response.status_code == status
+    assert loads(response.content)['success'] is False
@@ -0,0 +1,143 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from csv import reader
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from json import loads
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.test import RequestFactory
+
+from api import async_views, views
+from api.export import COLUMNS, export, export_queryset
+from api.models import Expense
+from api.readers import ExpenseReader
+from core import Lookup, dumps
+from tests.utils import parametrize, random_expenses, random_shares
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def share_expenses():
+    share, = random_shares(1)
+    expenses, _, users = random_expenses(5, share=share)
+    share.users.add(*users)
+    expenses[0].generate_ratio({users[0]: (1, 2), users[1]: (1, 2)})
+    return share, expenses, users
+
+
+def _read(fmt, queryset, chunk_size=2):
+    return b''.join(export(queryset, fmt, chunk_size)).decode()
+
+
+def test_ndjson_same_as_api(share_expenses):
+    share, *_ = share_expenses
+    queryset = Expense.objects.filter(share=share)
+    lines = _read('ndjson', queryset).splitlines()
+    assert [loads(line) for line in lines] == \
+        loads(dumps(ExpenseReader().serialize(queryset.order_by('id'))))
+
+
+def test_csv(share_expenses):
+    share, expenses, users = share_expenses
+    header, *rows = reader(StringIO(_read('csv', Expense.objects.filter(share=share))))
+    assert tuple(header) == COLUMNS
+    assert [int(row[0]) for row in rows] == [e.id for e in expenses]
+    first = dict(zip(header, rows[0]))
+    expense = Expense.objects.get(id=expenses[0].id)
+    assert first['total'] == str(expense.total)
+    assert first['created_at'] == str(int(expense.created_at.timestamp()))
+    assert first['resolved'] == '0'
+    assert first['paid_for'] == f'{users[0].id}:1/2;{users[1].id}:1/2'
+
+
+@parametrize('fmt, expected', [('csv', ','.join(COLUMNS) + '\r\n'), ('ndjson', '')])
+def test_empty(fmt, expected):
+    assert _read(fmt, Expense.objects.none()) == expected
+
+
+@parametrize('chunk_size, chunks', [(1, 5), (2, 3), (5, 1), (100, 1)])
+def test_chunks(share_expenses, django_assert_num_queries, chunk_size, chunks):
+    share, *_ = share_expenses
+    # One query for the expenses, one per chunk for the ratios
+    with django_assert_num_queries(1 + chunks):
+        result = list(export(Expense.objects.filter(share=share), 'ndjson', chunk_size))
+    assert len(result) == chunks
+    assert sum(chunk.count(b'\n') for chunk in result) == 5
+
+
+def test_export_queryset(share_expenses):
+    share, expenses, users = share_expenses
+    Expense.objects.filter(id=expenses[1].id).update(
+        created_at=datetime(2000, 1, 1, tzinfo=timezone.utc))
+    assert set(export_queryset({'share': share.id})) == set(expenses)
+    assert set(export_queryset({'user': users[1].id})) == {expenses[0], expenses[1]}
+    cutoff = datetime.now(timezone.utc) - timedelta(days=1)
+    assert set(export_queryset({'share': share.id, 'created_at': [Lookup('lt', cutoff)],
+                                'format': 'csv'})) == {expenses[1]}
+
+
+def _call(module, **params):
+    request = RequestFactory().get('/', params)
+    if module is views:
+        res = module.expense_export(request)
+        return res, None if not res.streaming else b''.join(res.streaming_content)
+
+    async def read():
+        res = await module.expense_export(request)
+        if not res.streaming:
+            return res, None
+        return res, b''.join([chunk async for chunk in res.streaming_content])
+
+    return async_to_sync(read)()
+
+
+@parametrize('module', [views, async_views])
+@parametrize('fmt, content_type', [('csv', 'text/csv'), ('ndjson', 'application/x-ndjson')])
+def test_view(share_expenses, module, fmt, content_type):
+    share, *_ = share_expenses
+    res, content = _call(module, share=share.id, format=fmt)
+    assert res.status_code == 200
+    assert res['Content-Type'] == content_type
+    assert res['Content-Disposition'] == f'attachment; filename="expenses.{fmt}"'
+    assert content.decode() == _read(fmt, Expense.objects.filter(share=share))
+
+
+@parametrize('module', [views, async_views])
+@parametrize('params', [{}, {'share': '1', 'format': 'xml'}, {'user': 'a'},
+                        {'share': '1', 'created_at': 'xx:1'},
+                        {'share': '1', 'created_at': 'gt:5,gt:10'}])
+def test_view_bad_params(module, params):
+    res, _ = _call(module, **params)
+    assert res.status_code == 400
+    assert loads(res.content)['success'] is False
+
+
+def test_command(share_expenses, tmp_path):
+    share, expenses, _ = share_expenses
+    out = StringIO()
+    call_command('export_expenses', '--share', str(share.id), '--format', 'ndjson',
+                 '--chunk-size', '2', stdout=out)
+    assert out.getvalue() == _read('ndjson', Expense.objects.filter(share=share))
+    path = tmp_path / 'out.csv'
+    call_command('export_expenses', '--share', str(share.id), '--created-at', 'gte:0',
+                 '-o', str(path))
+    assert path.read_bytes().decode() == _read('csv', Expense.objects.filter(share=share))
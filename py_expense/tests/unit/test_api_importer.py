@@ -0,0 +1,228 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from api.export import export
+from api.importer import BulkCreateWriter, Resolver, RowError, import_expenses, parse_row
+from api.models import EQUAL, Expense, ExpenseRatio, Share, User
+from api.validators import parse_ratio, ratios_sum_to_one
+from tests.utils import parametrize
+
+pytestmark = pytest.mark.django_db
+
+HEADER = 'share,description,total,paid_by,paid_for,created_at,resolved\n'
+
+
+@pytest.fixture
+def members():
+    alice, bob, carol = (User.objects.create(name=n) for n in ('alice', 'bob', 'carol'))
+    trip = Share.objects.create(name='trip', description='')
+    trip.users.add(alice, bob)
+    home = Share.objects.create(name='home', description='')
+    home.users.add(carol)
+    return trip, home, alice, bob, carol
+
+
+def _import(rows, **kwargs):
+    return import_expenses(StringIO(HEADER + ''.join(f'{row}\n' for row in rows)), **kwargs)
+
+
+@parametrize('val, expected', [('1/2', (1, 2)), ('3/3', (3, 3))])
+def test_parse_ratio(val, expected):
+    assert parse_ratio(val) == expected
+
+
+@parametrize('val', ['1', '1/2/3', '0/1', '1/0', '-1/2', 'a/b', None, 1])
+def test_parse_ratio_fail(val):
+    with pytest.raises(ValueError):
+        parse_ratio(val)
+
+
+@parametrize('ratios, expected', [([(1, 2), (2, 4)], True), ([(1, 3)] * 3, True),
+                                  ([(1, 2)], False), ([(2, 3), (2, 3)], False)])
+def test_ratios_sum_to_one(ratios, expected):
+    assert ratios_sum_to_one(ratios) is expected
+
+
+def test_import(members):
+    trip, home, alice, bob, carol = members
+    stats = _import([
+        'trip,Pizza,20.5,alice,alice:1/2;bob:1/2,1500000000,true',
+        'home,"Rent, March",1000,carol,carol:1/1,,',
+    ])
+    assert (stats.rows, stats.imported, stats.errors) == (2, 2, [])
+    pizza = Expense.objects.get(description='Pizza')
+    assert (pizza.share, pizza.paid_by, pizza.total, pizza.resolved) == \
+        (trip, alice, Decimal('20.5'), True)
+    assert pizza.created_at == datetime.fromtimestamp(1500000000, tz=timezone.utc)
+    assert {(r.user, r.numerator, r.denominator) for r in pizza.paid_for} == \
+        {(alice, 1, 2), (bob, 1, 2)}
+    assert (pizza.split, pizza.expenseratio_set.count()) == (EQUAL, 0)
+    assert {p.user for p in pizza.expenseparticipant_set.all()} == {alice, bob}
+    rent = Expense.objects.get(share=home)
+    assert rent.description == 'Rent, March'
+    assert rent.resolved is False
+    assert rent.updated_at is not None
+    # In the change feed with their new expenses
+    assert Share.objects.get(id=home.id).updated_at > home.updated_at
+
+
+@parametrize('row, reason', [
+    ('nope,a,1,alice,alice:1/1,,', "Share 'nope' not found."),
+    ('trip,a,1,dave,alice:1/1,,', "User 'dave' not found."),
+    ('trip,a,1,carol,alice:1/1,,', "User 'carol' is not in the share."),
+    ('trip,a,1,alice,carol:1/1,,', "User 'carol' is not in the share."),
+    ('trip,a,1,alice,alice:1/2,,', 'Ratio sum must be 1.'),
+    ('trip,a,1,alice,alice:1/2;alice:1/2,,', "User 'alice' is paid for twice."),
+    ('trip,a,1,alice,alice,,', "paid_for items must be 'user:numerator/denominator'"),
+    ('trip,a,1,alice,alice:1,,', "Ratio format must be 'numerator/denominator'"),
+    ('trip,a,1,alice,,,', 'paid_for cannot be empty.'),
+    ('trip,a,-1,alice,alice:1/1,,', 'total: Ensure this value is greater than or equal to 0.'),
+    ('trip,a,abc,alice,alice:1/1,,', 'total: “abc” value must be a decimal number.'),
+    ('trip,a,1,alice,alice:1/1,yesterday,', 'created_at must be a unix epoch.'),
+    ('trip,a,1,alice,alice:1/1,,maybe', 'resolved must be true or false.'),
+])
+def test_invalid_row(members, row, reason):
+    stats = _import(['trip,ok,1,alice,alice:1/1,,', row], max_errors=5)
+    assert stats.imported == 1
+    assert stats.errors == [(3, reason)]
+
+
+def test_description_too_long(members):
+    stats = _import([f"trip,{'a' * 257},1,alice,alice:1/1,,"])
+    assert stats.errors[0][1].startswith('description: ')
+
+
+def test_missing_columns():
+    with pytest.raises(RowError, match='Missing columns: paid_for, total'):
+        import_expenses(StringIO('share,description,paid_by\n'))
+
+
+def test_max_errors(members):
+    stats = _import(['nope,a,1,alice,alice:1/1,,'] * 5 + ['trip,a,1,alice,alice:1/1,,'],
+                    max_errors=2)
+    assert stats.rows == 3
+    assert len(stats.errors) == 3
+
+
+@parametrize('batch_size, batches', [(1, 6), (2, 3), (4, 2), (100, 1)])
+def test_batches(members, batch_size, batches):
+    calls = []
+
+    class Writer(BulkCreateWriter):
+        def write(self, batch):
+            calls.append(len(batch))
+            super().write(batch)
+
+    progress = []
+    stats = _import(['trip,a,1,alice,alice:1/3;bob:2/3,,'] * 5, writer=Writer(),
+                    batch_size=batch_size, on_batch=lambda s: progress.append(s.imported))
+    assert stats.imported == 5
+    assert sum(calls) == 5
+    assert len(calls) == -(-5 // batch_size)
+    assert progress[-1] == 5
+    assert Expense.objects.count() == 5
+    assert ExpenseRatio.objects.count() == 10
+
+
+def test_resolver_by_id(members):
+    trip, _, alice, *_ = members
+    resolver = Resolver('id')
+    fields, ratios = parse_row({'share': str(trip.id), 'description': 'a', 'total': '1',
+                                'paid_by': str(alice.id), 'paid_for': f'{alice.id}:1/1'},
+                               resolver)
+    assert fields['share_id'] == trip.id
+    # Split equally, the ratios only name the participants
+    assert (fields['split'], ratios) == (EQUAL, [(alice.id, 1, 1)])
+
+
+def test_truncated_row(members):
+    stats = _import(['trip,a,1,alice', 'trip,b,1,alice,alice:1/1,,'])
+    assert (stats.rows, stats.imported) == (2, 1)
+    assert stats.errors == [(2, 'Missing fields: paid_for')]
+
+
+def test_duplicate_names(members):
+    trip, home, alice, bob, carol = members
+    other_alice = User.objects.create(name='alice')
+    home.users.add(other_alice)
+    # Resolved among the members of the share
+    stats = _import(['trip,a,1,alice,alice:1/1,,', 'home,b,1,alice,alice:1/1,,'])
+    assert (stats.imported, stats.errors) == (2, [])
+    assert set(Expense.objects.values_list('paid_by_id', flat=True)) == {alice.id, other_alice.id}
+    trip.users.add(other_alice)
+    Share.objects.create(name='home', description='')
+    stats = _import(['trip,a,1,bob,alice:1/1,,', 'home,b,1,carol,carol:1/1,,'])
+    assert stats.imported == 0
+    assert [line for line, _ in stats.errors] == [2, 3]
+    assert all('ambiguous' in reason for _, reason in stats.errors)
+
+
+def test_export_round_trip(members):
+    trip, _, alice, bob, _ = members
+    _import([f'trip,Expense {i},{i}.25,bob,alice:1/3;bob:2/3,{1500000000 + i},0'
+             for i in range(10)])
+    before = b''.join(export(Expense.objects.filter(share=trip), 'ndjson')).decode()
+    csv = b''.join(export(Expense.objects.filter(share=trip), 'csv')).decode()
+    Expense.objects.all().delete()
+    stats = import_expenses(StringIO(csv), key='id')
+    assert stats.imported == 10
+    after = b''.join(export(Expense.objects.filter(share=trip), 'ndjson')).decode()
+    # Only IDs and updated_at change
+    strip = [line.split(',"description"')[1] for line in before.splitlines()]
+    assert [line.split(',"description"')[1] for line in after.splitlines()] == strip
+
+
+def test_command(members, tmp_path):
+    path = tmp_path / 'in.csv'
+    path.write_text(HEADER + 'trip,a,1,alice,alice:1/1,,\n' * 3)
+    out, err = StringIO(), StringIO()
+    call_command('import_expenses', str(path), '--batch-size', '2', stdout=out, stderr=err)
+    assert out.getvalue().startswith('Imported 3 expenses in ')
+    assert '3 rows, 3 imported, 0 errors' in err.getvalue()
+    assert Expense.objects.count() == 3
+
+
+def test_command_dry_run(members, tmp_path):
+    path = tmp_path / 'in.csv'
+    path.write_text(HEADER + 'trip,a,1,alice,alice:1/1,,\n')
+    out = StringIO()
+    call_command('import_expenses', str(path), '--dry-run', stdout=out, stderr=StringIO())
+    assert out.getvalue().startswith('Would import 1 expenses')
+    assert Expense.objects.count() == 0
+
+
+def test_command_invalid(members, tmp_path):
+    path = tmp_path / 'in.csv'
+    path.write_text(HEADER + 'trip,a,1,alice,alice:1/1,,\n' + 'nope,a,1,alice,alice:1/1,,\n')
+    err = StringIO()
+    with pytest.raises(CommandError, match='nothing was imported'):
+        call_command('import_expenses', str(path), stdout=StringIO(), stderr=err)
+    assert "line 3: Share 'nope' not found." in err.getvalue()
+    assert Expense.objects.count() == 0
+    call_command('import_expenses', str(path), '--max-errors', '1', stdout=StringIO(),
+                 stderr=StringIO())
+    assert Expense.objects.count() == 1
+    path.write_text('share\n')
+    with pytest.raises(CommandError, match='Missing columns'):
+        call_command('import_expenses', str(path), stdout=StringIO(), stderr=StringIO())
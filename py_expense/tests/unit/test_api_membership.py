@@ -0,0 +1,140 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import pytest
+from django.db import transaction
+
+from api.membership import is_member, members_in, membership_cache
+from api.serializers import ExpenseSerializer
+from api.validators import validate_expense_ratio
+from tests.utils import parametrize, random_shares, random_users
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    monkeypatch.setattr(membership_cache, 'ttl', 60)
+    membership_cache.clear()
+    yield
+    membership_cache.clear()
+
+
+@pytest.fixture
+def share_users():
+    share, = random_shares(1)
+    users = random_users(4)
+    share.users.add(*users[:2])
+    return share, users
+
+
+def test_is_member(share_users, django_assert_num_queries):
+    share, users = share_users
+    with django_assert_num_queries(1):
+        assert is_member(share.id, users[0].id)
+    assert not is_member(share.id, users[2].id)
+    assert not is_member(share.id + 1, users[0].id)
+
+
+def test_members_in(share_users, django_assert_num_queries):
+    share, users = share_users
+    with django_assert_num_queries(1):
+        assert members_in(share.id, [u.id for u in users]) == {users[0].id, users[1].id}
+    with django_assert_num_queries(0):
+        assert members_in(share.id, []) == set()
+
+
+def test_not_cached_by_default(share_users, django_assert_num_queries):
+    share, users = share_users
+    is_member(share.id, users[0].id)
+    with django_assert_num_queries(1):
+        assert is_member(share.id, users[0].id)
+    assert len(membership_cache) == 0
+
+
+def test_cached(cached, share_users, django_assert_num_queries,
+                django_capture_on_commit_callbacks):
+    share, users = share_users
+    ids = [u.id for u in users]
+    with django_assert_num_queries(1), django_capture_on_commit_callbacks(execute=True):
+        assert members_in(share.id, ids[:3]) == set(ids[:2])
+    with django_assert_num_queries(0):
+        assert is_member(share.id, ids[0])
+        assert not is_member(share.id, ids[2])
+    # Only the missing user is looked up
+    with django_assert_num_queries(1):
+        assert members_in(share.id, ids) == set(ids[:2])
+
+
+@parametrize('change, members', [
+    (lambda share, users: share.users.add(users[2]), {0, 1, 2}),
+    (lambda share, users: share.users.remove(users[0]), {1}),
+    (lambda share, users: users[2].share_set.add(share), {0, 1, 2}),
+    (lambda share, users: users[1].share_set.remove(share), {0}),
+    (lambda share, users: share.users.clear(), set()),
+    (lambda share, users: share.users.set(users[1:3]), {1, 2}),
+    (lambda share, users: users[0].delete(), {1}),
+])
+def test_invalidated(cached, share_users, django_capture_on_commit_callbacks, change, members):
+    share, users = share_users
+    ids = [u.id for u in users]
+    with django_capture_on_commit_callbacks(execute=True):
+        assert members_in(share.id, ids) == set(ids[:2])
+    assert len(membership_cache) == len(ids)
+    with django_capture_on_commit_callbacks(execute=True):
+        with transaction.atomic():
+            change(share, users)
+    assert members_in(share.id, ids) == {ids[i] for i in members}
+
+
+def test_rolled_back_not_cached(cached, share_users, django_capture_on_commit_callbacks):
+    share, users = share_users
+    with django_capture_on_commit_callbacks(execute=True):
+        with pytest.raises(ValueError):
+            with transaction.atomic():
+                share.users.add(users[2])
+                assert is_member(share.id, users[2].id)
+                raise ValueError
+    assert len(membership_cache) == 0
+    assert not is_member(share.id, users[2].id)
+
+
+def test_validate_ratio(share_users, django_assert_num_queries):
+    share, users = share_users
+    ratio = {str(users[0].id): '1/2', str(users[1].id): '1/2'}
+    with django_assert_num_queries(1):
+        assert validate_expense_ratio(ratio, share) == \
+            ({str(users[0].id): (1, 2), str(users[1].id): (1, 2)}, True)
+    for key in (str(users[2].id), 'abc', None):
+        res, success = validate_expense_ratio({key: '1/1'}, share)
+        assert not success
+        assert res == {'paid_for': f'User with ID {key} is not in the share this expense '
+                                   f'belongs to.'}
+
+
+@parametrize('member', [True, False])
+def test_serializer_paid_by(share_users, member):
+    share, users = share_users
+    payer = users[0] if member else users[2]
+    serializer = ExpenseSerializer(data={
+        'description': 'a', 'share': share.id, 'total': 1, 'paid_by': payer.id,
+        'paid_for': {str(users[1].id): '1/1'},
+    })
+    assert serializer.is_valid() is member
+    if not member:
+        assert serializer.errors['paid_by'] == \
+            f'Paid by user with ID {payer.id} must be in the share.'
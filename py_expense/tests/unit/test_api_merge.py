@@ -0,0 +1,191 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from io import StringIO
+from json import loads
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory
+from django.utils import timezone
+
+from api import async_views, views
+from api.archive import archive_expenses
+from api.auth import authenticate
+from api.events import share_channel
+from api.merge import merge_users
+from api.models import (ArchivedExpenseRatio, ArchiveSummary, Expense, ExpenseRatio, Share,
+                        Token, User)
+from core import get_broker
+from tests.utils import parametrize
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def users():
+    alice, bob, carol = (User.objects.create(name=name) for name in ('alice', 'bob', 'carol'))
+    trip, dinner = Share.objects.create(name='trip'), Share.objects.create(name='dinner')
+    trip.users.add(alice, bob, carol)
+    dinner.users.add(bob)
+    expenses = [
+        Expense.new(share=trip, paid_by=bob, description='a', total=10,
+                    paid_for={alice: (1, 2), bob: (1, 2)}),
+        Expense.new(share=trip, paid_by=alice, description='b', total=30,
+                    paid_for={bob: (1, 3), carol: (2, 3)}),
+        Expense.new(share=dinner, paid_by=bob, description='c', total=5, resolved=True,
+                    paid_for={bob: (1, 1)}),
+        Expense.new(share=trip, paid_by=alice, description='d', total=8, resolved=True,
+                    paid_for={alice: (1, 4), bob: (3, 4)}),
+    ]
+    archive_expenses(timezone.now())
+    token = Token.new(bob)
+    return alice, bob, carol, trip, dinner, expenses, token
+
+
+def _fractions(model, expense_id):
+    return {user_id: (top, bot) for user_id, top, bot in model.objects.filter(
+        expense_id=expense_id).values_list('user_id', 'numerator', 'denominator')}
+
+
+def test_merge(users):
+    alice, bob, carol, trip, dinner, expenses, token = users
+    totals = {share.id: share.total for share in (trip, dinner)}
+    assert authenticate(token.key) == bob
+    counts = merge_users(bob.id, alice.id)
+    assert counts == {
+        'expenses': 1, 'archived_expenses': 1,
+        'ratios': 1, 'ratios_coalesced': 1,
+        'archived_ratios': 1, 'archived_ratios_coalesced': 1,
+        'summaries': 2, 'shares': 2, 'tokens': 1,
+    }
+    assert not User.objects.filter(pk=bob.id).exists()
+    assert Expense.objects.get(pk=expenses[0].id).paid_by_id == alice.id
+    assert _fractions(ExpenseRatio, expenses[0].id) == {alice.id: (1, 1)}
+    assert _fractions(ExpenseRatio, expenses[1].id) == {alice.id: (1, 3), carol.id: (2, 3)}
+    assert _fractions(ArchivedExpenseRatio, expenses[2].id) == {alice.id: (1, 1)}
+    assert _fractions(ArchivedExpenseRatio, expenses[3].id) == {alice.id: (1, 1)}
+    assert set(trip.users.all()) == {alice, carol}
+    assert set(dinner.users.all()) == {alice}
+    assert not ArchiveSummary.objects.filter(user_id=bob.id).exists()
+    summary = ArchiveSummary.objects.get(share=trip, user=alice)
+    assert (summary.expenses, summary.paid, summary.owed) == (1, 8, 8)
+    for share in (trip, dinner):
+        assert Share.objects.get(pk=share.id).total == totals[share.id]
+    assert authenticate(token.key) == alice
+
+
+def test_updated_at(users):
+    alice, bob, carol, trip, dinner, expenses, _ = users
+    before = timezone.now()
+    merge_users(bob.id, alice.id)
+    changed = Expense.objects.filter(updated_at__gte=before).values_list('id', flat=True)
+    assert sorted(changed) == [expenses[0].id, expenses[1].id]
+    assert Share.objects.filter(updated_at__gte=before).count() == 2
+    assert User.objects.get(pk=alice.id).updated_at >= before
+    assert User.objects.get(pk=carol.id).updated_at < before
+
+
+def test_set_based(users, django_assert_max_num_queries):
+    alice, bob, *_ = users
+    # Independent of the number of rows moved
+    with django_assert_max_num_queries(40):
+        merge_users(bob.id, alice.id)
+
+
+def test_events(users, django_capture_on_commit_callbacks):
+    alice, bob, carol, trip, dinner, expenses, _ = users
+    with get_broker().subscribe(share_channel(trip.id)) as subscription:
+        with django_capture_on_commit_callbacks(execute=True):
+            merge_users(bob.id, alice.id)
+        messages = [subscription.get(0), subscription.get(0)]
+    assert [m['data']['id'] for m in messages] == [expenses[0].id, expenses[1].id]
+    assert messages[0]['data']['paid_by'] == alice.id
+
+
+@parametrize('source, target, error', [
+    (1, 1, ValueError),
+    (1, 1000, User.DoesNotExist),
+    (1000, 1, User.DoesNotExist),
+])
+def test_merge_fail(users, source, target, error):
+    with pytest.raises(error):
+        merge_users(source, target)
+    assert User.objects.count() == 3
+
+
+def _call(module, api_user=None, **params):
+    request = RequestFactory().post(f'/?{"&".join(f"{k}={v}" for k, v in params.items())}')
+    request.api_user = api_user or User.objects.create(name='admin', is_staff=True)
+    if module is async_views:
+        res = async_to_sync(module.user_merge)(request)
+    else:
+        res = module.user_merge(request)
+    return res.status_code, loads(res.content)
+
+
+@parametrize('module', [views, async_views])
+def test_view(users, module):
+    alice, bob, *_ = users
+    status, body = _call(module, source=bob.id, target=alice.id)
+    assert status == 200
+    assert body['success'] is True
+    assert body['counts']['shares'] == 2
+    assert not User.objects.filter(pk=bob.id).exists()
+
+
+@parametrize('module', [views, async_views])
+@parametrize('params, status', [
+    ({}, 400),
+    ({'source': 1}, 400),
+    ({'source': 1, 'target': 1}, 400),
+    ({'source': 1, 'target': 1000}, 404),
+])
+def test_view_fail(users, module, params, status):
+    code, body = _call(module, **params)
+    assert code == status
+    assert body['success'] is False
+    assert User.objects.filter(is_staff=False).count() == 3
+
+
+@parametrize('module', [views, async_views])
+def test_view_staff_only(users, module):
+    alice, bob, *_ = users
+    status, body = _call(module, api_user=alice, source=bob.id, target=alice.id)
+    assert status == 403
+    assert body == {'success': False, 'reason': 'only staff can merge users'}
+    assert User.objects.filter(pk=bob.id).exists()
+
+
+def test_staff_command(users):
+    alice, *_ = users
+    call_command('staff', str(alice.id), stdout=StringIO())
+    assert User.objects.get(pk=alice.id).is_staff
+    call_command('staff', str(alice.id), '--revoke', stdout=StringIO())
+    assert not User.objects.get(pk=alice.id).is_staff
+    with pytest.raises(CommandError):
+        call_command('staff', '1000', stdout=StringIO())
+
+
+def test_command(users):
+    alice, bob, *_ = users
+    out = StringIO()
+    call_command('merge_users', str(bob.id), str(alice.id), stdout=out)
+    assert out.getvalue().startswith(f'Merged user {bob.id} into user {alice.id}: 1 expenses')
+    with pytest.raises(CommandError):
+        call_command('merge_users', str(bob.id), str(alice.id), stdout=StringIO())
@@ -0,0 +1,195 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from json import loads
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.test import RequestFactory
+
+from api import async_views, views
+from api.models import Expense, Share, User
+from api.multiget import get_objects, multi_get, object_cache
+from api.readers import ExpenseReader, ShareReader, UserReader
+from api.serializers import ExpenseSerializer
+from tests.utils import parametrize, random_expenses
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    object_cache().clear()
+    yield
+    object_cache().clear()
+
+
+@pytest.fixture
+def objects():
+    expenses, shares, users = random_expenses(3)
+    share = shares[0]
+    share.users.add(*users)
+    expenses[0].generate_ratio({users[0]: (1, 2), users[1]: (1, 2)})
+    return expenses, share, users
+
+
+def _expected(reader_cls, model, ids):
+    found = {obj['id']: obj for obj in reader_cls().serialize(model.objects.filter(id__in=ids))}
+    return [found.get(pk) for pk in ids]
+
+
+def test_get_objects(objects):
+    expenses, share, users = objects
+    ids = [expenses[2].id, 1000, expenses[0].id, expenses[2].id]
+    assert get_objects('expenses', ids) == _expected(ExpenseReader, Expense, ids)
+    assert get_objects('shares', [share.id]) == _expected(ShareReader, Share, [share.id])
+    ids = [u.id for u in reversed(users)]
+    assert get_objects('users', ids) == _expected(UserReader, User, ids)
+
+
+def test_cached(objects, django_assert_num_queries):
+    expenses, *_ = objects
+    ids = [e.id for e in expenses]
+    # The expenses, and their ratios
+    with django_assert_num_queries(2):
+        first = get_objects('expenses', ids[:2])
+    with django_assert_num_queries(0):
+        assert get_objects('expenses', ids[:2]) == first
+    # Only the misses are read
+    with django_assert_num_queries(2):
+        assert get_objects('expenses', ids + [1000])[:2] == first
+
+
+def test_missing_not_cached(django_assert_num_queries):
+    assert get_objects('shares', [1000]) == [None]
+    with django_assert_num_queries(1):
+        assert get_objects('shares', [1000]) == [None]
+
+
+def _change_expense(expenses, share, users):
+    expense = Expense.objects.get(id=expenses[0].id)
+    expense.description = 'changed'
+    expense.save()
+
+
+def _change_ratio(expenses, share, users):
+    expenses[0].generate_ratio({users[2]: (1, 1)})
+
+
+def _new_expense(expenses, share, users):
+    Expense.new(share=share, paid_by=users[0], description='new', total=1,
+                paid_for={users[0]: (1, 1)})
+
+
+def _delete_expense(expenses, share, users):
+    Expense.objects.get(id=expenses[1].id).delete()
+
+
+def _add_user(expenses, share, users):
+    share.users.add(User.objects.create(name='new'))
+
+
+def _remove_user(expenses, share, users):
+    users[0].share_set.remove(share)
+
+
+def _clear_users(expenses, share, users):
+    share.users.clear()
+
+
+def _rename_share(expenses, share, users):
+    share.name = 'renamed'
+    share.save()
+
+
+def _move_expense(expenses, share, users):
+    expense = Expense.objects.get(id=expenses[0].id)
+    other = Share.objects.create(name='other', description='')
+    payer = next(u for u in users if u.id != expense.paid_by_id)
+    ExpenseSerializer().update(expense, {'share': other, 'paid_by': payer})
+
+
+def _rename_user(expenses, share, users):
+    users[1].name = 'renamed'
+    users[1].save()
+
+
+@parametrize('change', [_change_expense, _change_ratio, _new_expense, _delete_expense,
+                        _add_user, _remove_user, _clear_users, _rename_share, _rename_user,
+                        _move_expense])
+def test_invalidated(objects, django_capture_on_commit_callbacks, change):
+    expenses, share, users = objects
+    ids = {'shares': [share.id], 'users': [u.id for u in users],
+           'expenses': [e.id for e in expenses]}
+    multi_get(ids)
+    with django_capture_on_commit_callbacks(execute=True):
+        with transaction.atomic():
+            change(expenses, share, users)
+    assert multi_get(ids) == {
+        'shares': _expected(ShareReader, Share, ids['shares']),
+        'users': _expected(UserReader, User, ids['users']),
+        'expenses': _expected(ExpenseReader, Expense, ids['expenses']),
+    }
+
+
+def test_unrelated_not_invalidated(objects, django_capture_on_commit_callbacks,
+                                   django_assert_num_queries):
+    expenses, share, users = objects
+    get_objects('shares', [share.id])
+    with django_capture_on_commit_callbacks(execute=True):
+        ExpenseSerializer().update(expenses[0], {'description': 'new'})
+    # The share lists the IDs and total of its expenses, not their descriptions
+    with django_assert_num_queries(0):
+        get_objects('shares', [share.id])
+    assert get_objects('expenses', [expenses[0].id])[0]['description'] == 'new'
+
+
+def _call(module, **params):
+    request = RequestFactory().get('/', params)
+    if module is async_views:
+        res = async_to_sync(module.objects)(request)
+    else:
+        res = module.objects(request)
+    return res.status_code, loads(res.content)
+
+
+@parametrize('module', [views, async_views])
+def test_view(objects, module):
+    expenses, share, users = objects
+    status, body = _call(module, shares=f'{share.id},1000',
+                         expenses=f'{expenses[1].id},{expenses[0].id}')
+    assert status == 200
+    assert body.keys() == {'shares', 'expenses'}
+    assert body['shares'][1] is None
+    assert [e['id'] for e in body['expenses']] == [expenses[1].id, expenses[0].id]
+
+
+@parametrize('module', [views, async_views])
+@parametrize('params, reason', [
+    ({}, 'did not provide any of shares, users, expenses'),
+    ({'users': ','.join(map(str, range(1, 102)))}, 'more than 100 IDs of users'),
+])
+def test_view_fail(module, params, reason):
+    assert _call(module, **params) == (400, {'success': False, 'reason': reason})
+
+
+@parametrize('module', [views, async_views])
+def test_view_bad_param(module):
+    status, body = _call(module, shares='a')
+    assert status == 400
+    assert body['success'] is False
@@ -0,0 +1,92 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from itertools import chain
+
+import pytest
+
+from api.models import Expense, Share, User
+from api.readers import ExpenseReader, ShareReader, UserReader
+from api.serializers import ExpenseSerializer, ShareSerializer, UserSerializer
+from core import dumps
+from tests.utils import parametrize, random_expenses, random_shares, random_users
+
+pytestmark = pytest.mark.django_db
+
+readers = parametrize('ReaderCls, SerializerCls, ModelCls', [
+    (UserReader, UserSerializer, User),
+    (ShareReader, ShareSerializer, Share),
+    (ExpenseReader, ExpenseSerializer, Expense),
+])
+
+
+def _populate():
+    expenses, shares, users = random_expenses(5)
+    extra_users = random_users(3)
+    for share in shares[:3]:
+        for user in chain(users, extra_users):
+            share.users.add(user)
+    for expense in expenses[:3]:
+        expense.generate_ratio({user: (1, 4) for user in chain(users[:1], extra_users)})
+    random_expenses(4, share=shares[0])
+    random_shares(2)
+    random_users(2)
+
+
+def _drf_bytes(SerializerCls, queryset, fields=None):
+    queryset = SerializerCls.setup_queryset(queryset, fields)
+    return dumps(SerializerCls(queryset, many=True, fields=fields).data)
+
+
+@readers
+@parametrize('fields', [None, ['id'], ['name', 'description'], ['total', 'paid_for', 'users'],
+                        ['created_at', 'updated_at', 'shares', 'expenses', 'paid_by']])
+def test_reader_identical(ReaderCls, SerializerCls, ModelCls, fields):
+    _populate()
+    queryset = ModelCls.objects.all().order_by('id')
+    expected = _drf_bytes(SerializerCls, queryset, fields)
+    assert dumps(ReaderCls(fields).serialize(queryset)) == expected
+
+
+@readers
+def test_reader_filtered(ReaderCls, SerializerCls, ModelCls):
+    _populate()
+    queryset = ModelCls.objects.filter(id__in=[2, 3, 999]).order_by('-id')
+    expected = _drf_bytes(SerializerCls, queryset)
+    assert dumps(ReaderCls().serialize(queryset)) == expected
+
+
+@readers
+def test_reader_empty(ReaderCls, SerializerCls, ModelCls):
+    assert ReaderCls().serialize(ModelCls.objects.all()) == []
+
+
+@readers
+def test_reader_field_order(ReaderCls, SerializerCls, ModelCls):
+    _populate()
+    fields = list(reversed(SerializerCls.Meta.fields))
+    res, *_ = ReaderCls(fields).serialize(ModelCls.objects.all())
+    assert list(res) == list(SerializerCls.Meta.fields)
+
+
+@parametrize('ReaderCls, ModelCls, queries', [
+    (UserReader, User, 4), (ShareReader, Share, 3), (ExpenseReader, Expense, 2)
+])
+def test_reader_queries(django_assert_num_queries, ReaderCls, ModelCls, queries):
+    _populate()
+    with django_assert_num_queries(queries):
+        ReaderCls().serialize(ModelCls.objects.all())
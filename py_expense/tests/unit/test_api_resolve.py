@@ -0,0 +1,138 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from datetime import timedelta
+from json import loads
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory
+from django.utils import timezone
+
+from api import async_views, views
+from api.events import share_channel
+from api.models import Expense
+from api.multiget import get_objects, object_cache
+from core import get_broker
+from tests.utils import parametrize, random_expenses, random_shares
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def expenses():
+    share, = random_shares(1)
+    expenses, *_ = random_expenses(4, share=share)
+    return expenses, share
+
+
+def _resolved(expenses):
+    return list(Expense.objects.filter(id__in=[e.id for e in expenses])
+                .order_by('id').values_list('resolved', flat=True))
+
+
+def test_resolve(expenses, django_assert_num_queries):
+    expenses, _ = expenses
+    before = timezone.now()
+    queryset = Expense.objects.filter(id__in=[e.id for e in expenses[:3]])
+    # A savepoint around selecting the changed rows and one UPDATE
+    with django_assert_num_queries(4) as captured:
+        ids = queryset.resolve()
+    assert [q['sql'].split()[0] for q in captured][1:3] == ['SELECT', 'UPDATE']
+    assert ids == [e.id for e in expenses[:3]]
+    assert _resolved(expenses) == [True, True, True, False]
+    for expense in Expense.objects.filter(id__in=ids):
+        assert expense.updated_at >= before
+
+
+def test_unchanged_skipped(expenses):
+    expenses, _ = expenses
+    Expense.objects.filter(id=expenses[0].id).resolve()
+    updated_at = Expense.objects.get(id=expenses[0].id).updated_at
+    assert Expense.objects.filter(id__in=[e.id for e in expenses[:2]]).resolve() == \
+        [expenses[1].id]
+    assert Expense.objects.get(id=expenses[0].id).updated_at == updated_at
+    assert Expense.objects.filter(id=expenses[0].id).resolve() == []
+
+
+def test_unresolve(expenses):
+    expenses, share = expenses
+    Expense.objects.filter(share=share).resolve()
+    assert Expense.objects.filter(id=expenses[1].id).resolve(False) == [expenses[1].id]
+    assert _resolved(expenses) == [True, False, True, True]
+
+
+def test_events(expenses, django_capture_on_commit_callbacks):
+    expenses, share = expenses
+    with get_broker().subscribe(share_channel(share.id)) as subscription:
+        with django_capture_on_commit_callbacks(execute=True):
+            Expense.objects.filter(share=share).resolve()
+        messages = [subscription.get(0) for _ in expenses]
+        assert subscription.get(0) is None
+    assert {m['event'] for m in messages} == {'expense.resolved'}
+    assert [m['data']['id'] for m in messages] == [e.id for e in expenses]
+    assert all(m['data']['resolved'] for m in messages)
+
+
+def test_object_cache_invalidated(expenses, django_capture_on_commit_callbacks):
+    expenses, share = expenses
+    object_cache().clear()
+    assert not get_objects('expenses', [expenses[0].id])[0]['resolved']
+    with django_capture_on_commit_callbacks(execute=True):
+        Expense.objects.filter(share=share).resolve()
+    assert get_objects('expenses', [expenses[0].id])[0]['resolved']
+    object_cache().clear()
+
+
+def _call(module, **params):
+    request = RequestFactory().post(f'/?{"&".join(f"{k}={v}" for k, v in params.items())}')
+    if module is async_views:
+        res = async_to_sync(module.expense_resolve)(request)
+    else:
+        res = module.expense_resolve(request)
+    return res.status_code, loads(res.content)
+
+
+@parametrize('module', [views, async_views])
+def test_view(expenses, module):
+    expenses, share = expenses
+    status, body = _call(module, share=share.id, id=f'{expenses[2].id},{expenses[0].id}')
+    assert (status, body) == (200, {'success': True, 'resolved': True,
+                                    'ids': [expenses[0].id, expenses[2].id]})
+    assert _resolved(expenses) == [True, False, True, False]
+    status, body = _call(module, share=share.id, resolved='false')
+    assert (status, body['ids']) == (200, [expenses[0].id, expenses[2].id])
+    assert _resolved(expenses) == [False] * 4
+
+
+@parametrize('module', [views, async_views])
+def test_view_time_range(expenses, module):
+    expenses, _ = expenses
+    old = timezone.now() - timedelta(days=10)
+    Expense.objects.filter(id__in=[e.id for e in expenses[:2]]).update(created_at=old)
+    cutoff = int((old + timedelta(days=1)).timestamp())
+    status, body = _call(module, created_at=f'lt:{cutoff}')
+    assert (status, body['ids']) == (200, [expenses[0].id, expenses[1].id])
+
+
+@parametrize('module', [views, async_views])
+@parametrize('params', [{}, {'resolved': 'true'}])
+def test_view_no_filter(expenses, module, params):
+    status, body = _call(module, **params)
+    assert status == 400
+    assert body['success'] is False
+    assert not any(_resolved(expenses[0]))
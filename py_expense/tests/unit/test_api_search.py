@@ -0,0 +1,160 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from json import loads
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import RequestFactory
+
+from api import async_views, views
+from api.models import Expense, Share
+from api.search import (SearchBackend, SqliteSearchBackend, get_search_backend, install_search,
+                        scope, search, terms)
+from tests.utils import parametrize, random_expenses, random_users
+
+pytestmark = pytest.mark.django_db
+
+backends = parametrize('backend', [SearchBackend(), SqliteSearchBackend()])
+
+
+@pytest.fixture
+def descriptions():
+    """Expenses in 2 shares, paid by the first user of the share"""
+    expenses, shares, users = random_expenses(4)
+    texts = ['Pizza with friends', 'Pizza pizza PIZZA', 'Groceries: pasta, pizzas',
+             'Train tickets']
+    for expense, text in zip(expenses, texts):
+        expense.description = text
+        expense.save()
+    Share.objects.filter(id=shares[0].id).update(description='Trip to Italy')
+    return expenses, shares, users
+
+
+@parametrize('query, expected', [
+    ('', []), ('  ', []), ('Pizza', ['pizza']), ('pizza, pasta!', ['pizza', 'pasta']),
+    ('"a" OR b*', ['a', 'or', 'b']), ('Crème brûlée', ['crème', 'brûlée']),
+])
+def test_terms(query, expected):
+    assert terms(query) == expected
+
+
+def test_default_backend():
+    assert isinstance(get_search_backend(), SqliteSearchBackend)
+
+
+@backends
+@parametrize('query, expected', [
+    ('pizza', {0, 1, 2}),
+    ('piz', {0, 1, 2}),
+    ('pizza pasta', {2}),
+    ('PIZ FRI', {0}),
+    ('tickets', {3}),
+    ('izza', set()),
+    ('burger', set()),
+])
+def test_search_expenses(descriptions, backend, query, expected):
+    expenses, *_ = descriptions
+    ranked = backend.search(Expense.objects.all(), terms(query), 10)
+    assert {pk for pk, _ in ranked} == {expenses[i].id for i in expected}
+
+
+def test_ranking(descriptions):
+    expenses, *_ = descriptions
+    ranked = SqliteSearchBackend().search(Expense.objects.all(), ['pizza'], 10)
+    assert ranked[0][0] == expenses[1].id
+    assert [rank for _, rank in ranked] == sorted((rank for _, rank in ranked), reverse=True)
+
+
+@backends
+def test_limit(descriptions, backend):
+    assert len(backend.search(Expense.objects.all(), ['pizza'], 2)) == 2
+
+
+def test_index_follows_writes(descriptions):
+    expenses, *_ = descriptions
+    expenses[3].description = 'Pizza on the train'
+    expenses[3].save()
+    expenses[0].delete()
+    ranked = SqliteSearchBackend().search(Expense.objects.all(), ['pizza'], 10)
+    assert {pk for pk, _ in ranked} == {expenses[1].id, expenses[2].id, expenses[3].id}
+
+
+def test_install_indexes_existing_rows(descriptions):
+    expenses, *_ = descriptions
+    with connection.cursor() as cursor:
+        cursor.execute('DROP TABLE api_expense_fts')
+    install_search()
+    install_search()
+    ranked = SqliteSearchBackend().search(Expense.objects.all(), ['tickets'], 10)
+    assert ranked == [(expenses[3].id, pytest.approx(ranked[0][1]))]
+
+
+def test_scope(descriptions):
+    expenses, shares, users = descriptions
+    other, = random_users(1)
+    expenses[0].generate_ratio({users[0]: (1, 2), other: (1, 2)})
+    assert set(scope('expense', share_id=shares[1].id)) == {expenses[1]}
+    assert set(scope('expense', user_id=other.id)) == {expenses[0]}
+    assert set(scope('expense', user_id=users[2].id)) == {expenses[2]}
+    shares[3].users.add(other)
+    assert set(scope('share', user_id=other.id)) == {shares[3]}
+    assert set(scope('share', share_id=shares[0].id, user_id=other.id)) == set()
+
+
+def test_search(descriptions):
+    expenses, shares, users = descriptions
+    hits = search('pizza')
+    assert hits[0] == {'type': 'expense', 'id': expenses[1].id, 'share': shares[1].id,
+                       'description': 'Pizza pizza PIZZA', 'rank': hits[0]['rank']}
+    assert len(hits) == 3
+    hit, = search('ital')
+    assert hit == {'type': 'share', 'id': shares[0].id, 'name': shares[0].name,
+                   'description': 'Trip to Italy', 'rank': hit['rank']}
+    assert search('pizza', ['share']) == []
+    assert [h['id'] for h in search('pizza', share_id=shares[2].id)] == [expenses[2].id]
+    assert [h['id'] for h in search('pizza', user_id=users[0].id)] == [expenses[0].id]
+    assert len(search('pizza', limit=1)) == 1
+
+
+def _call(module, **params):
+    request = RequestFactory().get('/', params)
+    if module is async_views:
+        res = async_to_sync(module.search_view)(request)
+    else:
+        res = module.search_view(request)
+    return res.status_code, loads(res.content)
+
+
+@parametrize('module', [views, async_views])
+def test_view(descriptions, module):
+    expenses, shares, _ = descriptions
+    status, data = _call(module, q='train', type='expense')
+    assert status == 200
+    assert [(h['type'], h['id']) for h in data] == [('expense', expenses[3].id)]
+    status, data = _call(module, q='pizza', limit='1000')
+    assert status == 200
+    assert len(data) == 3
+
+
+@parametrize('module', [views, async_views])
+@parametrize('params', [{}, {'q': 'a', 'type': 'user'}, {'q': 'a', 'limit': '0'}])
+def test_view_bad_params(module, params):
+    status, data = _call(module, **params)
+    assert status == 400
+    assert data['success'] is False
@@ -0,0 +1,93 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+from importlib import import_module, reload
+from io import StringIO
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.urls import clear_url_caches, get_resolver
+from gunicorn.app.base import BaseApplication
+
+from api import async_views, views
+from api.management.commands.serve import default_workers, gunicorn_options
+from tests.utils import parametrize
+
+_options = dict(bind='127.0.0.1:8000', workers=0, threads=1, asgi=False, preload=True,
+                graceful_timeout=30, max_requests=0)
+
+
+def test_default_workers():
+    assert default_workers() == len(os.sched_getaffinity(0))
+
+
+@parametrize('workers', [0, 1, 5])
+def test_gunicorn_workers(workers):
+    options = gunicorn_options(**dict(_options, workers=workers))
+    assert options['workers'] == (workers or default_workers())
+
+
+@parametrize('asgi, threads, worker_class', [
+    (False, 1, None), (False, 4, 'gthread'), (True, 1, 'uvicorn.workers.UvicornWorker')
+])
+def test_gunicorn_worker_class(asgi, threads, worker_class):
+    options = gunicorn_options(**dict(_options, asgi=asgi, threads=threads))
+    assert options.get('worker_class') == worker_class
+
+
+@parametrize('preload', [True, False])
+def test_gunicorn_preload(preload):
+    assert gunicorn_options(**dict(_options, preload=preload))['preload_app'] is preload
+
+
+def test_gunicorn_max_requests():
+    options = gunicorn_options(**dict(_options, max_requests=1000, verbosity=1))
+    assert options['max_requests'] == 1000
+    assert options['max_requests_jitter'] == 100
+
+
+@pytest.fixture
+def served(monkeypatch):
+    """Run ``serve`` up to loading the app, return the view module of a URL."""
+    monkeypatch.setattr(settings, 'ASYNC_VIEWS', False)
+    monkeypatch.delenv('ASYNC_VIEWS', raising=False)
+    # The URLconf was imported with the sync views, e.g. by the system checks
+    import_module(settings.ROOT_URLCONF)
+    served = []
+    monkeypatch.setattr(BaseApplication, 'run', lambda self: served.append(
+        (self.load(), get_resolver().resolve('/api/v1/changes/').func)))
+    yield served
+    monkeypatch.undo()
+    reload(sys.modules[settings.ROOT_URLCONF])
+    clear_url_caches()
+
+
+@parametrize('args, module', [([], views), (['--asgi'], async_views)])
+def test_serve_views(served, args, module):
+    call_command('serve', *args, stdout=StringIO())
+    (_, view), = served
+    assert view is module.changes
+
+
+@parametrize('args, warned', [([], True), (['--threads', '4'], False), (['--asgi'], False)])
+def test_serve_sync_worker_warning(served, args, warned):
+    stderr = StringIO()
+    call_command('serve', *args, stdout=StringIO(), stderr=stderr)
+    assert ('sync worker' in stderr.getvalue()) is warned
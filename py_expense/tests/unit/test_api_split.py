@@ -0,0 +1,210 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from datetime import timedelta
+from json import loads
+
+import pytest
+from django.utils import timezone
+
+from api.archive import archive_expenses, cutoff
+from api.export import export, export_queryset
+from api.merge import merge_users
+from api.models import (EQUAL, RATIO, ArchivedExpense, ArchivedExpenseParticipant,
+                        ArchiveSummary, Expense, ExpenseParticipant, ExpenseRatio, Share, User,
+                        is_equal_split, participates)
+from api.multiget import get_objects, object_cache
+from api.readers import ExpenseReader, UserReader
+from api.search import scope
+from api.serializers import ExpenseSerializer, UserSerializer
+from api.summary import compute_summary
+from tests.utils import parametrize
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    object_cache().clear()
+    yield
+    object_cache().clear()
+
+
+@pytest.fixture
+def share_users():
+    users = [User.objects.create(name=name) for name in ('alice', 'bob', 'carol')]
+    share = Share.objects.create(name='trip', description='')
+    share.users.add(*users)
+    return share, users
+
+
+def _participants(expense, model=ExpenseParticipant):
+    return set(model.objects.filter(expense_id=expense.id).values_list('user_id', flat=True))
+
+
+def _create(share, users, paid_for):
+    serializer = ExpenseSerializer(data={
+        'description': 'dinner', 'share': share.id, 'total': 30, 'paid_by': users[0].id,
+        'paid_for': {str(user.id): ratio for user, ratio in zip(users, paid_for)},
+    })
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+@parametrize('ratios, expected', [([(1, 3)] * 3, True), ([(1, 1)], True),
+                                  ([(1, 2), (2, 4)], False), ([(1, 3), (2, 3)], False),
+                                  ([], False)])
+def test_is_equal_split(ratios, expected):
+    assert is_equal_split(ratios) is expected
+
+
+def test_participates(share_users):
+    share, users = share_users
+    expense = _create(share, users[1:], ['1/2'] * 2)
+    query = Expense.objects.filter(participates([users[2].id]))
+    # Looked up through the participant table, not by pattern
+    assert 'LIKE' not in str(query.query)
+    assert list(query) == [expense]
+    assert not Expense.objects.filter(participates([users[0].id])).exists()
+
+
+def test_create_equal(share_users):
+    share, users = share_users
+    expense = _create(share, users, ['1/3'] * 3)
+    assert (expense.split, _participants(expense)) == (EQUAL, {u.id for u in users})
+    assert not ExpenseRatio.objects.exists()
+    data = ExpenseSerializer(expense).data
+    assert data['paid_for'] == {user.id: '1/3' for user in users}
+    assert {r.expense_id: (r.numerator, r.denominator) for r in users[1].paid_for} == \
+        {expense.id: (1, 3)}
+
+
+def test_create_ratios(share_users):
+    share, users = share_users
+    expense = _create(share, users[:2], ['1/3', '2/3'])
+    assert (expense.split, _participants(expense)) == (RATIO, set())
+    assert ExpenseRatio.objects.filter(expense=expense).count() == 2
+
+
+def test_update_split(share_users):
+    share, users = share_users
+    expense = _create(share, users, ['1/3'] * 3)
+    ExpenseSerializer().update(expense, {'paid_for': {users[0]: (1, 3), users[1]: (2, 3)}})
+    expense.refresh_from_db()
+    assert (expense.split, expense.ratios()) == (RATIO, {users[0].id: (1, 3),
+                                                         users[1].id: (2, 3)})
+    ExpenseSerializer().update(expense, {'paid_for': {users[1]: (1, 2), users[2]: (1, 2)}})
+    expense.refresh_from_db()
+    assert (expense.split, expense.ratios()) == (EQUAL, {users[1].id: (1, 2),
+                                                         users[2].id: (1, 2)})
+    assert not ExpenseRatio.objects.exists()
+    assert _participants(expense) == {users[1].id, users[2].id}
+
+
+def test_update_same_split(share_users, django_assert_num_queries):
+    share, users = share_users
+    expense = _create(share, users, ['1/3'] * 3)
+    updated_at = expense.updated_at
+    # Participants are prefetched like in the views
+    expense = Expense.objects.prefetch_related('expenseparticipant_set').get(id=expense.id)
+    with django_assert_num_queries(0):
+        ExpenseSerializer().update(expense, {'paid_for': {user: (1, 3) for user in users}})
+    assert Expense.objects.get(id=expense.id).updated_at == updated_at
+    # A new split is read back, not the prefetched one
+    ExpenseSerializer().update(expense, {'paid_for': {users[0]: (1, 2), users[1]: (1, 2)}})
+    assert expense.ratios() == {users[0].id: (1, 2), users[1].id: (1, 2)}
+
+
+def test_readers(share_users, django_assert_num_queries):
+    share, users = share_users
+    _create(share, users, ['1/3'] * 3)
+    _create(share, users[:2], ['1/3', '2/3'])
+    _create(share, users[1:], ['1/2'] * 2)
+    expenses = Expense.objects.order_by('id')
+    # The expenses, and their ratios and equal splits with one query
+    with django_assert_num_queries(2):
+        rows = ExpenseReader().serialize(expenses)
+    assert rows == ExpenseSerializer(expenses, many=True).data
+    users_qs = User.objects.order_by('id')
+    assert UserReader().serialize(users_qs) == UserSerializer(users_qs, many=True).data
+
+
+def test_cache_invalidated(share_users, django_capture_on_commit_callbacks):
+    share, users = share_users
+    expense = _create(share, users[:2], ['1/3', '2/3'])
+    get_objects('users', [users[2].id])
+    with django_capture_on_commit_callbacks(execute=True):
+        expense.split_equally(users)
+    user, = get_objects('users', [users[2].id])
+    assert user['paid_for'] == {expense.id: '1/3'}
+    exp, = get_objects('expenses', [expense.id])
+    assert exp['paid_for'] == {user.id: '1/3' for user in users}
+
+
+def test_summary(share_users):
+    share, users = share_users
+    _create(share, users, ['1/3'] * 3)
+    _create(share, users[:2], ['1/3', '2/3'])
+    owed = {m['user']: m['owed'] for m in compute_summary(share.id)['members']}
+    assert owed == {users[0].id: 20.0, users[1].id: 30.0, users[2].id: 10.0}
+
+
+def test_scope(share_users):
+    share, users = share_users
+    expense = _create(share, users[1:], ['1/2'] * 2)
+    outsider = User.objects.create(name='dave')
+    assert list(scope('expense', user_id=users[2].id)) == [expense]
+    assert not scope('expense', user_id=outsider.id).exists()
+
+
+def test_archive_and_export(share_users):
+    share, users = share_users
+    expense = _create(share, users, ['1/3'] * 3)
+    Expense.objects.update(resolved=True, updated_at=timezone.now() - timedelta(days=100))
+    assert archive_expenses(cutoff(30)) == 1
+    archived = ArchivedExpense.objects.get(id=expense.id)
+    assert (archived.split, _participants(archived, ArchivedExpenseParticipant)) == \
+        (EQUAL, {user.id for user in users})
+    assert not ExpenseParticipant.objects.exists()
+    owed = dict(ArchiveSummary.objects.values_list('user_id', 'owed'))
+    assert owed == {user.id: 10 for user in users}
+    row, = (loads(line) for line in b''.join(export(
+        Expense.objects.none(), 'ndjson', archived=export_queryset(
+            {'user': users[2].id}, archived=True))).decode().splitlines())
+    assert row['paid_for'] == {str(user.id): '1/3' for user in users}
+
+
+def test_merge_participant(share_users):
+    share, users = share_users
+    dave = User.objects.create(name='dave')
+    share.users.add(dave)
+    expense = _create(share, [users[0], dave], ['1/2'] * 2)
+    counts = merge_users(dave.id, users[1].id)
+    assert (counts['ratios'], counts['ratios_coalesced']) == (1, 0)
+    expense.refresh_from_db()
+    assert (expense.split, expense.ratios()) == (EQUAL, {users[0].id: (1, 2),
+                                                         users[1].id: (1, 2)})
+
+
+def test_merge_both_participants(share_users):
+    share, users = share_users
+    expense = _create(share, users, ['1/3'] * 3)
+    counts = merge_users(users[2].id, users[1].id)
+    assert (counts['ratios'], counts['ratios_coalesced']) == (0, 1)
+    expense.refresh_from_db()
+    assert (expense.split, _participants(expense)) == (RATIO, set())
+    assert expense.ratios() == {users[0].id: (1, 3), users[1].id: (2, 3)}
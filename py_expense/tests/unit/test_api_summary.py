@@ -0,0 +1,161 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from json import loads
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory
+from django.utils import timezone
+
+from api import async_views, views
+from api.archive import archive_expenses
+from api.models import Expense, Share, User
+from api.multiget import object_cache
+from api.serializers import ExpenseSerializer
+from api.summary import compute_summary, share_summary
+from tests.utils import parametrize
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    object_cache().clear()
+    yield
+    object_cache().clear()
+
+
+@pytest.fixture
+def share():
+    alice, bob, carol = (User.objects.create(name=name) for name in ('alice', 'bob', 'carol'))
+    share = Share.objects.create(name='trip', description='')
+    share.users.add(alice, bob)
+    Expense.new(share=share, paid_by=alice, description='a', total=30,
+                paid_for={alice: (1, 3), bob: (2, 3)})
+    # carol left the share, but still paid for something
+    Expense.new(share=share, paid_by=carol, description='b', total='4.5', paid_for={bob: (1, 1)})
+    other = Share.objects.create(name='other', description='')
+    Expense.new(share=other, paid_by=bob, description='c', total=100, paid_for={bob: (1, 1)})
+    return share, alice, bob, carol
+
+
+def _members(summary):
+    return [(m['user'], m['member'], m['paid'], m['owed'], m['net']) for m in summary['members']]
+
+
+def test_summary(share, django_assert_num_queries):
+    share, alice, bob, carol = share
+    with django_assert_num_queries(1):
+        summary = compute_summary(share.id)
+    assert summary['share'] == share.id
+    assert _members(summary) == [
+        (alice.id, True, 30.0, 10.0, 20.0),
+        (bob.id, True, 0.0, 24.5, -24.5),
+        (carol.id, False, 4.5, 0.0, 4.5),
+    ]
+
+
+def test_summary_empty():
+    share = Share.objects.create(name='empty', description='')
+    assert share_summary(share.id) == {'share': share.id, 'members': []}
+    assert share_summary(1000) is None
+
+
+def test_summary_archived(share):
+    share, alice, bob, carol = share
+    before = _members(compute_summary(share.id))
+    Expense.objects.filter(share=share, paid_by=alice).update(resolved=True)
+    archive_expenses(timezone.now())
+    assert _members(compute_summary(share.id)) == before
+
+
+def test_cached(share, django_assert_num_queries):
+    share, *_ = share
+    first = share_summary(share.id)
+    with django_assert_num_queries(0):
+        assert share_summary(share.id) == first
+
+
+@parametrize('change', [
+    lambda share, alice, bob, carol: Expense.new(
+        share=share, paid_by=bob, description='d', total=6, paid_for={alice: (1, 1)}),
+    lambda share, alice, bob, carol: ExpenseSerializer().update(
+        share.expense_set.get(description='a'), {'total': 60}),
+    lambda share, alice, bob, carol: ExpenseSerializer().update(
+        share.expense_set.get(description='a'), {'paid_for': {alice: (1, 1)}}),
+    lambda share, alice, bob, carol: share.expense_set.get(description='b').delete(),
+    lambda share, alice, bob, carol: share.users.remove(bob),
+    lambda share, alice, bob, carol: bob.share_set.clear(),
+    lambda share, alice, bob, carol: carol.share_set.add(share),
+])
+def test_invalidated(share, django_capture_on_commit_callbacks, change):
+    share, *users = share
+    share_summary(share.id)
+    with django_capture_on_commit_callbacks(execute=True):
+        change(share, *users)
+    assert share_summary(share.id) == compute_summary(share.id)
+
+
+def test_moved_expense(share, django_capture_on_commit_callbacks):
+    share, alice, *_ = share
+    other = Share.objects.get(name='other')
+    share_summary(share.id)
+    share_summary(other.id)
+    expense = Expense.objects.get(share=share, description='a')
+    with django_capture_on_commit_callbacks(execute=True):
+        ExpenseSerializer().update(expense, {'share': other})
+    for pk in (share.id, other.id):
+        assert share_summary(pk) == compute_summary(pk)
+
+
+def test_other_share_not_invalidated(share, django_capture_on_commit_callbacks,
+                                     django_assert_num_queries):
+    share, alice, *_ = share
+    share_summary(share.id)
+    other = Share.objects.get(name='other')
+    with django_capture_on_commit_callbacks(execute=True):
+        Expense.new(share=other, paid_by=alice, description='e', total=1,
+                    paid_for={alice: (1, 1)})
+    with django_assert_num_queries(0):
+        share_summary(share.id)
+
+
+def _call(module, **params):
+    request = RequestFactory().get('/', params)
+    if module is async_views:
+        res = async_to_sync(module.share_summary_view)(request)
+    else:
+        res = module.share_summary_view(request)
+    return res.status_code, loads(res.content)
+
+
+@parametrize('module', [views, async_views])
+@parametrize('key', ['id', 'name'])
+def test_view(share, module, key):
+    share, *_ = share
+    status, body = _call(module, **{key: getattr(share, key)})
+    assert status == 200
+    assert body == compute_summary(share.id)
+
+
+@parametrize('module', [views, async_views])
+@parametrize('params, status', [({}, 400), ({'id': 1000}, 404), ({'name': 'nope'}, 404)])
+def test_view_fail(module, params, status):
+    code, body = _call(module, **params)
+    assert code == status
+    assert body['success'] is False
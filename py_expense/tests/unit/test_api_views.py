@@ -0,0 +1,134 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from json import dumps, loads
+from urllib.parse import urlencode
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory
+
+from api import async_views, views
+from api.models import Share
+from tests.utils import parametrize, random_expenses, random_shares, random_users
+
+pytestmark = pytest.mark.django_db
+
+view_modules = parametrize('module', [views, async_views])
+
+
+def _call(view, request):
+    if view.__module__ == async_views.__name__:
+        res = async_to_sync(view)(request)
+    else:
+        res = view(request)
+    return res.status_code, loads(res.content)
+
+
+def _post(view, data, path='/', **params):
+    body = data if isinstance(data, str) else dumps(data)
+    request = RequestFactory().post(path, data=body, content_type='application/json',
+                                    QUERY_STRING=urlencode(params))
+    return _call(view, request)
+
+
+@view_modules
+def test_share_list(module):
+    random_expenses(3)
+    status, data = _call(module.share_list, RequestFactory().get('/', {'fields': 'id,total'}))
+    assert status == 200
+    assert [x['id'] for x in data] == sorted(s.id for s in Share.objects.all())
+    assert all(set(x) == {'id', 'total'} for x in data)
+
+
+@view_modules
+def test_share_list_bad_param(module):
+    status, data = _call(module.share_list, RequestFactory().get('/', {'id': 'a'}))
+    assert status == 400
+    assert data['success'] is False
+
+
+@view_modules
+def test_share_list_method(module):
+    status, data = _call(module.share_list, RequestFactory().post('/'))
+    assert status == 404
+
+
+@view_modules
+def test_share_create(module):
+    users = random_users(2)
+    status, data = _post(module.share_create, {
+        'name': 'foo', 'description': 'foo share', 'users': [u.id for u in users]
+    })
+    assert status == 200
+    assert data['success'] is True
+    assert data['reason'] is None
+    share = Share.objects.get(pk=data['id'])
+    assert data['created_at'] == int(share.created_at.timestamp())
+    assert share.name == 'foo'
+    assert set(share.users.all()) == set(users)
+
+
+@view_modules
+@parametrize('body', [
+    {'name': 'bar', 'description': ''},
+    {'description': 'no name'},
+    {'name': 'bar', 'description': 'x', 'users': [9999]},
+    {'name': 'bar', 'description': 'x', 'total': 1},
+    'not json',
+    '[1, 2]',
+])
+def test_share_create_fail(module, body):
+    status, data = _post(module.share_create, body)
+    assert status == 400
+    assert data['success'] is False
+    assert data['reason']
+    assert not Share.objects.exists()
+
+
+@view_modules
+@parametrize('by', ['id', 'name'])
+def test_share_update(module, by):
+    share, = random_shares(1)
+    user, = random_users(1)
+    status, data = _post(module.share_update, {'description': 'new', 'users': [user.id]},
+                         **{by: getattr(share, by)})
+    share.refresh_from_db()
+    assert status == 200
+    assert data == {'success': True, 'reason': None, 'id': share.id,
+                    'updated_at': int(share.updated_at.timestamp())}
+    assert share.description == 'new'
+    assert list(share.users.all()) == [user]
+
+
+@view_modules
+@parametrize('params, body, expected_status', [
+    ({}, {'name': 'x'}, 400),
+    ({'id': 9999}, {'name': 'x'}, 404),
+    ({'name': 'does not exist'}, {'name': 'x'}, 404),
+    ({'id': 'a'}, {'name': 'x'}, 400),
+    (None, {'name': ''}, 403),
+    (None, {'users': [9999]}, 403),
+    (None, 'not json', 400),
+])
+def test_share_update_fail(module, params, body, expected_status):
+    share, = random_shares(1)
+    status, data = _post(module.share_update, body,
+                         **({'id': share.id} if params is None else params))
+    assert status == expected_status
+    assert data['success'] is False
+    assert Share.objects.get(pk=share.id).name == share.name
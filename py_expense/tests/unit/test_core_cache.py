@@ -0,0 +1,102 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from unittest.mock import patch
+
+from core.cache import TTLCache, cache_stats
+from tests.utils import parametrize
+
+
+def test_get_set():
+    cache = TTLCache('test', 10, 60)
+    assert cache.get('a') is None
+    assert cache.get('a', 1) == 1
+    cache.set('a', 2)
+    assert cache.get('a') == 2
+    assert len(cache) == 1
+
+
+@parametrize('maxsize', [1, 3, 10])
+def test_lru_eviction(maxsize):
+    cache = TTLCache('test', maxsize, 60)
+    for i in range(maxsize):
+        cache.set(i, i)
+    cache.get(0)
+    cache.set('new', 'new')
+    assert len(cache) == maxsize
+    if maxsize > 1:
+        # 0 was used recently, so 1 is evicted
+        assert cache.get(0) == 0
+        assert cache.get(1) is None
+    else:
+        assert cache.get(0) is None
+    assert cache.get('new') == 'new'
+
+
+def test_ttl():
+    cache = TTLCache('test', 10, 60)
+    with patch('core.cache.monotonic', return_value=100):
+        cache.set('a', 1)
+    with patch('core.cache.monotonic', return_value=160):
+        assert cache.get('a') == 1
+    with patch('core.cache.monotonic', return_value=160.1):
+        assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_get_or_load():
+    cache = TTLCache('test', 10, 60)
+    calls = []
+
+    def load():
+        calls.append(1)
+        return 'val' if len(calls) > 1 else None
+
+    assert cache.get_or_load('a', load) is None
+    assert cache.get_or_load('a', load) == 'val'
+    assert cache.get_or_load('a', load) == 'val'
+    assert len(calls) == 2
+
+
+def test_invalidate_clear():
+    cache = TTLCache('test', 10, 60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.invalidate('a')
+    cache.invalidate('does not exist')
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    cache.clear()
+    assert len(cache) == 0
+    # Invalidations don't lose the stats
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+    cache.reset_stats()
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (0, 0)
+    assert cache.get('b') is None
+
+
+def test_stats():
+    cache = TTLCache('test_stats', 10, 60)
+    assert cache.stats() == {'size': 0, 'maxsize': 10, 'hits': 0, 'misses': 0, 'hit_rate': None}
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('a')
+    cache.get('b')
+    assert cache.stats() == {'size': 1, 'maxsize': 10, 'hits': 2, 'misses': 1,
+                             'hit_rate': 2 / 3}
+    assert cache_stats('test_stats') == {'test_stats': cache.stats()}
+    assert 'test_stats' in cache_stats()
@@ -18,11 +18,12 @@ from copy import deepcopy
 from json import loads
 from random import randint
 
+from asgiref.sync import async_to_sync
 from django.http import HttpRequest
 from hypothesis import given
 
 from core import func_name, method
-from tests.mocks import mock_view
+from tests.mocks import mock_async_view, mock_view
 from tests.strategies import non_empty_str, non_empty_str_iter
 from tests.utils import random_str
 
@@ -75,6 +76,23 @@ def test_method_multiple_fail(it):
     _assert_method_fail(wrong_method, it)
 
 
+@given(non_empty_str)
+def test_method_async(allowed):
+    request = HttpRequest()
+    request.method = allowed
+    wrapped = method(allowed=allowed)(mock_async_view)
+    assert async_to_sync(wrapped)(request) is request
+
+
+def test_method_async_fail():
+    request = HttpRequest()
+    request.method = 'POST'
+    wrapped = method(allowed='GET')(mock_async_view)
+    res = async_to_sync(wrapped)(request)
+    assert res.status_code == 404
+    assert loads(res.content)['success'] is False
+
+
 @given(non_empty_str)
 def test_func_name(name):
     wrapped = func_name(name)(mock_view)
@@ -0,0 +1,166 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+
+from api.models import Expense, Share, User
+from api.serializers import ExpenseSerializer, ShareSerializer, UserSerializer
+from api.validators import validate_users
+from core import Loader, LoaderMiddleware, get_loader, loader_scope
+from tests.utils import parametrize, random_expenses, random_shares, random_users
+
+pytestmark = pytest.mark.django_db
+
+
+def test_load(django_assert_num_queries):
+    users = random_users(3)
+    loader = Loader().queue(User, [users[1].id, str(users[2].id)])
+    with django_assert_num_queries(1):
+        assert loader.load(User, users[0].id) == users[0]
+        assert loader.load(User, users[1].id) == users[1]
+        assert loader.load(User, str(users[2].id)) == users[2]
+    assert loader.queries == 1
+
+
+def test_identity_map():
+    user, = random_users(1)
+    loader = Loader()
+    assert loader.load(User, user.id) is loader.load(User, str(user.id))
+    loader.forget(User)
+    assert loader.load(User, user.id) is not None
+    assert loader.queries == 2
+
+
+def test_missing_not_queried_again(django_assert_num_queries):
+    loader = Loader()
+    with django_assert_num_queries(1):
+        assert loader.load(User, 1000) is None
+        assert loader.load_many(User, [1000]) == {}
+
+
+def test_load_many(django_assert_num_queries):
+    users = random_users(3)
+    share, = random_shares(1)
+    loader = Loader().queue(Share, [share.id])
+    with django_assert_num_queries(2):
+        assert loader.load_many(User, [u.id for u in users] + [1000]) == \
+            {u.id: u for u in users}
+        assert loader.load(Share, share.id) == share
+
+
+def test_prime(django_assert_num_queries):
+    user, = random_users(1)
+    with django_assert_num_queries(0):
+        assert Loader().prime(user).load(User, user.id) is user
+
+
+@parametrize('pk', ['a', '1.5'])
+def test_invalid_key(pk):
+    with pytest.raises(ValidationError):
+        Loader().load(User, pk)
+
+
+def test_scope():
+    first = get_loader()
+    assert first is not get_loader()
+    with loader_scope() as loader:
+        assert get_loader() is loader
+        with loader_scope() as inner:
+            assert inner is loader
+    assert get_loader() is not loader
+
+
+@parametrize('asynchronous', [False, True])
+def test_middleware(asynchronous):
+    loaders = []
+
+    def view(request):
+        loaders.append(get_loader())
+        return HttpResponse()
+
+    async def async_view(request):
+        return view(request)
+
+    if asynchronous:
+        middleware = LoaderMiddleware(async_view)
+        call = async_to_sync(middleware)
+    else:
+        call = LoaderMiddleware(view)
+    call(None)
+    call(None)
+    assert loaders[0] is not loaders[1]
+
+
+def test_validate_users_one_query(django_assert_num_queries):
+    users = random_users(5)
+    with django_assert_num_queries(1):
+        assert validate_users([str(u.id) for u in reversed(users)]) == users
+
+
+def test_share_users_one_query(django_assert_num_queries):
+    users = random_users(20)
+    serializer = ShareSerializer(data={'name': 'a', 'description': 'b',
+                                       'users': [u.id for u in users]})
+    # Looked up once by the field and reused by ``validate_users``
+    with django_assert_num_queries(1):
+        assert serializer.is_valid(), serializer.errors
+    assert serializer.validated_data['users'] == users
+
+
+def test_list_validation_batched(django_assert_num_queries):
+    shares = random_shares(3)
+    users = random_users(6)
+    for i, share in enumerate(shares):
+        share.users.add(*users[i * 2:i * 2 + 2])
+    data = [{'description': str(i), 'share': shares[i % 3].id, 'total': i,
+             'paid_by': users[(i % 3) * 2].id, 'paid_for': {str(users[(i % 3) * 2].id): '1/1'}}
+            for i in range(30)]
+    serializer = ExpenseSerializer(data=data, many=True)
+    # One query per related model, and the membership checks
+    with django_assert_num_queries(2 + 30 * 2):
+        assert serializer.is_valid(), serializer.errors
+    assert [e['share'] for e in serializer.validated_data] == [shares[i % 3] for i in range(30)]
+
+
+def test_list_validation_errors():
+    share, = random_shares(1)
+    serializer = ExpenseSerializer(data=[{'description': 'a', 'share': share.id, 'total': 1,
+                                          'paid_by': 'abc', 'paid_for': {}}], many=True)
+    assert not serializer.is_valid()
+
+
+@parametrize('count', [1, 50, 200])
+@parametrize('serializer_cls, model, queries', [
+    # The expenses, their ratios and their participants
+    (ExpenseSerializer, Expense, 3),
+    (ShareSerializer, Share, 3),
+    # The users, their shares, expenses paid, ratios and participations
+    (UserSerializer, User, 5),
+])
+def test_list_representation_constant_queries(django_assert_num_queries, count,
+                                              serializer_cls, model, queries):
+    share, = random_shares(1)
+    expenses, _, users = random_expenses(count, share=share)
+    share.users.add(*users)
+    for expense in expenses:
+        expense.generate_ratio({users[0]: (1, 1)})
+    with django_assert_num_queries(queries):
+        data = serializer_cls(model.objects.all(), many=True).data
+    assert len(data) == model.objects.count()
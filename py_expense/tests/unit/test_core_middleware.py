@@ -0,0 +1,88 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from json import loads
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, RequestFactory, override_settings
+
+from api.models import Token
+from core.middleware import ApiFastPathMiddleware
+from tests.utils import parametrize, random_shares, random_users
+
+pytestmark = pytest.mark.django_db
+
+clients = parametrize('client_cls', [Client, AsyncClient])
+
+
+def _get(client_cls, path):
+    token = Token.new(random_users(1)[0])
+    headers = {'Authorization': f'Token {token.key}'}
+    if client_cls is AsyncClient:
+        return async_to_sync(AsyncClient().get)(path, headers=headers)
+    return Client().get(path, headers=headers)
+
+
+@clients
+def test_api_skips_browser_middleware(client_cls):
+    share, = random_shares(1)
+    res = _get(client_cls, '/api/v1/shares/list/?fields=id')
+    assert res.status_code == 200
+    assert loads(res.content) == [{'id': share.id}]
+    # Set by XFrameOptionsMiddleware, which is not in API_MIDDLEWARE
+    assert 'X-Frame-Options' not in res
+    assert not hasattr(res.wsgi_request if client_cls is Client else res.asgi_request, 'session')
+
+
+@clients
+def test_api_runs_api_middleware(client_cls):
+    # Set by SecurityMiddleware
+    assert _get(client_cls, '/api/v1/shares/list/')['X-Content-Type-Options'] == 'nosniff'
+
+
+@clients
+def test_non_api_full_stack(client_cls):
+    res = _get(client_cls, '/admin/login/')
+    assert res.status_code == 200
+    assert res['X-Frame-Options'] == 'DENY'
+
+
+@clients
+def test_api_not_found(client_cls):
+    assert _get(client_cls, '/api/v1/does/not/exist/').status_code == 404
+
+
+@clients
+def test_api_append_slash(client_cls):
+    # CommonMiddleware redirect
+    res = _get(client_cls, '/api/v1/shares/list')
+    assert res.status_code == 301
+    assert res['Location'] == '/api/v1/shares/list/'
+
+
+@override_settings(API_MIDDLEWARE=[])
+def test_dispatch_async_view():
+    async def view(request):
+        return HttpResponse(b'async')
+
+    middleware = ApiFastPathMiddleware(lambda request: HttpResponse(b'full'))
+    middleware.resolve = lambda request: (view, (), {})
+    request = RequestFactory().get('/api/v1/anything/')
+    assert middleware(request).content == b'async'
+    assert middleware(RequestFactory().get('/admin/')).content == b'full'
@@ -14,23 +14,31 @@
 #  You should have received a copy of the GNU Affero General Public License
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from datetime import datetime, timezone
 from json import loads
 from unittest.mock import MagicMock
 
 import hypothesis.strategies as st
 import pytest
+from asgiref.sync import async_to_sync
 from hypothesis import assume, given
 
 from core.parse import (
+    Lookup,
     ParamSpec,
     ParseError,
+    boolean,
+    comparison,
+    compile_lookups,
+    epoch,
     list_of_naturals,
     list_of_str,
     natural_number,
+    one_of,
     parse_parameters,
     uri_params
 )
-from tests.mocks import mock_view_params
+from tests.mocks import mock_async_view_params, mock_view_params
 from tests.strategies import natural_list, str_list
 from tests.utils import parametrize
 
@@ -38,13 +46,19 @@ all_specs = {
     'int': (int, '-1'),
     'natural': (natural_number, '0'),
     'natural_list': (list_of_naturals, '0,1,999,213, '),
-    'str_list': (list_of_str, 'asd,asd, ,uasdgi, asd,')
+    'str_list': (list_of_str, 'asd,asd, ,uasdgi, asd,'),
+    'bool': (boolean, 'False'),
+    'int_comparison': (comparison(int), 'gte:1,lt:5'),
+    'epoch_range': (comparison(epoch), '1500000000..1600000000'),
 }
 
 fail_specs = {
     'int': (int, '-1.'),
     'natural': (natural_number, '-1'),
     'natural_list': (list_of_naturals, '0,1,999,213, -1'),
+    'bool': (boolean, 'yes'),
+    'int_comparison': (comparison(int), 'ge:1'),
+    'epoch_range': (comparison(epoch), '..'),
 }
 
 
@@ -119,6 +133,79 @@ def test_str_list(s):
         assert list_of_str(s) == stripped.split(',')
 
 
+@parametrize('s, expected', [
+    ('true', True), ('True', True), ('1', True),
+    ('false', False), ('FALSE', False), ('0', False)
+])
+def test_boolean(s, expected):
+    assert boolean(s) is expected
+
+
+@given(st.text())
+def test_boolean_fail(s):
+    assume(s.strip().lower() not in ('true', 'false', '1', '0'))
+    with pytest.raises(ValueError):
+        boolean(s)
+
+
+@parametrize('s, expected', [('csv', 'csv'), (' ndjson ', 'ndjson')])
+def test_one_of(s, expected):
+    assert one_of(['csv', 'ndjson'])(s) == expected
+    assert one_of(['csv', 'ndjson']).__name__ == 'One of csv, ndjson'
+
+
+@parametrize('s', ['', 'json', 'CSV', 'csv,ndjson'])
+def test_one_of_fail(s):
+    with pytest.raises(ValueError):
+        one_of(['csv', 'ndjson'])(s)
+
+
+@given(st.integers(min_value=0, max_value=2 ** 32))
+def test_epoch(i):
+    assert epoch(str(i)) == datetime.fromtimestamp(i, tz=timezone.utc)
+
+
+@parametrize('s, expected', [
+    ('gte:100', [Lookup('gte', 100)]),
+    ('gt:1, lte:3,', [Lookup('gt', 1), Lookup('lte', 3)]),
+    ('eq:5', [Lookup('exact', 5)]),
+    ('5', [Lookup('exact', 5)]),
+    ('lt:-1', [Lookup('lt', -1)]),
+    ('1..10', [Lookup('range', (1, 10))]),
+    ('1..', [Lookup('gte', 1)]),
+    ('..10', [Lookup('lte', 10)]),
+    ('', None),
+    (' , ', None),
+])
+def test_comparison(s, expected):
+    assert comparison(int)(s) == expected
+
+
+@parametrize('s', ['ge:1', 'gte:a', 'gte:', '..', 'a..2', 'x', 'gt:5,gt:10', '1..,gte:2',
+                   '1,eq:2', '1..2,3..4'])
+def test_comparison_fail(s):
+    with pytest.raises(ValueError):
+        comparison(int)(s)
+
+
+def test_comparison_name():
+    assert comparison(int).__name__ == 'Comparison of int'
+    assert comparison(epoch).__name__ == 'Comparison of Unix Epoch'
+
+
+@parametrize('params, expected', [
+    ({}, {}),
+    ({'id': [1, 2]}, {'id__in': [1, 2]}),
+    ({'resolved': False}, {'resolved': False}),
+    ({'total': [Lookup('gte', 100), Lookup('lt', 200)]},
+     {'total__gte': 100, 'total__lt': 200}),
+    ({'total': [Lookup('range', (1, 2))], 'name': ['a']},
+     {'total__range': (1, 2), 'name__in': ['a']}),
+])
+def test_compile_lookups(params, expected):
+    assert compile_lookups(params) == expected
+
+
 @parametrize('specs', spec_list)
 @parametrize('params', param_list)
 @parametrize('add', [True, False])
@@ -171,3 +258,22 @@ def test_uri_params_fail(specs, params, fail, method):
     expected = f"Parameter '{fail_key}' must be type '{fail_type.__name__}'"
     actual = loads(res.content)
     assert actual == {'success': False, 'reason': expected}
+
+
+@parametrize('params', param_list)
+def test_uri_params_async(params):
+    specs = spec_list[0]
+    request = MagicMock()
+    request.GET = params
+    res = async_to_sync(uri_params(specs, 'GET')(mock_async_view_params))(request)
+    assert res == parse_parameters(specs, params)
+
+
+@parametrize('fail', list(fail_specs.items()))
+def test_uri_params_async_fail(fail):
+    specs, params, fail_key, fail_type = setup_param_fail(spec_list[0], param_list[0], fail)
+    request = MagicMock()
+    request.GET = params
+    res = async_to_sync(uri_params(specs, 'GET')(mock_async_view_params))(request)
+    expected = f"Parameter '{fail_key}' must be type '{fail_type.__name__}'"
+    assert loads(res.content) == {'success': False, 'reason': expected}
@@ -0,0 +1,117 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import asyncio
+import logging
+from threading import Thread
+
+import pytest
+
+from django.test import override_settings
+
+from core import LocalBroker, PostgresBroker, get_broker, pubsub
+
+
+def test_publish():
+    broker = LocalBroker()
+    first = broker.subscribe('a')
+    second = broker.subscribe('a')
+    other = broker.subscribe('b')
+    broker.publish('a', {'n': 1})
+    assert first.get(0) == second.get(0) == {'n': 1}
+    assert other.get(0) is None
+
+
+def test_unsubscribe():
+    broker = LocalBroker()
+    with broker.subscribe('a') as subscription:
+        assert broker.has_subscribers('a')
+    assert not broker.has_subscribers('a')
+    broker.publish('a', {'n': 1})
+    assert subscription.get(0) is None
+
+
+def test_order():
+    broker = LocalBroker()
+    subscription = broker.subscribe('a')
+    for i in range(10):
+        broker.publish('a', {'n': i})
+    assert [subscription.get(0)['n'] for _ in range(10)] == list(range(10))
+
+
+def test_async_subscription():
+    broker = LocalBroker()
+
+    async def main():
+        async with broker.subscribe('a', asynchronous=True) as subscription:
+            assert await subscription.get(0.01) is None
+            # Published from another thread
+            thread = Thread(target=broker.publish, args=('a', {'n': 1}))
+            thread.start()
+            message = await subscription.get(5)
+            thread.join()
+            return message
+
+    assert asyncio.run(main()) == {'n': 1}
+    assert not broker.has_subscribers('a')
+
+
+def test_get_broker():
+    get_broker.cache_clear()
+    try:
+        with override_settings(EVENT_BROKER={'BACKEND': 'core.LocalBroker'}):
+            assert isinstance(get_broker(), LocalBroker)
+            assert get_broker() is get_broker()
+    finally:
+        get_broker.cache_clear()
+
+
+class _Stop(BaseException):
+    pass
+
+
+def test_listener_backs_off(monkeypatch, caplog):
+    broker = PostgresBroker(reconnect_delay=1, max_reconnect_delay=4)
+    delays = []
+
+    def connect():
+        raise OSError('connection refused')
+
+    def sleep(delay):
+        delays.append(delay)
+        if len(delays) == 5:
+            raise _Stop
+
+    monkeypatch.setattr(broker, '_connect', connect)
+    monkeypatch.setattr(pubsub, 'sleep', sleep)
+    with caplog.at_level(logging.ERROR, logger=pubsub.__name__), pytest.raises(_Stop):
+        broker._listen()
+    assert delays == [1, 2, 4, 4, 4]
+    assert len(caplog.records) == 5
+    assert all(r.exc_info and isinstance(r.exc_info[1], OSError) for r in caplog.records)
+
+
+def test_bad_notification(caplog):
+    broker = PostgresBroker()
+    # Without starting the listener thread
+    subscription = LocalBroker.subscribe(broker, 'a')
+    with caplog.at_level(logging.ERROR, logger=pubsub.__name__):
+        broker._notify('not json')
+        broker._notify('{"channel": "a", "message": {"n": 1}}')
+    assert subscription.get(1) == {'n': 1}
+    record, = caplog.records
+    assert record.exc_info is not None
@@ -0,0 +1,112 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from json import loads
+from multiprocessing import get_context
+
+import pytest
+from django.core.cache import cache
+from django.test import Client, override_settings
+
+from api.models import Token
+from core import DjangoCacheBackend, SharedMemoryBackend
+from core.ratelimit import sliding_window
+from tests.utils import parametrize, random_users
+
+backends = parametrize('backend_cls', [SharedMemoryBackend, DjangoCacheBackend])
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+@parametrize('now, previous, current, expected', [
+    (100, 0, 0, 0),
+    (100, 0, 9, 0),
+    (100, 0, 10, 10),
+    (105, 0, 10, 5),
+    # Half of the previous window still counts
+    (105, 10, 4, 0),
+    (105, 10, 5, 1e-3),
+    (105, 20, 0, 1e-3),
+    (102, 20, 0, 3),
+    (109, 20, 9, 0.5),
+])
+def test_sliding_window(now, previous, current, expected):
+    assert sliding_window(now, 10, 10, previous, current) == pytest.approx(expected)
+
+
+@backends
+def test_limit(backend_cls):
+    backend = backend_cls(3, 10)
+    assert [backend.hit('a', 1000) for _ in range(3)] == [0, 0, 0]
+    assert backend.hit('a', 1002) == 8
+    assert backend.hit('b', 1002) == 0
+    # Rejected requests are not counted, 3 * 0.5 + 1 < 3
+    assert backend.hit('a', 1015) == 0
+    assert backend.hit('a', 1015) == 0
+    assert backend.hit('a', 1015) == pytest.approx(10 / 6)
+    assert backend.hit('a', 1030) == 0
+
+
+@backends
+def test_skipped_window(backend_cls):
+    backend = backend_cls(1, 10)
+    assert backend.hit('a', 1000) == 0
+    assert backend.hit('a', 1025) == 0
+
+
+def _hit(backend, key, now):
+    backend.hit(key, now)
+
+
+def test_shared_memory_across_processes():
+    backend = SharedMemoryBackend(2, 10)
+    context = get_context('fork')
+    for _ in range(2):
+        process = context.Process(target=_hit, args=(backend, 'a', 1000))
+        process.start()
+        process.join()
+    assert backend.hit('a', 1000) == 10
+
+
+@pytest.mark.django_db
+@override_settings(RATE_LIMIT={'BACKEND': 'core.SharedMemoryBackend', 'LIMIT': 2,
+                               'PERIOD': 60})
+def test_middleware():
+    client = Client()
+    path = '/api/v1/does/not/exist/'
+    assert client.get(path).status_code == 401
+    assert client.get(path).status_code == 401
+    res = client.get(path)
+    assert res.status_code == 429
+    assert 1 <= int(res['Retry-After']) <= 60
+    assert loads(res.content) == {'success': False, 'reason': 'Too many requests.'}
+    # Made up tokens don't get a limit of their own
+    for key in 'ab':
+        assert client.get(path, headers={'Authorization': f'Token {key}'}).status_code == 429
+    # Valid tokens are keyed by their user
+    user = random_users(1)[0]
+    tokens = [Token.new(user), Token.new(user)]
+    for token in tokens:
+        res = client.get(path, headers={'Authorization': f'Token {token.key}'})
+        assert res.status_code == 404
+    res = client.get(path, headers={'Authorization': f'Token {tokens[0].key}'})
+    assert res.status_code == 429
+    # Only the API is rate limited
+    assert client.get('/admin/login/').status_code == 200
@@ -0,0 +1,110 @@
+#  PyExpense, Django powered webapp to track shared expenses.
+#  Copyright (C) 2017 Peijun Ma
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+from decimal import Decimal
+from importlib.util import find_spec
+from json import loads
+
+import hypothesis.strategies as st
+import pytest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import override_settings
+from hypothesis import given
+
+from core.render import FastJsonResponse, dumps, get_backend, register_backend, sse_event
+from tests.utils import parametrize
+
+# orjson is optional, its tests are skipped if it's not installed
+has_orjson = find_spec('orjson') is not None
+needs_orjson = pytest.mark.skipif(not has_orjson, reason='orjson is not installed')
+backends = parametrize('backend', ['stdlib', pytest.param('orjson', marks=needs_orjson)])
+
+json_values = st.recursive(
+    st.none() | st.booleans() | st.integers(-2 ** 63, 2 ** 63 - 1) |
+    st.floats(allow_nan=False, allow_infinity=False) | st.text(alphabet=st.characters(
+        blacklist_categories=('Cs',))),
+    lambda children: st.lists(children) | st.dictionaries(st.text(max_size=5), children),
+    max_leaves=20
+)
+
+
+@backends
+def test_dumps_share_shaped(backend):
+    data = [OrderedDict([
+        ('id', 1), ('name', 'é'), ('users', [1, 2]), ('total', 1.5), ('balance', {}),
+        ('paid_for', {3: '1/2', 4: '1/2'}), ('resolved', False), ('created_at', None)
+    ])]
+    assert loads(dumps(data, backend)) == [{
+        'id': 1, 'name': 'é', 'users': [1, 2], 'total': 1.5, 'balance': {},
+        'paid_for': {'3': '1/2', '4': '1/2'}, 'resolved': False, 'created_at': None
+    }]
+
+
+@backends
+def test_dumps_django_types(backend):
+    time = datetime(2017, 12, 1, 1, 2, 3, 456789, tzinfo=timezone.utc)
+    encoder = DjangoJSONEncoder()
+    assert loads(dumps({'t': time, 'd': Decimal('1.10')}, backend)) == {
+        't': encoder.default(time), 'd': encoder.default(Decimal('1.10'))
+    }
+
+
+@needs_orjson
+@given(json_values)
+def test_backends_equivalent(value):
+    assert loads(dumps(value, 'stdlib')) == loads(dumps(value, 'orjson'))
+
+
+@needs_orjson
+def test_backends_identical():
+    data = [{'id': i, 'name': f'share {i}\x0b', 'users': [i, i + 1], 'total': i / 3,
+             'paid_for': {i: '1/1'}} for i in range(100)]
+    assert dumps(data, 'stdlib') == dumps(data, 'orjson')
+
+
+def test_get_backend_auto():
+    assert get_backend('auto') is get_backend('orjson' if has_orjson else 'stdlib')
+    with override_settings(JSON_BACKEND='stdlib'):
+        assert get_backend() is get_backend('stdlib')
+
+
+def test_get_backend_unknown():
+    with pytest.raises(ValueError):
+        get_backend('does not exist')
+
+
+def test_register_backend():
+    register_backend('test', lambda obj: b'test')
+    assert dumps({}, 'test') == b'test'
+
+
+@backends
+def test_fast_json_response(backend):
+    res = FastJsonResponse([1, {'a': None}], backend=backend, status=201)
+    assert res.status_code == 201
+    assert res['Content-Type'] == 'application/json'
+    assert loads(res.content) == [1, {'a': None}]
+
+
+@parametrize('event, expected', [
+    (None, b'data: {"a":[1,"\\n"]}\n\n'),
+    ('expense.created', b'event: expense.created\ndata: {"a":[1,"\\n"]}\n\n'),
+])
+def test_sse_event(event, expected):
+    assert sse_event({'a': [1, '\n']}, event) == expected
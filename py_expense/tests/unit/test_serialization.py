@@ -30,6 +30,7 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import JSONParser
 from rest_framework.renderers import JSONRenderer
 
+from api.models import Share, User
 from api.serializers import ExpenseSerializer, ShareSerializer, UserSerializer
 from core.constants import STRING_SIZE as SS
 from tests.utils import (decorators, flatten, parametrize, rand_time, random_expenses,
@@ -54,9 +55,10 @@ def _convert_time(obj, key):
         return int(ts)
 
 
-def _convert_queryset(key, val):
-    if key == 'paid_for' and isinstance(val, QuerySet):
-        return {x.user.id: f'{x.numerator}/{x.denominator}' for x in val}
+def _convert_queryset(key, val, ratio_key='user_id'):
+    # ``paid_for`` is a list of unsaved ratios for equal splits
+    if key == 'paid_for' and isinstance(val, (QuerySet, list)):
+        return {getattr(x, ratio_key): f'{x.numerator}/{x.denominator}' for x in val}
     if hasattr(val, 'pk'):
         return val.pk
     if isinstance(val, QuerySet):
@@ -67,9 +69,11 @@ def _convert_queryset(key, val):
 
 
 def _assert_serialize(serializer, obj):
+    ratio_key = 'expense_id' if isinstance(obj, User) else 'user_id'
     obj_data = {key: _convert_time(obj, key) for key in serializer.__class__.Meta.fields}
-    serializer_data = {key: _convert_queryset(key, val) for key, val in serializer.data.items()}
-    obj_data = {key: _convert_queryset(key, val) for key, val in obj_data.items()}
+    serializer_data = {key: _convert_queryset(key, val, ratio_key)
+                       for key, val in serializer.data.items()}
+    obj_data = {key: _convert_queryset(key, val, ratio_key) for key, val in obj_data.items()}
     for key, val in obj_data.items():
         if isinstance(val, float):
             assert abs(val - serializer_data[key]) < 0.000000001
@@ -235,3 +239,45 @@ def test_deserialize_expense_fail_bad_paid_by(cond):
     with pytest.raises(ValidationError) as e:
         serializer.is_valid(True)
     assert e.value.args[0]['paid_by']
+
+
+@parametrize('SerializerCls, random_func', [
+    (UserSerializer, random_users), (ShareSerializer, random_shares),
+    (ExpenseSerializer, lambda amt: random_expenses(amt)[0])
+])
+@parametrize('fields', [['id'], ['id', 'name'], ['created_at', 'total', 'paid_for']])
+def test_serialize_sparse_fields(SerializerCls, random_func, fields):
+    obj, = random_func(1)
+    fields = [f for f in fields if f in SerializerCls.Meta.fields]
+    data = SerializerCls(obj, fields=fields).data
+    assert list(data) == [f for f in SerializerCls.Meta.fields if f in fields]
+
+
+@parametrize('SerializerCls, ModelCls', [
+    (UserSerializer, User), (ShareSerializer, Share),
+])
+def test_serialize_sparse_fields_matches_full(SerializerCls, ModelCls):
+    random_expenses(3)
+    full = SerializerCls(ModelCls.objects.all(), many=True).data
+    queryset = SerializerCls.setup_queryset(ModelCls.objects.all())
+    prepared = SerializerCls(queryset, many=True).data
+    for expected, actual in zip(full, prepared):
+        expected, actual = dict(expected), dict(actual)
+        if 'total' in expected:
+            assert expected.pop('total') == pytest.approx(actual.pop('total'))
+        assert expected == actual
+
+
+@parametrize('fields, queries', [
+    (['id', 'name'], 1),
+    (['id', 'name', 'total'], 1),
+    (['id', 'expenses'], 2),
+    (None, 3),
+])
+def test_share_setup_queryset_queries(django_assert_num_queries, fields, queries):
+    for share in random_shares(5):
+        random_expenses(3, share=share)
+    queryset = ShareSerializer.setup_queryset(Share.objects.all(), fields)
+    with django_assert_num_queries(queries):
+        data = ShareSerializer(queryset, many=True, fields=fields).data
+    assert len(data) == Share.objects.count()
@@ -33,7 +33,10 @@ from tests.utils import parametrize, rand_time, random_expenses, random_shares,
 pytestmark = pytest.mark.django_db
 
 
-def assert_update_time(orig_update_time, instance, auto=True):
+def assert_update_time(orig_update_time, instance, auto=True, changed=True):
+    if not changed:
+        assert instance.updated_at == orig_update_time
+        return
     assert instance.updated_at > orig_update_time
     if auto:
         assert instance.updated_at > instance.created_at
@@ -50,8 +53,8 @@ def assert_creation_time(instance, auto=True):
 def assert_expense_items(validated_data, expense):
     for key, val in validated_data.items():
         if key == 'paid_for':
-            ratios = expense.paid_for
-            assert ratios.count() == len(val)
+            ratios = list(expense.paid_for)
+            assert len(ratios) == len(val)
             assert {ratio.user: (ratio.numerator, ratio.denominator)
                     for ratio in ratios} == val
         else:
@@ -112,7 +115,7 @@ def test_update_share(orig_user_count, new_name, new_des, new_users_count):
         user_out = orig_user_list[user_diff:]
 
     serializer.update(share, validated_data)
-    assert_update_time(updated_at, share)
+    assert_update_time(updated_at, share, changed=new_name or new_des or user_diff != 0)
 
     new_name = validated_data.get('name', share.name)
     assert new_name == share.name
@@ -235,5 +238,37 @@ def test_update_expense(description, share, total, paid_by, paid_for,
     serializer = ExpenseSerializer()
     serializer.update(expense, validated_data)
 
-    assert_update_time(orig_uptate_time, expense, False)
+    changed = description or share or total or paid_by or paid_for or resolved
+    assert_update_time(orig_uptate_time, expense, False, changed=changed)
     assert_expense_items(validated_data, expense)
+
+
+def test_update_unchanged_not_saved(django_assert_num_queries):
+    (expense,), (share,), (user,) = random_expenses(1)
+    share.users.add(user)
+    updated_at = expense.updated_at
+    validated_data = {'description': expense.description, 'share': share, 'total': expense.total,
+                      'paid_by': user, 'paid_for': {user: (1, 1)}, 'resolved': False}
+    # Only the ratios are read
+    with django_assert_num_queries(1):
+        ExpenseSerializer().update(expense, validated_data)
+    expense.refresh_from_db()
+    assert expense.updated_at == updated_at
+    share.refresh_from_db()
+    updated_at = share.updated_at
+    # Only the members are read
+    with django_assert_num_queries(1):
+        ShareSerializer().update(share, {'name': share.name, 'users': [user]})
+    share.refresh_from_db()
+    assert share.updated_at == updated_at
+
+
+def test_update_only_changed_fields(django_assert_num_queries):
+    (expense,), _, _ = random_expenses(1)
+    description = expense.description
+    with django_assert_num_queries(1) as captured:
+        ExpenseSerializer().update(expense, {'description': description, 'resolved': True})
+    sql = captured[0]['sql']
+    assert sql.startswith('UPDATE')
+    assert '"resolved"' in sql and '"updated_at"' in sql
+    assert '"description"' not in sql and '"total"' not in sql
@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
 
 python3 py_expense/manage.py migrate
-python3 py_expense/manage.py runserver
+exec python3 py_expense/manage.py serve --bind "${BIND:-127.0.0.1:8000}"